@@ -24,6 +24,50 @@ try {
   // ignore JSON parse errors
 }
 
+// POST/PATCH carry an Idempotency-Key so a retried request is answered from the server's
+// stored response instead of running twice (e.g. deducting stock for a sale again). Endpoints
+// whose responses hold tokens or passwords are left out; the server never stores those.
+const UNKEYED_PATHS = ['auth/login/', 'auth/register/', 'users/onboard/'];
+// how often a retry waits out a 409 for an original request that is still running
+const IN_FLIGHT_RETRIES = 5;
+
+api.interceptors.request.use((config) => {
+  const method = (config.method || 'get').toLowerCase();
+  const path = (config.url || '').replace(/^\//, '');
+  if ((method === 'post' || method === 'patch') && !config.headers['Idempotency-Key']
+      && !UNKEYED_PATHS.some((unkeyed) => path.startsWith(unkeyed))) {
+    config.headers['Idempotency-Key'] = crypto.randomUUID();
+  }
+  return config;
+});
+
+// Only keyed requests are retried: the key makes a POST/PATCH safe to send twice. A retry that
+// never got a response is sent once more; one that finds the original still running (409 with
+// Retry-After) waits and asks again until the stored response is ready.
+api.interceptors.response.use(undefined, async (error) => {
+  const config = error?.config;
+  if (!config || !config.headers?.['Idempotency-Key']) {
+    return Promise.reject(error);
+  }
+  if (!error.response && !config._retried) {
+    config._retried = true;
+    return api.request(config);
+  }
+  const retryAfter = Number(error.response?.headers?.['retry-after']);
+  if (error.response?.status === 409 && retryAfter && (config._inFlightRetries || 0) < IN_FLIGHT_RETRIES) {
+    config._inFlightRetries = (config._inFlightRetries || 0) + 1;
+    await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+    return api.request(config);
+  }
+  return Promise.reject(error);
+});
+
+// Makes an update conditional on the version the record was read at; the server answers 412
+// if someone else has changed it since
+export function ifMatch(version?: number | null) {
+  return version == null ? undefined : { headers: { 'If-Match': `"${version}"` } };
+}
+
 export function setAuthToken(token: string | null) {
   if (token) {
     api.defaults.headers.common['Authorization'] = `Token ${token}`;
@@ -1,4 +1,4 @@
-import api from './apiClient';
+import api, { ifMatch } from './apiClient';
 
 export interface Appointment {
   id: number;
@@ -10,6 +10,7 @@ export interface Appointment {
   status: 'scheduled' | 'completed' | 'canceled';
   // payment status for appointment
   payment_status?: 'paid' | 'not_paid';
+  version?: number;
 }
 
 // Fetch all appointments (Read)
@@ -32,7 +33,7 @@ export async function createAppointment(appointment: Omit<Appointment, 'id'>): P
 // Update an existing appointment (Update)
 export async function updateAppointment(id: number, appointment: Partial<Omit<Appointment, 'id'>>): Promise<Appointment> {
   // Use PATCH for partial updates (backend ModelViewSet expects full object for PUT)
-  const response = await api.patch<Appointment>(`appointments/${id}/`, appointment);
+  const response = await api.patch<Appointment>(`appointments/${id}/`, appointment, ifMatch(appointment.version));
   return response.data;
 }
 
@@ -0,0 +1,68 @@
+import api from './apiClient';
+
+// The server's MULTI_GET_MAX_IDS; longer lists are split into several requests
+const MAX_IDS_PER_REQUEST = 200;
+
+export interface BatchResult<T> {
+  results: Record<string, T>;
+  missing: number[];
+}
+
+// Fetch many records of one resource by id: GET <resource>/batch/?ids=1,2,3 (one query server-side).
+// `params` go along with every request, e.g. { expand: 'all' } for fields list pages leave out.
+export async function fetchByIds<T>(
+  resource: string,
+  ids: Array<number | string>,
+  params: Record<string, string> = {},
+): Promise<BatchResult<T>> {
+  const unique = Array.from(new Set(ids.map((id) => String(id)).filter((id) => id !== '')));
+  const merged: BatchResult<T> = { results: {}, missing: [] };
+  for (let i = 0; i < unique.length; i += MAX_IDS_PER_REQUEST) {
+    const chunk = unique.slice(i, i + MAX_IDS_PER_REQUEST);
+    const response = await api.get<BatchResult<T>>(`${resource}/batch/`, { params: { ...params, ids: chunk.join(',') } });
+    Object.assign(merged.results, response.data.results);
+    merged.missing.push(...response.data.missing);
+  }
+  return merged;
+}
+
+// Resolves single ids (e.g. the patient or doctor of each row in a list) by collecting every
+// lookup made in the same tick into one batch request; results are remembered for the session.
+export function createBatchLoader<T>(resource: string) {
+  const memo = new Map<string, Promise<T | null>>();
+  let pending = new Map<string, { resolve: (value: T | null) => void; reject: (error: unknown) => void }>();
+
+  async function flush() {
+    const waiting = pending;
+    pending = new Map();
+    try {
+      const { results } = await fetchByIds<T>(resource, Array.from(waiting.keys()));
+      waiting.forEach((callbacks, id) => callbacks.resolve(results[id] ?? null));
+    } catch (error) {
+      // forget failed lookups so the next call retries them
+      waiting.forEach((callbacks, id) => {
+        memo.delete(id);
+        callbacks.reject(error);
+      });
+    }
+  }
+
+  function load(id: number | string): Promise<T | null> {
+    const key = String(id);
+    const known = memo.get(key);
+    if (known) return known;
+    const promise = new Promise<T | null>((resolve, reject) => {
+      if (pending.size === 0) queueMicrotask(flush);
+      pending.set(key, { resolve, reject });
+    });
+    memo.set(key, promise);
+    return promise;
+  }
+
+  return {
+    load,
+    loadMany: (ids: Array<number | string>) => Promise.all(ids.map(load)),
+    // drop remembered records, e.g. after an edit
+    clear: (id?: number | string) => (id === undefined ? memo.clear() : memo.delete(String(id))),
+  };
+}
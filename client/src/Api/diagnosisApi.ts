@@ -24,9 +24,13 @@ export interface Diagnosis {
   created_at: string;
 }
 
+// The large text fields the diagnoses table shows; treatment_plan is left out of list pages and
+// loaded with fetchDiagnosisById (or fetchByIds with expand) when a diagnosis is opened
+export const DIAGNOSIS_LIST_FIELDS = 'diagnosis,symptoms,additional_notes';
+
 // Fetch all diagnoses (Read)
 export async function fetchDiagnoses(): Promise<Diagnosis[]> {
-  const response = await api.get<any>(`diagnoses/`);
+  const response = await api.get<any>(`diagnoses/`, { params: { expand: DIAGNOSIS_LIST_FIELDS } });
   if (response && response.data) {
     const d = response.data;
     if (Array.isArray(d)) return d as Diagnosis[];
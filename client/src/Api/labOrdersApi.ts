@@ -1,4 +1,4 @@
-import api from './apiClient';
+import api, { ifMatch } from './apiClient';
 
 export interface LabOrder {
 	id: number;
@@ -9,6 +9,7 @@ export interface LabOrder {
 	tests: string[];
 	status: string;
 	created_at: string;
+	version?: number;
 }
 
 // Fetch all lab orders (Read)
@@ -31,7 +32,7 @@ export async function createLabOrder(labOrder: Omit<LabOrder, 'id' | 'created_at
 // Update an existing lab order (Update)
 export async function updateLabOrder(id: number, labOrder: Partial<Omit<LabOrder, 'id' | 'created_at' | 'patient_name' | 'doctor_name'>>): Promise<LabOrder> {
 	// Only use backend-provided 'id' for updates
-	const response = await api.put<LabOrder>(`lab-orders/${id}/`, labOrder);
+	const response = await api.put<LabOrder>(`lab-orders/${id}/`, labOrder, ifMatch(labOrder.version));
 	return response.data;
 }
 
@@ -102,9 +102,10 @@ export interface LabResultCreatePayload {
   result?: string[];
 }
 
-// Fetch all lab results (Read)
-export async function fetchLabResults(): Promise<LabResult[]> {
-  const response = await api.get<LabResult[]>(`lab-results/`);
+// Fetch all lab results (Read). The result values are left out of list pages unless
+// `withResults` is set: only the laboratory results table shows them.
+export async function fetchLabResults({ withResults = false }: { withResults?: boolean } = {}): Promise<LabResult[]> {
+  const response = await api.get<LabResult[]>(`lab-results/`, withResults ? { params: { expand: 'result' } } : undefined);
   const data: any = response.data;
   if (Array.isArray(data)) return data;
   if (data && Array.isArray(data.results)) return data.results;
@@ -114,7 +115,7 @@ export async function fetchLabResults(): Promise<LabResult[]> {
 // Convenience function: fetch lab results and return only the simplified fields the UI needs.
 export async function fetchLabResultsSummary(): Promise<SimplifiedLabResult[]> {
   // Reuse fetchLabResults which already normalizes paginated responses to arrays
-  const list = await fetchLabResults();
+  const list = await fetchLabResults({ withResults: true });
   return list.map(simplifyLabResult);
 }
 
@@ -1,4 +1,5 @@
 import api from './apiClient';
+import { createBatchLoader } from './batchApi';
 
 export interface Medicine {
   id: number;
@@ -42,3 +43,6 @@ export async function fetchMedicineById(id: number): Promise<Medicine> {
   const response = await api.get<Medicine>(`medicines/${id}/`);
   return response.data;
 }
+
+// Resolve medicines by id in batches (e.g. a diagnosis' prescribed_medicines)
+export const medicineLoader = createBatchLoader<Medicine>('medicines');
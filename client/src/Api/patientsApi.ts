@@ -1,4 +1,5 @@
-import api from './apiClient';
+import api, { ifMatch } from './apiClient';
+import { createBatchLoader } from './batchApi';
 
 export interface Patient {
   id: number;
@@ -20,9 +21,11 @@ export interface Patient {
   updatedAt?: string;
   blood_type?: string | null;
   allergies?: string | null;
+  version?: number;
 }
 
-// Fetch all patients (Read)
+// Fetch all patients (Read). List pages leave medical_history out (null here); fetchPatientById
+// loads it when a patient is opened.
 export async function fetchPatients(): Promise<Patient[]> {
   const response = await api.get<any>(`patients/`);
   // DRF may return a paginated object { count, next, previous, results: [...] }
@@ -42,7 +45,7 @@ export async function createPatient(patient: Omit<Partial<Patient>, 'id' | 'crea
 
 // Update an existing patient (Update)
 export async function updatePatient(id: number, patient: Partial<Omit<Patient, 'id' | 'created_at'>>): Promise<Patient> {
-  const response = await api.patch<Patient>(`patients/${id}/`, patient);
+  const response = await api.patch<Patient>(`patients/${id}/`, patient, ifMatch(patient.version));
   return response.data;
 }
 
@@ -56,3 +59,6 @@ export async function fetchPatientById(id: number): Promise<Patient> {
   const response = await api.get<Patient>(`patients/${id}/`);
   return response.data;
 }
+
+// Resolve patients by id in batches (e.g. names for rows that only carry a patient id)
+export const patientLoader = createBatchLoader<Patient>('patients');
@@ -1,4 +1,5 @@
 import api from './apiClient';
+import { createBatchLoader } from './batchApi';
 
 export interface User {
   id: number;
@@ -48,6 +49,21 @@ export async function fetchUserById(id: number | string): Promise<User> {
   return response.data;
 }
 
+export interface OnboardedUser {
+  id: number;
+  email: string;
+  username: string;
+  role: string;
+  token: string;
+  temporary_password?: string;
+}
+
+// Create many staff accounts at once (admins only); rows without a password get a temporary one
+export async function onboardStaff(users: Array<Omit<RegisterPayload, 'password'> & { password?: string }>): Promise<OnboardedUser[]> {
+  const response = await api.post<{ created: OnboardedUser[] }>(`users/onboard/`, { users });
+  return response.data.created;
+}
+
 // Register / create a new user
 // NOTE: backend may return a user object or a message
 export async function registerUser(payload: RegisterPayload): Promise<User | any> {
@@ -91,3 +107,6 @@ export default {
   updateUser,
   deleteUser,
 };
+
+// Resolve users (e.g. doctors) by id in batches
+export const userLoader = createBatchLoader<User>('users');
@@ -4,7 +4,8 @@ import { Plus, Search, Edit, Download, User, Calendar, Stethoscope, Trash2 } fro
 import { useHospitalStore } from '../../store/hospitalStore';
 import { useAuthStore } from '../../store/authStore';
 import type { Diagnosis as ApiDiagnosis, PrescribedMedicine } from '../../Api/diagnosisApi';
-import { fetchDiagnoses, createDiagnosis, updateDiagnosis as apiUpdateDiagnosis, deleteDiagnosis } from '../../Api/diagnosisApi';
+import { fetchDiagnoses, fetchDiagnosisById, createDiagnosis, updateDiagnosis as apiUpdateDiagnosis, deleteDiagnosis } from '../../Api/diagnosisApi';
+import { fetchByIds } from '../../Api/batchApi';
 import { Card } from '../UI/Card';
 import { Button } from '../UI/Button';
 import { Input } from '../UI/Input';
@@ -101,8 +102,16 @@ export const Diagnoses: React.FC = () => {
 
   const doctors = staff.filter(s => roleIncludes(s, 'doctor'));
 
-  const handleOpenModal = (diagnosis?: ApiDiagnosis) => {
+  const handleOpenModal = async (diagnosis?: ApiDiagnosis) => {
     if (diagnosis) {
+      try {
+        // the list leaves treatment_plan out and the form saves it, so load the full record first
+        diagnosis = await fetchDiagnosisById(diagnosis.id);
+      } catch (err) {
+        console.error('Failed to load diagnosis', err);
+        alert('Failed to load diagnosis');
+        return;
+      }
       setEditingDiagnosis(diagnosis);
       setFormData({
         patient: String(diagnosis.patient),
@@ -242,8 +251,15 @@ export const Diagnoses: React.FC = () => {
     setFormData({ ...formData, medications: newMedications });
   };
 
-  const handleExport = (format: 'csv' | 'pdf') => {
-    const dataToExport = filteredDiagnoses.map(diagnosis => {
+  const handleExport = async (format: 'csv' | 'pdf') => {
+    let full: Record<string, ApiDiagnosis> = {};
+    try {
+      ({ results: full } = await fetchByIds<ApiDiagnosis>('diagnoses', filteredDiagnoses.map(d => d.id), { expand: 'all' }));
+    } catch (err) {
+      console.error('Failed to load treatment plans', err);
+    }
+    const dataToExport = filteredDiagnoses.map(row => {
+      const diagnosis = full[String(row.id)] ?? row;
       const patient = patients.find(p => String(p.id) === String(diagnosis.patient));
       const doctor = staff.find(s => String(s.id) === String(diagnosis.doctor));
 
@@ -263,7 +279,12 @@ export const Diagnoses: React.FC = () => {
   };
 
   // Export a single diagnosis as a printable PDF
-  const handleExportDiagnosis = (diagnosis: ApiDiagnosis) => {
+  const handleExportDiagnosis = async (diagnosis: ApiDiagnosis) => {
+    try {
+      diagnosis = await fetchDiagnosisById(diagnosis.id);
+    } catch (err) {
+      console.error('Failed to load diagnosis', err);
+    }
     const patient = patients.find(p => String(p.id) === String(diagnosis.patient));
     const doctor = staff.find(s => String(s.id) === String(diagnosis.doctor));
     const dataToExport = [
@@ -6,6 +6,7 @@ import {
   createPatient as apiCreatePatient,
   updatePatient as apiUpdatePatient,
   deletePatient as apiDeletePatient,
+  fetchPatientById as apiFetchPatientById,
   type Patient as ApiPatient,
 } from '../../Api/patientsApi';
 import type { Patient } from '../../types';
@@ -59,13 +60,27 @@ export const PatientManagement: React.FC = () => {
     );
   });
 
-  const handleOpenModal = (patient?: Patient) => {
+  // The patient list leaves medical_history out; it is loaded when a patient is opened
+  const withMedicalHistory = async (patient: Patient): Promise<Patient> => {
+    const full = await apiFetchPatientById(Number(patient.id));
+    return { ...patient, medicalHistory: full.medical_history || undefined };
+  };
+
+  const handleOpenModal = async (patient?: Patient) => {
     // Prevent doctors from opening the add/edit modal (double-guard)
     if (isDoctor) {
       alert('You do not have permission to add or edit patients.');
       return;
     }
     if (patient) {
+      try {
+        // the form saves medical_history, so it must hold the stored text before it opens
+        patient = await withMedicalHistory(patient);
+      } catch (err) {
+        console.error('Failed to load patient', err);
+        alert('Failed to load patient');
+        return;
+      }
       setEditingPatient(patient);
       setFormData({
         firstName: patient.firstName,
@@ -307,8 +322,20 @@ export const PatientManagement: React.FC = () => {
     exportData(dataToExport, 'patients-report', format, 'Patients Report');
   };
 
+  const handleViewPatient = (patient: Patient) => {
+    setViewingPatient(patient);
+    withMedicalHistory(patient)
+      .then((full) => setViewingPatient((current) => (current && current.id === full.id ? full : current)))
+      .catch((err) => console.error('Failed to load medical history', err));
+  };
+
   // Export a single patient's details as a printable PDF
-  const handleExportPatient = (patient: Patient) => {
+  const handleExportPatient = async (patient: Patient) => {
+    try {
+      patient = await withMedicalHistory(patient);
+    } catch (err) {
+      console.error('Failed to load medical history', err);
+    }
     const dataToExport = [
       {
         'Full Name': `${patient.firstName} ${patient.lastName}`,
@@ -371,7 +398,7 @@ export const PatientManagement: React.FC = () => {
           <Button
             size="small"
             variant="secondary"
-            onClick={() => setViewingPatient(patient)}
+            onClick={() => handleViewPatient(patient)}
             leftIcon={<Search className="w-3 h-3" />}
           >
             View
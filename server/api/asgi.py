@@ -3,6 +3,11 @@ ASGI config for api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The Procfile serves this (rather than api.wsgi) with
+`gunicorn api.asgi:application -k uvicorn.workers.UvicornWorker`, because of the /api/events/
+server-sent events stream: under ASGI each open stream is a coroutine, whereas under WSGI it
+would pin a whole worker (the view refuses to stream there).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
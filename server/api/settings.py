@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -58,11 +60,14 @@ CORS_ALLOW_HEADERS = [
     'accept-encoding',
     'authorization',
     'content-type',
+    'idempotency-key',
+    'if-match',
     'dnt',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-profile',
 ]
 
 # CSRF settings to match CORS
@@ -94,13 +99,15 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be at the top
     'django.middleware.security.SecurityMiddleware',
-    'django.middleware.gzip.GZipMiddleware',
+    'hms.middleware.CompressionMiddleware',
+    'hms.idempotency.IdempotencyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hms.profiling.ProfilingMiddleware',  # removes itself unless HMS_PROFILING_ENABLED
 ]
 
 ROOT_URLCONF = 'api.urls'
@@ -128,16 +135,87 @@ WSGI_APPLICATION = 'api.wsgi.application'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 # Database
+# All knobs are env-driven. DATABASE_URL selects the primary (Postgres in production);
+# without it we fall back to a local SQLite file so runserver/tests work out of the box.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+# Ping a reused persistent connection before handing it to a request
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+DB_SSL_REQUIRE = config('DB_SSL_REQUIRE', default=True, cast=bool)
+# Server-side cap on any single statement, in milliseconds (0 disables). It guards the web
+# workers; manage.py commands (migrations, archive_records, the run_tasks worker) legitimately
+# run long statements and get DB_COMMAND_STATEMENT_TIMEOUT_MS instead. runserver serves
+# requests, so it keeps the web cap.
+DB_STATEMENT_TIMEOUT_MS = config('DB_STATEMENT_TIMEOUT_MS', default=15000, cast=int)
+DB_COMMAND_STATEMENT_TIMEOUT_MS = config('DB_COMMAND_STATEMENT_TIMEOUT_MS', default=0, cast=int)
+# set by manage.py to the command being run; empty under the ASGI/WSGI servers
+MANAGEMENT_COMMAND = config('HMS_MANAGEMENT_COMMAND', default='')
+# 'persistent' - one long-lived connection per worker thread (CONN_MAX_AGE)
+# 'psycopg'    - Django 5 connection pool (needs psycopg 3 with the pool extra)
+# 'pgbouncer'  - an external transaction-mode pooler sits in front of Postgres
+DB_POOL_MODE = config('DB_POOL_MODE', default='persistent')
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=2, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=10, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=int)
+
 db_url = config('DATABASE_URL', default='')
 if db_url and db_url.strip():
+    default_db = dj_database_url.config(
+        default=db_url,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+        ssl_require=DB_SSL_REQUIRE,
+    )
+    db_options = default_db.setdefault('OPTIONS', {})
+    if DB_POOL_MODE == 'psycopg':
+        if not find_spec('psycopg_pool'):
+            raise ImproperlyConfigured(
+                "DB_POOL_MODE=psycopg needs psycopg 3 with its pool extra: pip install 'psycopg[binary,pool]'"
+            )
+        # the pool owns connection lifetime; Django refuses persistent connections alongside it
+        default_db['CONN_MAX_AGE'] = 0
+        db_options['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+        }
+    elif DB_POOL_MODE == 'pgbouncer':
+        # transaction pooling can't keep named cursors open between transactions
+        default_db['DISABLE_SERVER_SIDE_CURSORS'] = True
+    statement_timeout = DB_STATEMENT_TIMEOUT_MS if MANAGEMENT_COMMAND in ('', 'runserver') else DB_COMMAND_STATEMENT_TIMEOUT_MS
+    # pgbouncer rejects the `options` startup parameter; set statement_timeout on the role there instead
+    if statement_timeout and DB_POOL_MODE != 'pgbouncer':
+        db_options['options'] = f'-c statement_timeout={statement_timeout}'
+    DATABASES = {'default': default_db}
+else:
     DATABASES = {
-        'default': dj_database_url.config(
-            default=db_url,
-            conn_max_age=600,
-            ssl_require=True
-        )
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+            # wait on a locked database file instead of failing immediately
+            'OPTIONS': {'timeout': 20},
+        }
     }
 
+# Read replicas: comma-separated database URLs. Safe reads from the hms API go to a random
+# replica; a user who just wrote is kept on the primary for REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = []
+for i, replica_url in enumerate(u.strip() for u in config('DATABASE_REPLICA_URLS', default='').split(',')):
+    if not replica_url:
+        continue
+    replica = dj_database_url.parse(
+        replica_url,
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+        ssl_require=DB_SSL_REQUIRE and replica_url.startswith('postgres'),
+    )
+    # tests run against the primary only
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica_{i}'] = replica
+    DATABASE_REPLICAS.append(f'replica_{i}')
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['hms.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -198,6 +276,59 @@ CACHES = {
     }
 }
 
+# Server-sent events (/api/events/): broker class and, for RedisBroker, where Redis lives
+HMS_EVENTS_BACKEND = config('HMS_EVENTS_BACKEND', default='hms.events.LocalBroker')
+HMS_EVENTS_REDIS_URL = config('HMS_EVENTS_REDIS_URL', default='redis://localhost:6379/0')
+
+# At-rest compression for large clinical text (hms.fields): 'zlib' (default, stdlib), 'zstd' (needs
+# the zstandard package) or '' (off). Only values of at least MIN_BYTES are compressed.
+HMS_TEXT_COMPRESSION = config('HMS_TEXT_COMPRESSION', default='zlib')
+HMS_TEXT_COMPRESSION_MIN_BYTES = config('HMS_TEXT_COMPRESSION_MIN_BYTES', default=2048, cast=int)
+
+# Response compression (hms.middleware): encodings offered in preference order (zstd and br need
+# the zstandard / brotli packages) and the smallest body worth compressing
+HMS_COMPRESSION_ENCODINGS = config('HMS_COMPRESSION_ENCODINGS', default='zstd,br,gzip', cast=Csv())
+HMS_COMPRESSION_MIN_BYTES = config('HMS_COMPRESSION_MIN_BYTES', default=1024, cast=int)
+
+# Threads hashing passwords for bulk staff onboarding (hms.onboarding); 0 means one per CPU
+HMS_PASSWORD_HASH_WORKERS = config('HMS_PASSWORD_HASH_WORKERS', default=0, cast=int)
+
+# Audit trail of clinical record access (hms.audit): events are buffered per worker and written
+# in batches of BATCH_SIZE or every FLUSH_SECONDS; batches that can't be written are spooled to
+# SPOOL_DIR for `manage.py flush_audit_spool`
+HMS_AUDIT_ENABLED = config('HMS_AUDIT_ENABLED', default=True, cast=bool)
+HMS_AUDIT_BATCH_SIZE = config('HMS_AUDIT_BATCH_SIZE', default=500, cast=int)
+HMS_AUDIT_FLUSH_SECONDS = config('HMS_AUDIT_FLUSH_SECONDS', default=5, cast=float)
+HMS_AUDIT_SPOOL_DIR = config('HMS_AUDIT_SPOOL_DIR', default=str(BASE_DIR / 'audit-spool'))
+
+# Request profiling (hms.profiling): off means the middleware isn't installed at all. When on,
+# admins profile a request with an X-Profile header or set a sampling rule at /api/profiles/settings/;
+# the stack sampler ticks every INTERVAL_MS and the newest KEEP profiles are cached for TTL seconds
+HMS_PROFILING_ENABLED = config('HMS_PROFILING_ENABLED', default=False, cast=bool)
+HMS_PROFILING_INTERVAL_MS = config('HMS_PROFILING_INTERVAL_MS', default=1, cast=float)
+HMS_PROFILING_KEEP = config('HMS_PROFILING_KEEP', default=50, cast=int)
+HMS_PROFILING_TTL = config('HMS_PROFILING_TTL', default=86400, cast=int)
+
+# Idempotency-Key replays (hms.idempotency, stored in the hms.IdempotencyKey table): how long
+# a key is honoured
+HMS_IDEMPOTENCY_TTL = config('HMS_IDEMPOTENCY_TTL', default=24 * 60 * 60, cast=int)
+
 # REST Framework: add small page size to reduce payload sizes and DB load
 REST_FRAMEWORK.setdefault('DEFAULT_PAGINATION_CLASS', 'rest_framework.pagination.PageNumberPagination')
-REST_FRAMEWORK.setdefault('PAGE_SIZE', 25)
\ No newline at end of file
+REST_FRAMEWORK.setdefault('PAGE_SIZE', 25)
+
+# Binary formats for bulk consumers (hms.renderers), offered only when their library is installed
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+    'rest_framework.renderers.JSONRenderer',
+    'rest_framework.renderers.BrowsableAPIRenderer',
+]
+REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+    'rest_framework.parsers.JSONParser',
+    'rest_framework.parsers.FormParser',
+    'rest_framework.parsers.MultiPartParser',
+]
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('hms.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('hms.renderers.MessagePackParser')
+if find_spec('pyarrow'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('hms.renderers.ArrowStreamRenderer')
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+API-only settings profile: DJANGO_SETTINGS_MODULE=api.settings_api
+
+For workers that only serve token-authenticated JSON under /api/. Drops the admin, sessions,
+messages and static files apps, the middleware that exists for them (sessions, CSRF, auth,
+messages, clickjacking) and the browsable API, so a cold-started worker imports and wires
+up less before its first request. Everything else comes from api.settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+API_ONLY_DROPPED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+}
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_ONLY_DROPPED_APPS]
+
+# TokenAuthentication sets request.user itself; without sessions there is nothing for
+# AuthenticationMiddleware or CSRF to protect
+MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'hms.middleware.CompressionMiddleware',
+    'hms.idempotency.IdempotencyMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'hms.profiling.ProfilingMiddleware',  # removes itself unless HMS_PROFILING_ENABLED
+]
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'context_processors': [
+            'django.template.context_processors.request',
+            'django.contrib.auth.context_processors.auth',
+        ],
+    },
+}]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework.authentication.TokenAuthentication',),
+    'DEFAULT_RENDERER_CLASSES': [
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+}
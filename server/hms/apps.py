@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hms'
+
+    def ready(self):
+        # connect ChangeLog receivers
+        from . import signals  # noqa: F401
@@ -0,0 +1,167 @@
+"""Audit trail of who viewed or changed clinical records (Patient, Diagnosis, LabResults).
+
+Requests don't write audit rows themselves. `record(...)` appends to an in-memory buffer in
+the worker process, and a background thread writes the buffer with one bulk_create when it
+reaches HMS_AUDIT_BATCH_SIZE events or every HMS_AUDIT_FLUSH_SECONDS, whichever comes first.
+
+The buffer is flushed once more at interpreter exit. Events are not lost when the database
+can't take them: a write that fails (at exit too) spools the batch as JSON lines under
+HMS_AUDIT_SPOOL_DIR, and `python manage.py flush_audit_spool` loads spooled files back into
+the table. A worker killed with SIGKILL still loses whatever it had buffered, at most one
+flush interval's worth.
+
+ViewSets opt in with AuditMixin (hms.views); SyncView, ExportView and the patient duplicates
+report record what they hand out too. Read the trail at /api/audit-events/.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.jsonl'
+
+
+class AuditBuffer:
+    """Per-process event buffer with a background flusher."""
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._exit_registered = False
+
+    def _ensure_flusher(self):
+        # threads don't survive fork, so a forked worker starts its own
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._events = []
+        threading.Thread(target=self._run, name='hms-audit', daemon=True).start()
+        if not self._exit_registered:
+            atexit.register(self.flush)
+            self._exit_registered = True
+
+    def add(self, events):
+        with self._lock:
+            self._ensure_flusher()
+            self._events.extend(events)
+            full = len(self._events) >= settings.HMS_AUDIT_BATCH_SIZE
+        if full:
+            self._wake.set()
+
+    def drain(self):
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.HMS_AUDIT_FLUSH_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write everything buffered; returns how many events were written (or spooled)."""
+        events = self.drain()
+        if not events:
+            return 0
+        try:
+            AuditEvent.objects.bulk_create(
+                [AuditEvent(**event) for event in events], batch_size=settings.HMS_AUDIT_BATCH_SIZE,
+            )
+        except Exception:
+            logger.exception("Audit flush of %s events failed; spooling them to disk", len(events))
+            spool(events)
+        return len(events)
+
+
+buffer = AuditBuffer()
+
+
+def record(user, action, model, records, ip_address=None):
+    """Buffer one event per (object id, patient id) in `records`."""
+    if not settings.HMS_AUDIT_ENABLED:
+        return
+    user_id = user.pk if getattr(user, 'is_authenticated', False) else None
+    now = timezone.now()
+    label = model._meta.label_lower
+    buffer.add([
+        {'user_id': user_id, 'action': action, 'model': label, 'object_id': object_id,
+         'patient_id': patient_id, 'ip_address': ip_address, 'occurred_at': now}
+        for object_id, patient_id in records
+    ])
+
+
+def patient_id(record, path):
+    """The patient id of `record` (a model instance or serialized dict) along `path`, e.g.
+    'lab_order.patient'; None for path means the record is the patient."""
+    if path is None:
+        return record['id'] if isinstance(record, dict) else record.pk
+    parts = path.split('.')
+    for i, part in enumerate(parts):
+        if isinstance(record, dict):
+            record = record.get(part)
+        elif i == len(parts) - 1 and hasattr(record, f'{part}_id'):
+            # the id is on the row already; don't load the patient for it
+            return getattr(record, f'{part}_id')
+        else:
+            record = getattr(record, part, None)
+    return getattr(record, 'pk', record)
+
+
+def spool(events):
+    directory = Path(settings.HMS_AUDIT_SPOOL_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"audit-{os.getpid()}-{time.time_ns()}{SPOOL_SUFFIX}"
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        for event in events:
+            f.write(json.dumps({**event, 'occurred_at': event['occurred_at'].isoformat()}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def load_spool():
+    """Insert spooled events into the table and remove their files; returns the count loaded."""
+    directory = Path(settings.HMS_AUDIT_SPOOL_DIR)
+    loaded = 0
+    for path in sorted(directory.glob(f'*{SPOOL_SUFFIX}')) if directory.exists() else ():
+        # claim the file first so two loaders never insert it twice
+        claimed = path.with_suffix('.loading')
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            continue
+        try:
+            with open(claimed) as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            for event in events:
+                event['occurred_at'] = parse_datetime(event['occurred_at'])
+            AuditEvent.objects.bulk_create(
+                [AuditEvent(**event) for event in events], batch_size=settings.HMS_AUDIT_BATCH_SIZE,
+            )
+        except Exception:
+            # leave it for the next run
+            os.replace(claimed, path)
+            raise
+        claimed.unlink()
+        loaded += len(events)
+    return loaded
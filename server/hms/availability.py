@@ -0,0 +1,96 @@
+"""Free appointment slots from doctor schedules and booked appointments.
+
+A doctor's working hours (DoctorSchedule rows, per weekday) are cut into slots of the row's
+slot length. Appointments only record a start time, so a booking is taken to last one slot of
+the schedule it falls in. Bookings are merged into disjoint, sorted intervals and then walked
+alongside the (also sorted) slots, so each doctor-day is a single merge pass rather than a
+check of every slot against every appointment.
+
+Everything here works on naive local datetimes; hms.models.DoctorSchedule.availability does
+the database reads and the time zone conversion.
+"""
+import datetime
+
+# assumed length of a booking outside any schedule (e.g. made before the schedule changed)
+DEFAULT_SLOT_MINUTES = 30
+
+
+def day_slots(day, schedules):
+    """Sorted (start, end) slots for one day from (start_time, end_time, slot_minutes) rows."""
+    slots = []
+    for start_time, end_time, slot_minutes in schedules:
+        step = datetime.timedelta(minutes=slot_minutes)
+        start, close = datetime.datetime.combine(day, start_time), datetime.datetime.combine(day, end_time)
+        while start + step <= close:
+            slots.append((start, start + step))
+            start += step
+    slots.sort()
+    return slots
+
+
+def booking_length(start, schedules):
+    """Slot length of the schedule row a booking starting at `start` falls in."""
+    for start_time, end_time, slot_minutes in schedules:
+        if start_time <= start.time() < end_time:
+            return datetime.timedelta(minutes=slot_minutes)
+    return datetime.timedelta(minutes=DEFAULT_SLOT_MINUTES)
+
+
+def merge_intervals(intervals):
+    """Sort and coalesce overlapping or touching (start, end) intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(slots, booked, not_before=None):
+    """Slots that overlap no booked interval (and start at or after `not_before`).
+
+    Args:
+        slots (list): sorted (start, end) pairs
+        booked (list): disjoint, sorted (start, end) pairs, as from merge_intervals
+    """
+    free = []
+    i = 0
+    for start, end in slots:
+        if not_before is not None and start < not_before:
+            continue
+        # bookings are disjoint and sorted, so their ends are sorted too
+        while i < len(booked) and booked[i][1] <= start:
+            i += 1
+        if i < len(booked) and booked[i][0] < end:
+            continue
+        free.append((start, end))
+    return free
+
+
+def availability(schedules, bookings, first_day, last_day, not_before=None):
+    """Free slots per day for one doctor.
+
+    Args:
+        schedules (dict): weekday (0 = Monday) -> list of (start_time, end_time, slot_minutes)
+        bookings (list): naive local start datetimes of the doctor's live appointments
+        first_day, last_day (date): inclusive range
+
+    Returns:
+        list: [(day, [(start, end), ...]), ...] for every day in the range
+    """
+    by_day = {}
+    for start in bookings:
+        by_day.setdefault(start.date(), []).append(start)
+
+    days = []
+    day = first_day
+    while day <= last_day:
+        rows = schedules.get(day.weekday(), ())
+        booked = merge_intervals(
+            (start, start + booking_length(start, rows)) for start in by_day.get(day, ())
+        )
+        days.append((day, free_slots(day_slots(day, rows), booked, not_before)))
+        day += datetime.timedelta(days=1)
+    return days
@@ -0,0 +1,119 @@
+"""Stampede-safe caching for expensive hms responses.
+
+`get_or_compute(key, compute, ttl)` wraps the plain cache.get/set pattern with:
+
+- single-flight: when an entry is missing, one caller computes it (holding a short lock
+  taken with cache.add) while the others wait briefly for its result;
+- probabilistic early refresh (XFetch): as an entry nears expiry, a caller occasionally
+  recomputes it early, weighted by how long the last computation took, so entries are
+  renewed before a crowd finds them missing;
+- stale-while-revalidate: for `stale_ttl` seconds after expiry the old value is still
+  served to everyone except the one caller that holds the lock and refreshes it.
+
+`generation(name)` / `bump_generation(name)` version a family of keys: build the keys with the
+generation, and a bump retires every entry of the family at once.
+"""
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+# how long a recompute may hold the lock before others stop waiting on it
+LOCK_TIMEOUT = 30
+# how often waiters poll for the lock holder's result
+WAIT_INTERVAL = 0.05
+
+
+def _lock_key(key):
+    return f"{key}:lock"
+
+
+def _store(key, compute, ttl, stale_ttl):
+    started = time.monotonic()
+    value = compute()
+    elapsed = time.monotonic() - started
+    entry = {'value': value, 'expires': time.time() + ttl, 'delta': elapsed}
+    cache.set(key, entry, ttl + stale_ttl)
+    return value
+
+
+def _refresh(key, compute, ttl, stale_ttl):
+    """Recompute under the lock; returns None when another caller already holds it."""
+    if not cache.add(_lock_key(key), 1, LOCK_TIMEOUT):
+        return None
+    try:
+        return _store(key, compute, ttl, stale_ttl)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def recompute(key, compute, ttl, stale_ttl=None):
+    """Recompute and store `key` now (e.g. from a background task); returns None when another
+    caller is already refreshing it."""
+    return _refresh(key, compute, ttl, ttl if stale_ttl is None else stale_ttl)
+
+
+def get_or_compute(key, compute, ttl, stale_ttl=None, beta=1.0):
+    """Return the cached value for `key`, computing it with `compute()` when needed.
+
+    Args:
+        key (str): cache key
+        compute (callable): builds the value; must be picklable
+        ttl (int): seconds the value counts as fresh
+        stale_ttl (int): seconds past `ttl` a stale value may still be served while one caller
+            refreshes it (default: equal to ttl)
+        beta (float): early-refresh eagerness; 0 disables early refresh
+    """
+    if stale_ttl is None:
+        stale_ttl = ttl
+    entry = cache.get(key)
+    now = time.time()
+
+    if entry is not None:
+        if now < entry['expires']:
+            # XFetch: -log(U) is exponential, so refreshes cluster just before expiry
+            early = entry['delta'] * beta * -math.log(1.0 - random.random())
+            if beta and now + early >= entry['expires']:
+                refreshed = _refresh(key, compute, ttl, stale_ttl)
+                if refreshed is not None:
+                    return refreshed
+            return entry['value']
+        # stale: one caller refreshes, everyone else keeps serving the old value
+        refreshed = _refresh(key, compute, ttl, stale_ttl)
+        return entry['value'] if refreshed is None else refreshed
+
+    # cold: one caller computes, the rest wait for its result
+    refreshed = _refresh(key, compute, ttl, stale_ttl)
+    if refreshed is not None:
+        return refreshed
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        if cache.get(_lock_key(key)) is None:
+            break
+    # the lock holder failed or gave up; compute for ourselves rather than fail the request
+    return _store(key, compute, ttl, stale_ttl)
+
+
+def generation(name):
+    """Current token of the key family `name`, to put in each of its keys.
+
+    Tokens are timestamps rather than counters, so a token lost to eviction is replaced by one
+    no key was ever built with.
+    """
+    key = f"generation:{name}"
+    token = cache.get(key)
+    if token is None:
+        token = time.time_ns()
+        if not cache.add(key, token, None):
+            token = cache.get(key, token)
+    return token
+
+
+def bump_generation(name):
+    """Retire every entry keyed with the current generation of `name`."""
+    cache.set(f"generation:{name}", time.time_ns(), None)
@@ -0,0 +1,81 @@
+"""Precomputed dashboard figures served from one stored blob (/api/dashboard/).
+
+The snapshot is rebuilt by the `refresh_dashboard` task (hms.tasks) on a schedule and shortly
+after writes to the tables it summarizes, so serving it never touches those tables. It is
+stored in hms.DashboardSnapshot, which the worker and every web process share, and each
+process keeps it in its cache for a few seconds. A snapshot older than SNAPSHOT_MAX_AGE_SECONDS
+(the worker is down or behind) is rebuilt by the request that finds it.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+SNAPSHOT_CACHE_KEY = 'dashboard-snapshot'
+# how long a process serves the snapshot from its cache before reading the table again
+SNAPSHOT_CACHE_SECONDS = 5
+# older snapshots are rebuilt inline rather than served
+SNAPSHOT_MAX_AGE_SECONDS = 5 * 60
+# held by the request rebuilding a stale snapshot; other requests keep serving it meanwhile
+REBUILD_LOCK_KEY = 'dashboard-snapshot:rebuilding'
+REBUILD_LOCK_SECONDS = 30
+# scheduled rebuild interval, and how long writes are coalesced before a rebuild
+REFRESH_INTERVAL_SECONDS = 60
+WRITE_DEBOUNCE_SECONDS = 5
+# medicines below this stock are listed as low stock (matches MedicineViewSet.low_stock)
+LOW_STOCK_THRESHOLD = 10
+
+
+def build_snapshot():
+    """Compute every dashboard figure and store the rendered JSON."""
+    from .models import DashboardSnapshot, Diagnosis, DiagnosisArchive, Medicine, Patient, Sale, User
+    from .serializers import MedicineSerializer, SaleSerializer
+
+    today = timezone.now().date()
+    today_sales = list(Sale.objects.filter(date=today).select_related('medicine'))
+    data = {
+        'generated_at': timezone.now(),
+        'patient_count': Patient.objects.count(),
+        'medicine_count': Medicine.objects.count(),
+        'diagnosis_count': Diagnosis.objects.count() + DiagnosisArchive.objects.count(),
+        'user_count': User.objects.count(),
+        'total_revenue': float(Sale.total_revenue()),
+        'currency': '$',
+        'today_sales': {
+            'date': today,
+            'sales': SaleSerializer(today_sales, many=True).data,
+            'total_revenue': float(sum((s.total_amount for s in today_sales), start=0)),
+            'sales_count': len(today_sales),
+        },
+        'low_stock': MedicineSerializer(Medicine.objects.filter(stock__lt=LOW_STOCK_THRESHOLD), many=True).data,
+    }
+    body = JSONRenderer().render(data)
+    snapshot = {'body': body, 'etag': f'"{hashlib.md5(body).hexdigest()}"', 'generated_at': data['generated_at']}
+    DashboardSnapshot.objects.update_or_create(pk=1, defaults=snapshot)
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot, SNAPSHOT_CACHE_SECONDS)
+    return snapshot
+
+
+def get_snapshot():
+    """The stored snapshot, or None when nothing has been built yet."""
+    from .models import DashboardSnapshot
+
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is None:
+        row = DashboardSnapshot.objects.filter(pk=1).first()
+        if row is None:
+            return None
+        snapshot = {'body': bytes(row.body), 'etag': row.etag, 'generated_at': row.generated_at}
+        cache.set(SNAPSHOT_CACHE_KEY, snapshot, SNAPSHOT_CACHE_SECONDS)
+    return snapshot
+
+
+def is_stale(snapshot):
+    return snapshot['generated_at'] < timezone.now() - timedelta(seconds=SNAPSHOT_MAX_AGE_SECONDS)
+
+
+def claim_rebuild():
+    """True for the one request that should rebuild a stale snapshot."""
+    return cache.add(REBUILD_LOCK_KEY, 1, REBUILD_LOCK_SECONDS)
@@ -0,0 +1,69 @@
+"""Route safe reads to read replicas while keeping writes (and recent writers) on the primary.
+
+Replicas are configured through DATABASE_REPLICA_URLS (see settings). Reads only go to a replica
+inside `replica_reads()`, which the hms ViewSets enter for GET/HEAD/OPTIONS requests; everything
+else, including management commands and `select_for_update` paths, stays on `default`.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+_replica_reads = ContextVar('hms_replica_reads', default=False)
+
+
+def set_replica_reads(enabled):
+    """Allow or forbid replica reads in the current context; returns a token for reset_replica_reads."""
+    return _replica_reads.set(enabled)
+
+
+def reset_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Allow (or forbid) replica reads for the duration of the block."""
+    token = set_replica_reads(enabled)
+    try:
+        yield
+    finally:
+        reset_replica_reads(token)
+
+
+def _pin_key(user_id):
+    return f"db-primary-pin:{user_id}"
+
+
+def pin_to_primary(user):
+    """Keep `user` on the primary for REPLICA_PIN_SECONDS so they read their own writes."""
+    if user is not None and user.is_authenticated:
+        cache.set(_pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    if user is None or not user.is_authenticated:
+        return False
+    return bool(cache.get(_pin_key(user.pk)))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        # a read inside a transaction on the primary must see that transaction's writes
+        if not replicas or not _replica_reads.get() or transaction.get_connection('default').in_atomic_block:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas mirror the primary, so objects from any of them may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
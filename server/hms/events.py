@@ -0,0 +1,117 @@
+"""Publish/subscribe for the server-sent events stream (/api/events/).
+
+Model signals publish small change notices; each open SSE connection holds a Subscription
+with its own asyncio queue. The broker class is chosen by settings.HMS_EVENTS_BACKEND:
+
+- LocalBroker (default): fan-out within this process only.
+- RedisBroker: publishes through a Redis channel so every worker process sees every event
+  (needs the `redis` package and HMS_EVENTS_REDIS_URL).
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+CHANNELS = frozenset({'lab_results', 'lab_orders', 'appointments'})
+
+
+class Subscription:
+    """One listener's queue, bound to the event loop it was created on."""
+
+    def __init__(self, channels, maxsize):
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, event):
+        # a listener that has fallen behind loses its oldest events rather than growing unbounded
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def deliver(self, event):
+        # called from whichever thread published; hop onto the subscriber's loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    queue_size = 100
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, channel, payload):
+        self._fanout({'channel': channel, **payload})
+
+    def _fanout(self, event):
+        with self._lock:
+            targets = [s for s in self._subscriptions if event['channel'] in s.channels]
+        for subscription in targets:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # the subscriber's loop has closed; its stream's cleanup will unsubscribe it
+                pass
+
+
+class RedisBroker(LocalBroker):
+    redis_channel = 'hms-events'
+
+    def __init__(self):
+        super().__init__()
+        import redis  # optional dependency, only needed for this backend
+
+        self._redis = redis.Redis.from_url(settings.HMS_EVENTS_REDIS_URL)
+        self._listener = None
+
+    def subscribe(self, channels):
+        # start relaying from Redis the first time anyone in this process listens
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='hms-events-redis', daemon=True)
+                    self._listener.start()
+        return super().subscribe(channels)
+
+    def publish(self, channel, payload):
+        self._redis.publish(self.redis_channel, json.dumps({'channel': channel, **payload}, cls=DjangoJSONEncoder))
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.redis_channel)
+        for message in pubsub.listen():
+            self._fanout(json.loads(message['data']))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.HMS_EVENTS_BACKEND)()
+    return _broker
+
+
+def publish(channel, payload):
+    get_broker().publish(channel, payload)
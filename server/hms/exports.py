@@ -0,0 +1,273 @@
+"""Incremental columnar (Parquet / Arrow IPC) exports for the warehouse ETL.
+
+Rows are read in (watermark field, pk) order through server-side cursors, converted to Arrow
+record batches against a fixed schema derived from the model, and written one file per day.
+The watermark is that (value, pk) pair of the last exported row, so a run picks up exactly
+where the previous one stopped. Only closed periods are exported: days before today for
+date-keyed models, and rows committed at least EXPORT_SETTLE_SECONDS ago for created_at, so a
+slow transaction can't land behind a watermark that has already moved past it. Edits to rows
+already exported are not picked up; the warehouse gets each row once, as first recorded.
+Tables that `manage.py archive_records` moves rows out of are read together with their archive
+table, merged in watermark order, so rows archived before they were exported still go out.
+
+Needs `pyarrow` (listed in requirements.txt); without it the export endpoint answers 501.
+"""
+import datetime
+import heapq
+import itertools
+import json
+import os
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Appointments, Diagnosis, DiagnosisArchive, LabResults, LabResultsArchive, Medicine, Sale, SaleArchive
+
+EXPORT_BATCH_SIZE = 5000
+# rows created more recently than this may still have uncommitted neighbours with lower ids
+EXPORT_SETTLE_SECONDS = 60
+WATERMARK_FILE = '_watermark.json'
+
+# export name -> (model, watermark field)
+EXPORTS = {
+    'sales': (Sale, 'date'),
+    'medicines': (Medicine, 'created_at'),
+    'diagnoses': (Diagnosis, 'created_at'),
+    'appointments': (Appointments, 'date'),
+    'lab-results': (LabResults, 'created_at'),
+}
+# export name -> archive table holding the same columns for closed periods
+ARCHIVES = {
+    'sales': SaleArchive,
+    'diagnoses': DiagnosisArchive,
+    'lab-results': LabResultsArchive,
+}
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def arrow_schema(model):
+    """Arrow schema for a model's concrete columns (foreign keys as their *_id)."""
+    import pyarrow as pa
+
+    columns = []
+    for field in model._meta.concrete_fields:
+        if isinstance(field, models.ForeignKey):
+            arrow_type = pa.int64()
+        elif isinstance(field, models.DecimalField):
+            arrow_type = pa.decimal128(field.max_digits, field.decimal_places)
+        elif isinstance(field, models.DateTimeField):
+            arrow_type = pa.timestamp('us', tz='UTC')
+        elif isinstance(field, models.DateField):
+            arrow_type = pa.date32()
+        elif isinstance(field, models.TimeField):
+            arrow_type = pa.time64('us')
+        elif isinstance(field, models.BooleanField):
+            arrow_type = pa.bool_()
+        elif isinstance(field, (models.AutoField, models.BigAutoField, models.IntegerField)):
+            arrow_type = pa.int64()
+        else:
+            # text, choices and JSON (as JSON text)
+            arrow_type = pa.string()
+        columns.append(pa.field(field.attname, arrow_type))
+    return pa.schema(columns)
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def parse_watermark(raw):
+    """'<iso value>|<pk>' (as returned in X-Export-Watermark) -> (value, pk), or None."""
+    if not raw:
+        return None
+    value, _, pk = raw.rpartition('|')
+    if not value or not pk.isdigit():
+        raise ValueError('Watermark must look like <ISO date or datetime>|<id>.')
+    if 'T' in value:
+        # an unencoded '+' in a query string arrives as a space
+        parsed = datetime.datetime.fromisoformat(value.replace(' ', '+'))
+    else:
+        parsed = datetime.date.fromisoformat(value)
+    return parsed, int(pk)
+
+
+def format_watermark(watermark):
+    if watermark is None:
+        return ''
+    value, pk = watermark
+    return f"{value.isoformat()}|{pk}"
+
+
+def export_querysets(name, watermark=None):
+    """Rows of export `name` after `watermark`, in closed periods only, in watermark order.
+
+    Returns:
+        tuple: (one values_list queryset per table read, the column names they return)
+    """
+    model, field = EXPORTS[name]
+    if field == 'created_at':
+        cutoff = timezone.now() - datetime.timedelta(seconds=EXPORT_SETTLE_SECONDS)
+    elif isinstance(model._meta.get_field(field), models.DateTimeField):
+        # a datetime-keyed schedule (appointments): whole days that have ended
+        cutoff = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min))
+    else:
+        cutoff = timezone.localdate()
+    condition = Q(**{f'{field}__lt': cutoff})
+    if watermark is not None:
+        value, pk = watermark
+        condition &= Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+    columns = [f.attname for f in model._meta.concrete_fields]
+    tables = [model] + ([ARCHIVES[name]] if name in ARCHIVES else [])
+    return [table.objects.filter(condition).order_by(field, 'pk').values_list(*columns) for table in tables], columns
+
+
+def record_batches(name, watermark=None, batch_size=EXPORT_BATCH_SIZE, limit=None):
+    """Yield (day, record batch, watermark after the batch), never mixing days in one batch."""
+    import pyarrow as pa
+
+    model, field = EXPORTS[name]
+    schema = arrow_schema(model)
+    querysets, columns = export_querysets(name, watermark)
+    if limit:
+        querysets = [queryset[:limit] for queryset in querysets]
+    key_index, pk_index = columns.index(field), columns.index(model._meta.pk.attname)
+    json_columns = {i for i, f in enumerate(model._meta.concrete_fields) if isinstance(f, models.JSONField)}
+
+    def flush(rows):
+        if json_columns:
+            rows = [
+                tuple(json.dumps(v, cls=DjangoJSONEncoder) if i in json_columns and v is not None else v
+                      for i, v in enumerate(row))
+                for row in rows
+            ]
+        arrays = [pa.array([row[i] for row in rows], type=schema.field(i).type) for i in range(len(columns))]
+        last = rows[-1]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema), (last[key_index], last[pk_index])
+
+    # .iterator() streams through a server-side cursor on Postgres instead of loading every row
+    merged = heapq.merge(
+        *(queryset.iterator(chunk_size=batch_size) for queryset in querysets),
+        key=lambda row: (row[key_index], row[pk_index]),
+    )
+    if limit:
+        merged = itertools.islice(merged, limit)
+    rows, day = [], None
+    for row in merged:
+        row_day = _day(row[key_index])
+        if rows and (row_day != day or len(rows) >= batch_size):
+            batch, mark = flush(rows)
+            yield day, batch, mark
+            rows = []
+        day = row_day
+        rows.append(row)
+    if rows:
+        batch, mark = flush(rows)
+        yield day, batch, mark
+
+
+def open_writer(path, schema, fmt):
+    import pyarrow as pa
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(str(path), schema, compression='zstd')
+    return pa.ipc.new_file(str(path), schema)
+
+
+def read_watermark(directory):
+    path = Path(directory) / WATERMARK_FILE
+    if not path.exists():
+        return None
+    return parse_watermark(json.loads(path.read_text())['watermark'])
+
+
+def write_watermark(directory, watermark):
+    path = Path(directory) / WATERMARK_FILE
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'watermark': format_watermark(watermark), 'written_at': timezone.now().isoformat()}))
+    os.replace(tmp, path)
+
+
+def _finish(current):
+    writer, tmp_path, final_path, _ = current
+    writer.close()
+    os.replace(tmp_path, final_path)
+
+
+def export_to_directory(name, root, fmt='parquet', batch_size=EXPORT_BATCH_SIZE, watermark=None):
+    """Append rows after the stored watermark to `root/<name>/day=YYYY-MM-DD/part-<first id>.<ext>`.
+
+    Files are written under a temporary name and renamed when complete; the watermark is only
+    advanced once every file of the run is in place, so an interrupted run is simply repeated.
+
+    Returns:
+        tuple: (rows written, files written, new watermark)
+    """
+    directory = Path(root) / name
+    directory.mkdir(parents=True, exist_ok=True)
+    if watermark is None:
+        watermark = read_watermark(directory)
+    model, _ = EXPORTS[name]
+    schema = arrow_schema(model)
+    pk_index = [f.attname for f in model._meta.concrete_fields].index(model._meta.pk.attname)
+
+    rows = files = 0
+    current = None  # (writer, temporary path, final path, day) of the file being written
+    try:
+        for day, batch, mark in record_batches(name, watermark, batch_size):
+            if current is None or current[3] != day:
+                if current is not None:
+                    _finish(current)
+                    current = None
+                first_id = batch.column(pk_index)[0].as_py()
+                partition = directory / f"day={day.isoformat()}"
+                partition.mkdir(exist_ok=True)
+                final_path = partition / f"part-{first_id}{FORMATS[fmt]}"
+                tmp_path = final_path.with_name(final_path.name + '.tmp')
+                current = (open_writer(tmp_path, schema, fmt), tmp_path, final_path, day)
+                files += 1
+            current[0].write_batch(batch)
+            rows += batch.num_rows
+            watermark = mark
+        if current is not None:
+            _finish(current)
+            current = None
+    finally:
+        if current is not None:
+            current[0].close()
+            current[1].unlink(missing_ok=True)
+    if rows:
+        write_watermark(directory, watermark)
+    return rows, files, watermark
+
+
+def export_to_bytes(name, fmt='parquet', watermark=None, limit=None, batch_size=EXPORT_BATCH_SIZE, on_batch=None):
+    """One Parquet/Arrow file (all days) with up to `limit` rows after `watermark`.
+
+    `on_batch`, when given, is called with each record batch written (e.g. to audit the rows).
+
+    Returns:
+        tuple: (file bytes, rows, new watermark)
+    """
+    import pyarrow as pa
+
+    model, _ = EXPORTS[name]
+    schema = arrow_schema(model)
+    sink = pa.BufferOutputStream()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(sink, schema)
+    rows = 0
+    with writer:
+        for _, batch, mark in record_batches(name, watermark, batch_size, limit=limit):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            watermark = mark
+            if on_batch is not None:
+                on_batch(batch)
+    return sink.getvalue().to_pybytes(), rows, watermark
@@ -0,0 +1,76 @@
+"""Model fields that compress large values at rest.
+
+Values longer than HMS_TEXT_COMPRESSION_MIN_BYTES are stored as a marker, the codec name and
+the base64 of the compressed bytes; anything without the marker is read back as-is, so rows
+written before compression was enabled (or while it is off) stay readable and are compressed
+on their next save. Compressed values can't be searched with SQL lookups.
+"""
+import base64
+import json
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+MARKER = '\x1ehmsz:'
+
+
+def _zstd():
+    import zstandard  # optional; only needed with HMS_TEXT_COMPRESSION = 'zstd'
+    return zstandard
+
+
+def compress(text):
+    """Return `text` in its stored form: compressed when enabled, large enough and worth it."""
+    codec = settings.HMS_TEXT_COMPRESSION
+    raw = text.encode()
+    if not codec or len(raw) < settings.HMS_TEXT_COMPRESSION_MIN_BYTES:
+        return text
+    if codec == 'zstd':
+        packed = _zstd().ZstdCompressor(level=3).compress(raw)
+    elif codec == 'zlib':
+        packed = zlib.compress(raw, 6)
+    else:
+        raise ValueError(f"Unsupported HMS_TEXT_COMPRESSION codec: {codec}")
+    stored = f"{MARKER}{codec}:{base64.b64encode(packed).decode('ascii')}"
+    # base64 costs a third, so small or already dense values are kept as they are
+    return stored if len(stored) < len(text) else text
+
+
+def decompress(value):
+    if not isinstance(value, str) or not value.startswith(MARKER):
+        return value
+    codec, _, payload = value[len(MARKER):].partition(':')
+    packed = base64.b64decode(payload)
+    if codec == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(packed).decode()
+    return zlib.decompress(packed).decode()
+
+
+class CompressedTextField(models.TextField):
+    def from_db_value(self, value, expression, connection):
+        return decompress(value)
+
+    def to_python(self, value):
+        return decompress(super().to_python(value))
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return compress(value) if isinstance(value, str) else value
+
+
+class CompressedJSONField(models.JSONField):
+    """JSONField whose large documents are stored as a single compressed JSON string."""
+
+    def from_db_value(self, value, expression, connection):
+        value = super().from_db_value(value, expression, connection)
+        if isinstance(value, str) and value.startswith(MARKER):
+            return json.loads(decompress(value), cls=self.decoder)
+        return value
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or hasattr(value, 'as_sql'):
+            return value
+        stored = compress(json.dumps(value, cls=self.encoder))
+        return stored if stored.startswith(MARKER) else value
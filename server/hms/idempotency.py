@@ -0,0 +1,155 @@
+"""Idempotency-Key support for POST and PATCH requests.
+
+A client that sends `Idempotency-Key: <unique value>` may safely retry the request: the first
+response is stored (under the caller's credentials, method, path and key) for
+HMS_IDEMPOTENCY_TTL seconds, and a retry gets that stored response back without the view
+running again, so no validation queries, no stock movements and no second record. Replays
+carry `Idempotent-Replayed: true`.
+
+- Reusing a key for a different request body is refused with 422.
+- A retry that arrives while the first request is still running gets 409 and Retry-After.
+- Server errors (5xx), 409 and 429 are not stored; the client may retry those for real.
+- Login, registration and staff onboarding never take part: their responses carry tokens or
+  passwords, which must not sit in a table for a day.
+
+Keys are rows in hms.IdempotencyKey. Its unique constraint is what lets exactly one of several
+concurrent workers claim a key, and rows aren't evicted early the way a bounded cache culls
+entries. Expired rows are reused on the next claim and removed by `run_tasks --purge-days`.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENT_METHODS = ('POST', 'PATCH')
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+# how long an in-flight request holds its key before a retry may run it again
+LOCK_TIMEOUT = 60
+# the only response headers replayed; everything else is recomputed by the middleware stack
+STORED_HEADERS = ('Content-Type', 'Location', 'ETag', 'Last-Modified')
+UNSTORED_STATUSES = (409, 429)
+# url names whose responses hold credentials (tokens, generated passwords)
+EXEMPT_URL_NAMES = ('login', 'register', 'user-onboard')
+
+
+def _digest(*parts):
+    return hashlib.blake2b('\n'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def entry_key(request, key):
+    # scoped to the credentials so one user's key can never replay another user's response
+    return _digest(request.META.get('HTTP_AUTHORIZATION', ''), request.method, request.path, key)
+
+
+def fingerprint(request):
+    if request.content_type == 'multipart/form-data':
+        # uploads aren't read into memory just to compare them
+        body = request.META.get('CONTENT_LENGTH', '').encode()
+    else:
+        body = request.body
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def is_exempt(request):
+    try:
+        return resolve(request.path_info).url_name in EXEMPT_URL_NAMES
+    except Resolver404:
+        return False
+
+
+def claim(entry_key, request_fingerprint):
+    """Claim `entry_key` for this request. Returns (row, claimed).
+
+    When the key is already taken, `row` is the existing entry (or None if it vanished
+    meanwhile); a row that has expired, or whose first request was abandoned, is taken over.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            row = IdempotencyKey.objects.create(
+                key=entry_key, fingerprint=request_fingerprint,
+                locked_until=now + timedelta(seconds=LOCK_TIMEOUT), created_at=now,
+            )
+        return row, True
+    except IntegrityError:
+        pass
+    row = IdempotencyKey.objects.filter(key=entry_key).first()
+    if row is None:
+        return None, False
+    expired = row.created_at <= now - timedelta(seconds=settings.HMS_IDEMPOTENCY_TTL)
+    abandoned = row.status_code is None and row.locked_until is not None and row.locked_until <= now
+    if not (expired or abandoned):
+        return row, False
+    # compare-and-set on the claim we read, so only one retry takes the row over
+    taken = IdempotencyKey.objects.filter(
+        pk=row.pk, created_at=row.created_at, locked_until=row.locked_until,
+    ).update(
+        fingerprint=request_fingerprint, status_code=None, headers=[], body=b'',
+        locked_until=now + timedelta(seconds=LOCK_TIMEOUT), created_at=now,
+    )
+    return (row, True) if taken else (None, False)
+
+
+def purge():
+    """Delete expired keys; returns how many were removed."""
+    cutoff = timezone.now() - timedelta(seconds=settings.HMS_IDEMPOTENCY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def replay(row):
+    response = HttpResponse(bytes(row.body), status=row.status_code)
+    for name, value in row.headers:
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def in_progress():
+    response = JsonResponse({'detail': 'A request with this Idempotency-Key is still being processed.'}, status=409)
+    response['Retry-After'] = '1'
+    return response
+
+
+class IdempotencyMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = request.META.get(HEADER)
+        if request.method not in IDEMPOTENT_METHODS or not key or is_exempt(request):
+            return self.get_response(request)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'detail': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters.'}, status=400)
+
+        request_fingerprint = fingerprint(request)
+        row, claimed = claim(entry_key(request, key), request_fingerprint)
+        if not claimed:
+            if row is not None and bytes(row.fingerprint) != request_fingerprint:
+                return JsonResponse({'detail': 'Idempotency-Key was already used for a different request.'}, status=422)
+            if row is None or row.status_code is None:
+                return in_progress()
+            return replay(row)
+
+        stored = False
+        try:
+            response = self.get_response(request)
+            if (not response.streaming and response.status_code < 500
+                    and response.status_code not in UNSTORED_STATUSES):
+                headers = [[name, response[name]] for name in STORED_HEADERS if response.has_header(name)]
+                IdempotencyKey.objects.filter(pk=row.pk).update(
+                    status_code=response.status_code, headers=headers, body=response.content, locked_until=None,
+                )
+                stored = True
+            return response
+        finally:
+            if not stored:
+                # let the client retry for real
+                IdempotencyKey.objects.filter(pk=row.pk).delete()
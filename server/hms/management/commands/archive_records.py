@@ -0,0 +1,69 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from hms.models import (
+    Diagnosis, DiagnosisArchive, Invoice, LabResults, LabResultsArchive, Sale, SaleArchive,
+)
+
+# model name -> (hot model, archive model, date field the period is cut on, copied fields)
+ARCHIVABLE = {
+    'sale': (Sale, SaleArchive, 'date', ('id', 'medicine_id', 'quantity', 'total_amount', 'date', 'updated_at')),
+    'diagnosis': (Diagnosis, DiagnosisArchive, 'created_at', (
+        'id', 'patient_id', 'doctor_id', 'symptoms', 'treatment_plan', 'diagnosis',
+        'prescribed_medicines', 'additional_notes', 'created_at', 'updated_at',
+    )),
+    'labresults': (LabResults, LabResultsArchive, 'created_at', ('id', 'lab_order_id', 'result', 'created_at', 'updated_at')),
+}
+
+
+class Command(BaseCommand):
+    help = "Move closed periods of Sale, Diagnosis and LabResults rows into their archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive rows dated before this day (YYYY-MM-DD).')
+        parser.add_argument('--months', type=int, default=12, help='Keep this many months hot when --before is not given.')
+        parser.add_argument('--model', choices=sorted(ARCHIVABLE), action='append', help='Limit to one model (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            cutoff = parse_date(options['before'])
+            if cutoff is None:
+                raise CommandError('--before must be YYYY-MM-DD.')
+        else:
+            # first day of a month, so only whole months leave the hot tables
+            today = timezone.now().date()
+            month = today.year * 12 + today.month - 1 - options['months']
+            cutoff = date(month // 12, month % 12 + 1, 1)
+        for name in options['model'] or sorted(ARCHIVABLE):
+            moved = self.archive(name, cutoff, options['batch_size'])
+            self.stdout.write(f"{name}: archived {moved} rows dated before {cutoff}.")
+
+    def archive(self, name, cutoff, batch_size):
+        model, archive_model, date_field, fields = ARCHIVABLE[name]
+        if date_field == 'date':
+            boundary = cutoff
+        else:
+            boundary = timezone.make_aware(datetime.combine(cutoff, time.min))
+        queryset = model.objects.filter(**{f'{date_field}__lt': boundary}).order_by('pk')
+        if model is Sale:
+            # an invoiced sale stays hot so the invoice keeps its link
+            queryset = queryset.exclude(pk__in=Invoice.objects.filter(sale__isnull=False).values('sale_id'))
+
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(queryset.select_for_update().values(*fields)[:batch_size])
+                if not rows:
+                    return moved
+                ids = [row['id'] for row in rows]
+                archive_model.objects.bulk_create([archive_model(**row) for row in rows], ignore_conflicts=True)
+                # a queryset delete doesn't call Sale.delete, which would put the stock back: the
+                # rows are moved, not removed. It still cascades to allocations and sends the
+                # delete signals, so sync clients get tombstones (/api/sync/ serves hot rows only).
+                model.objects.filter(pk__in=ids).delete()
+            moved += len(rows)
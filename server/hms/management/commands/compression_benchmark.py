@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from hms import middleware
+from hms.models import Appointments, Diagnosis, LabOders, LabResults, Medicine, Patient, Sale, User
+from hms.serializers import (
+    AppointmentSerializer, DiagnosisSerializer, LabOrderSerializer, LabResultSerializer, MedicineSerializer,
+    PatientSerializer, SaleSerializer, UserSerializer,
+)
+
+# the list endpoints' querysets and serializers, with every deferred field expanded
+PAYLOADS = {
+    'patients': (Patient.objects.order_by('-created_at'), PatientSerializer),
+    'diagnoses': (Diagnosis.objects.select_related('patient', 'doctor').order_by('-created_at'), DiagnosisSerializer),
+    'lab-results': (
+        LabResults.objects.select_related('lab_order', 'lab_order__patient', 'lab_order__doctor').order_by('-created_at'),
+        LabResultSerializer,
+    ),
+    'lab-orders': (LabOders.objects.select_related('patient', 'doctor').order_by('-created_at'), LabOrderSerializer),
+    'appointments': (Appointments.objects.select_related('patient', 'doctor').order_by('-date', '-time'), AppointmentSerializer),
+    'sales': (Sale.objects.select_related('medicine').order_by('-date'), SaleSerializer),
+    'medicines': (Medicine.objects.order_by('-created_at'), MedicineSerializer),
+    'users': (User.objects.order_by('-id'), UserSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = "Compare CPU time against bytes saved for each response encoding on real list payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, action='append',
+                            help='Rows per payload (repeatable; default: one page (25) and 500).')
+        parser.add_argument('--repeat', type=int, default=20, help='Compressions timed per measurement.')
+        parser.add_argument('--levels', default='', help='Extra levels to try, e.g. "gzip:1,gzip:9,br:11".')
+
+    def handle(self, *args, **options):
+        variants = [(name, middleware.COMPRESSION_LEVELS[name]) for name in middleware.available_encodings()]
+        for item in filter(None, options['levels'].split(',')):
+            name, _, level = item.partition(':')
+            if name in middleware.available_encodings():
+                variants.append((name, int(level)))
+        self.stdout.write(f"encodings: {', '.join(f'{n}:{l}' for n, l in variants)}")
+
+        for rows in options['rows'] or [25, 500]:
+            for label, (queryset, serializer_class) in PAYLOADS.items():
+                body = JSONRenderer().render(serializer_class(queryset[:rows], many=True).data)
+                if len(body) < 3:
+                    continue
+                self.stdout.write(f"{label} x{rows}: {len(body)} bytes")
+                for name, level in variants:
+                    cpu_ms, size = self.measure(name, level, body, options['repeat'])
+                    saved = len(body) - size
+                    self.stdout.write(
+                        f"    {name}:{level:<3} {size:>9} bytes ({size / len(body):6.1%})  "
+                        f"{cpu_ms:8.3f}ms cpu  {saved / max(cpu_ms, 1e-6) / 1024:9.1f} KiB saved per cpu-ms"
+                    )
+
+    def measure(self, name, level, body, repeat):
+        started = time.process_time()
+        for _ in range(repeat):
+            stream = middleware.COMPRESSORS[name](level)
+            size = len(stream.compress(body) + stream.flush())
+        return (time.process_time() - started) * 1000 / repeat, size
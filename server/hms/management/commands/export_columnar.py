@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hms import exports
+
+
+class Command(BaseCommand):
+    help = "Write new Sale/Medicine/Diagnosis/Appointments/LabResults rows to day-partitioned Parquet or Arrow files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Root directory; each export gets <output>/<name>/day=YYYY-MM-DD/.')
+        parser.add_argument('--model', choices=sorted(exports.EXPORTS), action='append',
+                            help='Export only this one (repeatable; default: all).')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='parquet')
+        parser.add_argument('--batch-size', type=int, default=exports.EXPORT_BATCH_SIZE, help='Rows per record batch.')
+        parser.add_argument('--since', default=None,
+                            help='Start after this watermark (<ISO value>|<id>) instead of the stored one.')
+
+    def handle(self, *args, **options):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise CommandError('Columnar exports need the pyarrow package.')
+        try:
+            since = exports.parse_watermark(options['since'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name in options['model'] or list(exports.EXPORTS):
+            rows, files, watermark = exports.export_to_directory(
+                name, options['output'], fmt=options['format'], batch_size=options['batch_size'], watermark=since,
+            )
+            self.stdout.write(f"{name}: {rows} rows in {files} files, watermark {exports.format_watermark(watermark) or '-'}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from hms import audit
+
+
+class Command(BaseCommand):
+    help = "Load audit events spooled to disk (HMS_AUDIT_SPOOL_DIR) into the audit table."
+
+    def handle(self, *args, **options):
+        loaded = audit.load_spool()
+        self.stdout.write(f"Loaded {loaded} spooled audit events.")
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from hms import renderers
+from hms.management.commands.compression_benchmark import PAYLOADS
+
+
+class Command(BaseCommand):
+    help = "Compare serialize/encode time and size of JSON against MessagePack and Arrow on real rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per payload.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest is reported.')
+        parser.add_argument('--payload', choices=sorted(PAYLOADS), action='append',
+                            help='Payload to measure (repeatable; default: sales and lab-results).')
+
+    def handle(self, *args, **options):
+        formats = [('json', JSONRenderer(), False)]
+        for label, renderer_class, module in (('msgpack', renderers.MessagePackRenderer, 'msgpack'),
+                                              ('arrow', renderers.ArrowStreamRenderer, 'pyarrow')):
+            try:
+                __import__(module)
+            except ImportError:
+                self.stdout.write(f"{label}: skipped ({module} is not installed)")
+                continue
+            formats.append((label, renderer_class(), True))
+
+        for name in options['payload'] or ['sales', 'lab-results']:
+            queryset, serializer_class = PAYLOADS[name]
+            instances = list(queryset[:options['rows']])
+            self.stdout.write(f"{name}: {len(instances)} rows")
+            for label, renderer, native in formats:
+                serialize_ms, encode_ms, size = self.measure(serializer_class, instances, renderer, native, options['repeat'])
+                self.stdout.write(
+                    f"    {label:<8} serialize {serialize_ms:8.2f}ms  encode {encode_ms:8.2f}ms  {size:>10} bytes"
+                )
+
+    def measure(self, serializer_class, instances, renderer, native, repeat):
+        best_serialize = best_encode = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serializer = serializer_class(instances, many=True)
+            if native:
+                renderers.use_native_types(serializer)
+            data = serializer.data
+            serialized = time.perf_counter()
+            body = renderer.render(data)
+            encoded = time.perf_counter()
+            best_serialize = min(best_serialize, (serialized - started) * 1000)
+            best_encode = min(best_encode, (encoded - serialized) * 1000)
+        return best_serialize, best_encode, len(body)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from hms import idempotency, tasks
+
+
+class Command(BaseCommand):
+    help = "Run the DB-backed background task worker (hms.tasks)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Tasks run at once by this worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no due tasks remain.')
+        parser.add_argument('--purge-days', type=int, default=None, help='Delete finished tasks older than this many days and expired idempotency keys, then exit.')
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            removed = tasks.purge(options['purge_days'])
+            expired = idempotency.purge()
+            self.stdout.write(f"Purged {removed} finished tasks and {expired} expired idempotency keys.")
+            return
+        self.stdout.write(f"Task worker started (concurrency={options['concurrency']}).")
+        try:
+            tasks.run_worker(
+                concurrency=options['concurrency'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Task worker stopped.")
@@ -0,0 +1,136 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter per sample, so every figure is a cold start.
+PROBE = r'''
+import io, json, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+interface = sys.argv[3]
+if interface == 'asgi':
+    import asyncio
+    from django.core.asgi import get_asgi_application
+    app = get_asgi_application()
+else:
+    from django.core.wsgi import get_wsgi_application
+    app = get_wsgi_application()
+t2 = time.perf_counter()
+
+def wsgi_request(path, host):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': host,
+        'SERVER_PORT': '80', 'HTTP_HOST': host, 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+    status = []
+    body = app(environ, lambda s, headers, exc_info=None: status.append(s))
+    b''.join(body)
+    getattr(body, 'close', lambda: None)()
+    return status[0]
+
+def asgi_request(path, host):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', host.encode())], 'client': ('127.0.0.1', 0), 'server': (host, 80),
+    }
+    status, body = [], [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if body:
+            return body.pop()
+        # the client never disconnects; Django cancels this wait once the response is sent
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(str(message['status']))
+
+    asyncio.run(app(scope, receive, send))
+    return status[0]
+
+request = asgi_request if interface == 'asgi' else wsgi_request
+status = request(sys.argv[1], sys.argv[2])
+t3 = time.perf_counter()
+request(sys.argv[1], sys.argv[2])
+t4 = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (t1 - t0) * 1000, 'app_ms': (t2 - t1) * 1000,
+    'first_request_ms': (t3 - t2) * 1000, 'warm_request_ms': (t4 - t3) * 1000,
+    'ready_ms': (t3 - t0) * 1000,
+    'status': status, 'modules': len(sys.modules),
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = ("Measure cold-start cost (imports, django.setup, application, first request) for one or more settings "
+            "modules, under ASGI like the Procfile unless --interface wsgi.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settings-module', action='append', dest='modules',
+                            help='Settings module to measure (repeatable; default: api.settings and api.settings_api).')
+        parser.add_argument('--path', default='/api/patients/count/',
+                            help='Request path for the first request (the default answers 401 without touching the DB).')
+        parser.add_argument('--repeat', type=int, default=5, help='Cold starts per settings module; medians are reported.')
+        parser.add_argument('--top', type=int, default=10, help='Also list this many slowest imports (0 to skip).')
+        parser.add_argument('--interface', choices=('asgi', 'wsgi'), default='asgi',
+                            help='Application to build and call; the Procfile serves api.asgi (default: asgi).')
+
+    def handle(self, *args, **options):
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        for module in options['modules'] or ['api.settings', 'api.settings_api']:
+            samples = [self.sample(module, options['path'], host, options['interface']) for _ in range(options['repeat'])]
+            median = {key: statistics.median(s[key] for s in samples)
+                      for key in ('process_ms', 'ready_ms', 'setup_ms', 'app_ms', 'first_request_ms', 'warm_request_ms')}
+            self.stdout.write(
+                f"{module}: process {median['process_ms']:.0f}ms, first response after "
+                f"{median['ready_ms']:.0f}ms (django.setup {median['setup_ms']:.0f}ms, "
+                f"{options['interface']} app {median['app_ms']:.0f}ms, first request {median['first_request_ms']:.0f}ms "
+                f"{samples[0]['status']}), warm request {median['warm_request_ms']:.1f}ms, "
+                f"{samples[0]['modules']} modules loaded"
+            )
+            if options['top']:
+                for name, micros in self.slowest_imports(module, options['path'], host, options['interface'], options['top']):
+                    self.stdout.write(f"    {micros / 1000:7.1f}ms  {name}")
+
+    def run_probe(self, module, path, host, interface, *flags):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': module}
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, *flags, '-c', PROBE, path, host, interface],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        if proc.returncode:
+            raise CommandError(f"{module}: probe failed\n{proc.stderr[-2000:]}")
+        return proc, elapsed
+
+    def sample(self, module, path, host, interface):
+        proc, elapsed = self.run_probe(module, path, host, interface)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['process_ms'] = elapsed
+        return result
+
+    def slowest_imports(self, module, path, host, interface, top):
+        """Top-level imports by cumulative time, from one run under `python -X importtime`."""
+        proc, _ = self.run_probe(module, path, host, interface, '-X', 'importtime')
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # only modules imported directly by the probe; nested ones are part of their parent
+            if not name.startswith(' ') or name.startswith('  '):
+                continue
+            rows.append((name.strip(), int(cumulative)))
+        return sorted(rows, key=lambda row: -row[1])[:top]
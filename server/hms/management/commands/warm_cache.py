@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from hms import dashboard
+from hms.models import Sale
+from hms.views import (
+    DiagnosisViewSet, LabOrderViewSet, LabResultViewSet, SaleViewSet, UserViewSet,
+    sales_analytics_payload,
+)
+
+# the heaviest cached list endpoints, warmed at their default first page
+LIST_VIEWSETS = {
+    'diagnosis-list': DiagnosisViewSet,
+    'sale-list': SaleViewSet,
+    'lab-result-list': LabResultViewSet,
+    'lab-order-list': LabOrderViewSet,
+    'user-list': UserViewSet,
+}
+# query strings the web client sends with those pages (each variant is cached separately)
+LIST_PARAMS = {
+    'diagnosis-list': {'expand': 'diagnosis,symptoms,additional_notes'},
+    'lab-result-list': {'expand': 'result'},
+}
+
+
+class Command(BaseCommand):
+    help = "Pre-warm the dashboard snapshot, sales analytics and the heaviest list pages (run after deploys)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost',
+                            help='Host the cached list pages are served under (list cache keys include it).')
+        parser.add_argument('--secure', action='store_true', help='Warm the https:// variants of the list pages.')
+        parser.add_argument('--user', default=None, help='Email of the user to render list pages as (default: first admin).')
+
+    def handle(self, *args, **options):
+        dashboard.build_snapshot()
+        self.stdout.write("Warmed dashboard snapshot.")
+
+        today = timezone.now().date()
+        yesterday = today - timedelta(days=1)
+        for group_by in Sale.BREAKDOWN_GROUPINGS:
+            # the default view (all time) and the last closed 30 days
+            sales_analytics_payload(group_by)
+            sales_analytics_payload(group_by, yesterday - timedelta(days=29), yesterday)
+        self.stdout.write(f"Warmed sales analytics ({len(Sale.BREAKDOWN_GROUPINGS)} groupings).")
+
+        User = get_user_model()
+        users = User.objects.filter(is_active=True)
+        user = users.filter(email=options['user']).first() if options['user'] else users.filter(role='admin').first()
+        if user is None:
+            self.stdout.write("No user to render list pages as; skipped list pages.")
+            return
+        factory = APIRequestFactory()
+        for url_name, viewset in LIST_VIEWSETS.items():
+            request = factory.get(reverse(url_name), LIST_PARAMS.get(url_name), SERVER_NAME=options['host'], secure=options['secure'])
+            force_authenticate(request, user=user)
+            response = viewset.as_view({'get': 'list'})(request)
+            self.stdout.write(f"Warmed {reverse(url_name)} ({response.status_code}).")
@@ -0,0 +1,129 @@
+"""Blocking keys and scoring for patient duplicate detection.
+
+Patients are only compared within a block: the same normalized phone number, or the same
+name key (Soundex of both names, order-independent) plus date of birth. Both keys are stored
+and indexed on Patient, so finding candidates is a GROUP BY or an index lookup, never a
+comparison of every pair.
+"""
+import re
+
+# trailing digits kept from a phone number; drops country codes and trunk prefixes
+# (+254 712 345 678, 0712345678 and 712-345-678 share a key)
+PHONE_KEY_DIGITS = 9
+# pairs scoring at least this are reported by the duplicates scan
+DUPLICATE_MIN_SCORE = 0.6
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) < 7:
+        return ''
+    return digits[-PHONE_KEY_DIGITS:]
+
+
+def soundex(word):
+    letters = re.sub(r'[^a-z]', '', (word or '').lower())
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = _SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = _SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w don't separate letters with the same code; vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def name_key(first_name, last_name):
+    """Soundex of both names, sorted so swapped first/last names share a key."""
+    codes = sorted(code for code in (soundex(first_name), soundex(last_name)) if code)
+    return '-'.join(codes)
+
+
+def _full_name(patient):
+    return ' '.join(sorted(f"{patient.first_name} {patient.last_name}".lower().split()))
+
+
+def score(a, b):
+    """How likely two patients are the same person (0..1), and which fields agree."""
+    reasons = []
+    total = 0.0
+    if a.phone_key and a.phone_key == b.phone_key:
+        total += 0.35
+        reasons.append('phone')
+    if a.date_of_birth == b.date_of_birth:
+        total += 0.3
+        reasons.append('date_of_birth')
+    if a.email and b.email and a.email.lower() == b.email.lower():
+        total += 0.15
+        reasons.append('email')
+    from difflib import SequenceMatcher  # only the duplicates scan needs it
+
+    similarity = SequenceMatcher(None, _full_name(a), _full_name(b)).ratio()
+    total += 0.35 * similarity
+    if similarity >= 0.85:
+        reasons.append('name')
+    return min(round(total, 3), 1.0), reasons
+
+
+def find_duplicates(patients_by_block, min_score=DUPLICATE_MIN_SCORE):
+    """Score pairs inside each block and join matching pairs into clusters.
+
+    Args:
+        patients_by_block (iterable): lists of Patient instances sharing a blocking key
+        min_score (float): pairs scoring below this are ignored
+
+    Returns:
+        list[dict]: `patients` (Patient instances), best pair `score` and the fields that
+        matched, highest score first
+    """
+    parent = {}
+
+    def find(pk):
+        while parent.setdefault(pk, pk) != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    members, best = {}, {}
+    for block in patients_by_block:
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                if (a.pk, b.pk) in best:
+                    continue
+                value, reasons = score(a, b)
+                if value < min_score:
+                    continue
+                members[a.pk], members[b.pk] = a, b
+                root_a, root_b = find(a.pk), find(b.pk)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+                # a pair can share several blocks; score it once
+                best[(a.pk, b.pk)] = (value, reasons)
+
+    clusters = {}
+    for pk, patient in members.items():
+        clusters.setdefault(find(pk), {'patients': [], 'score': 0.0, 'matched_on': set()})['patients'].append(patient)
+    for (pk, _), (value, reasons) in best.items():
+        cluster = clusters[find(pk)]
+        cluster['score'] = max(cluster['score'], value)
+        cluster['matched_on'].update(reasons)
+    results = sorted(clusters.values(), key=lambda cluster: -cluster['score'])
+    for cluster in results:
+        cluster['patients'].sort(key=lambda patient: patient.pk)
+        cluster['matched_on'] = sorted(cluster['matched_on'])
+    return results
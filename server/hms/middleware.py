@@ -0,0 +1,163 @@
+"""Response compression negotiated from Accept-Encoding: zstd, Brotli or gzip.
+
+Replaces django.middleware.gzip.GZipMiddleware. Bodies under HMS_COMPRESSION_MIN_BYTES and
+content types that don't shrink are sent as-is, streaming responses are compressed chunk by
+chunk, and list pages served by CachedListMixin keep their compressed bytes in the cache next
+to the page so a hot page is compressed once per encoding rather than once per request.
+zstd and Brotli need the optional `zstandard` / `brotli` packages; without them only gzip is
+offered.
+"""
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+# fast levels: the CPU is spent on every uncached response inside the worker
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/msgpack', 'application/vnd.apache.arrow.stream', 'application/csv')
+# an event stream has to reach the client event by event
+SKIPPED_TYPES = ('text/event-stream',)
+
+
+class _Stream:
+    def __init__(self, compress, flush):
+        self.compress = compress
+        self.flush = flush
+
+
+def _gzip(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def _brotli(level):
+    import brotli
+    compressor = brotli.Compressor(quality=level)
+    return _Stream(compressor.process, compressor.finish)
+
+
+def _zstd(level):
+    import zstandard
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+COMPRESSORS = {'zstd': _zstd, 'br': _brotli, 'gzip': _gzip}
+
+
+@lru_cache(maxsize=None)
+def available_encodings():
+    """Encodings from HMS_COMPRESSION_ENCODINGS (in preference order) whose libraries import."""
+    found = []
+    for name in settings.HMS_COMPRESSION_ENCODINGS:
+        try:
+            COMPRESSORS[name](1)
+        except ImportError:
+            continue
+        found.append(name)
+    return tuple(found)
+
+
+def negotiate(accept_encoding, encodings=None):
+    """Pick the encoding to use for an Accept-Encoding header, or None for identity."""
+    encodings = available_encodings() if encodings is None else encodings
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().lower().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = accepted.get(name, accepted.get('*', 0.0))
+        # strictly greater: ties go to the earlier (preferred) encoding
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(encoding, data):
+    stream = COMPRESSORS[encoding](COMPRESSION_LEVELS[encoding])
+    return stream.compress(data) + stream.flush()
+
+
+def compress_stream(encoding, chunks):
+    stream = COMPRESSORS[encoding](COMPRESSION_LEVELS[encoding])
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+async def acompress_stream(encoding, chunks):
+    stream = COMPRESSORS[encoding](COMPRESSION_LEVELS[encoding])
+    async for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type.startswith(SKIPPED_TYPES) or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < settings.HMS_COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(encoding, response.streaming_content)
+            else:
+                response.streaming_content = compress_stream(encoding, response.streaming_content)
+            # the compressed size isn't known until the stream ends
+            del response.headers['Content-Length']
+        else:
+            body = self.compressed_body(response, encoding)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response.headers['Content-Length'] = str(len(body))
+
+        # a strong ETag names the identity bytes; the compressed body gets a weak one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def compressed_body(self, response, encoding):
+        # set by CachedListMixin; the ETag identifies the exact body that was cached
+        key = getattr(response, 'compression_cache_key', None)
+        etag = response.get('ETag')
+        if not key or not etag:
+            return compress(encoding, response.content)
+        cache_key = f"{key}:{encoding}:{etag}"
+        body = cache.get(cache_key)
+        if body is None:
+            body = compress(encoding, response.content)
+            cache.set(cache_key, body, response.compression_cache_timeout)
+        return body
@@ -3,6 +3,19 @@
 from django.db import migrations, models
 
 
+class PostgresOnlyRunSQL(migrations.RunSQL):
+    """RunSQL that is a no-op off PostgreSQL; other backends (the local SQLite fallback)
+    store JSON as text already, so there is nothing to convert."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -16,7 +29,7 @@ class Migration(migrations.Migration):
         # ALTER COLUMN ... TYPE json/jsonb cast to fail. We add a new
         # jsonb column, populate it using to_jsonb(...) which wraps text
         # values into JSON strings, then swap columns.
-        migrations.RunSQL(
+        PostgresOnlyRunSQL(
             sql='''
             -- Add a temporary jsonb column
             ALTER TABLE hms_labresults ADD COLUMN result_json jsonb;
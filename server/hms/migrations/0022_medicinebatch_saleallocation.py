@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-19 02:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0021_alter_sale_date_alter_user_role_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='appointments',
+            options={'ordering': ['-date', '-time']},
+        ),
+        migrations.RemoveField(
+            model_name='laboders',
+            name='notes',
+        ),
+        migrations.CreateModel(
+            name='MedicineBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_number', models.CharField(max_length=50)),
+                ('expiry_date', models.DateField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='hms.medicine')),
+            ],
+            options={
+                'ordering': ['expiry_date', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='hms.medicinebatch')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='hms.sale')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='medicinebatch',
+            index=models.Index(fields=['medicine', 'expiry_date'], name='hms_medicin_medicin_3a1eb9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicinebatch',
+            index=models.Index(fields=['expiry_date'], name='hms_medicin_expiry__0a1fdf_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-19 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0022_medicinebatch_saleallocation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date', 'medicine'], name='hms_sale_date_090c6d_idx'),
+        ),
+    ]
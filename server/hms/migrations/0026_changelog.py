@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-19 02:49
+
+from django.db import migrations, models
+
+SYNCED_MODELS = ('patient', 'appointments', 'diagnosis', 'laboders', 'labresults', 'medicine', 'sale')
+
+
+def backfill_changelog(apps, schema_editor):
+    # existing rows get one 'created' entry each so a first sync from cursor 0 sees everything
+    ChangeLog = apps.get_model('hms', 'ChangeLog')
+    for name in SYNCED_MODELS:
+        model = apps.get_model('hms', name)
+        ids = model.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=2000)
+        batch = []
+        for pk in ids:
+            batch.append(ChangeLog(model=f'hms.{name}', object_id=pk, action='created'))
+            if len(batch) >= 2000:
+                ChangeLog.objects.bulk_create(batch)
+                batch = []
+        ChangeLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0025_updated_at_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),
+                ('created_seq', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id'], name='hms_changel_model_045843_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_changelog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-19 02:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0027_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('symptoms', models.TextField()),
+                ('treatment_plan', models.TextField()),
+                ('diagnosis', models.TextField()),
+                ('prescribed_medicines', models.JSONField(default=list)),
+                ('additional_notes', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_diagnoses', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_diagnoses', to='hms.patient')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LabResultsArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('result', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('lab_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_results', to='hms.laboders')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SaleArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateField(db_index=True)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_sales', to='hms.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'medicine'], name='hms_salearc_date_6ad3a9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.3 on 2026-10-19 02:58
+
+import hms.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0028_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='diagnosis',
+            name='additional_notes',
+            field=hms.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='diagnosis',
+            name='diagnosis',
+            field=hms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='diagnosis',
+            name='symptoms',
+            field=hms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='diagnosis',
+            name='treatment_plan',
+            field=hms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='diagnosisarchive',
+            name='additional_notes',
+            field=hms.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='diagnosisarchive',
+            name='diagnosis',
+            field=hms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='diagnosisarchive',
+            name='symptoms',
+            field=hms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='diagnosisarchive',
+            name='treatment_plan',
+            field=hms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='labresults',
+            name='result',
+            field=hms.fields.CompressedJSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='labresultsarchive',
+            name='result',
+            field=hms.fields.CompressedJSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='medical_history',
+            field=hms.fields.CompressedTextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:00
+
+from django.db import migrations, models
+
+from hms import matching
+
+
+def backfill_blocking_keys(apps, schema_editor):
+    Patient = apps.get_model('hms', 'Patient')
+    batch = []
+    for patient in Patient.objects.order_by('pk').only('first_name', 'last_name', 'phone').iterator(chunk_size=2000):
+        patient.phone_key = matching.normalize_phone(patient.phone)
+        patient.name_key = matching.name_key(patient.first_name, patient.last_name)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['phone_key', 'name_key'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['phone_key', 'name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0029_compressed_clinical_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['name_key', 'date_of_birth'], name='hms_patient_name_ke_f093cb_idx'),
+        ),
+        migrations.RunPython(backfill_blocking_keys, migrations.RunPython.noop),
+    ]
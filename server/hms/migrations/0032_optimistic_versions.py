@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0031_doctor_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointments',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='laboders',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:37
+
+from django.db import migrations, models
+
+
+def drop_duplicate_queued_tasks(apps, schema_editor):
+    # the old check-then-insert could queue a task twice; keep the oldest of each
+    Task = apps.get_model('hms', 'Task')
+    seen = set()
+    duplicates = []
+    for pk, name, key in (Task.objects.filter(status='queued', dedupe_key__isnull=False)
+                          .order_by('id').values_list('id', 'name', 'dedupe_key')):
+        if (name, key) in seen:
+            duplicates.append(pk)
+        seen.add((name, key))
+    Task.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0034_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_queued_tasks, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='hms_task_dedupe__4222c4_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('name', 'dedupe_key'), name='task_queued_dedupe_unique'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0035_task_dedupe_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.BinaryField()),
+                ('etag', models.CharField(max_length=40)),
+                ('generated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0036_dashboard_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='saleallocation',
+            name='batch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='allocations', to='hms.medicinebatch'),
+        ),
+    ]
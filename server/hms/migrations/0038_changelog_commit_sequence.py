@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:45
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_entries(apps, schema_editor):
+    # cursors handed out so far are ids; existing entries keep them as their sequence number
+    ChangeLog = apps.get_model('hms', 'ChangeLog')
+    ChangeLogSequence = apps.get_model('hms', 'ChangeLogSequence')
+    ChangeLog.objects.update(seq=F('id'))
+    last = ChangeLog.objects.aggregate(last=Max('id'))['last'] or 0
+    ChangeLogSequence.objects.create(pk=1, last=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hms', '0037_saleallocation_restrict_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='seq',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing_entries, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,58 @@
 from django.db import models, transaction
-from django.db.models import F, Sum
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from datetime import datetime, time, timedelta
 from decimal import Decimal
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.forms import ValidationError
-from rest_framework.response import Response
+from .fields import CompressedJSONField, CompressedTextField
+from . import availability, matching
+
+# Batches fetched per round trip while walking FEFO order in Sale._allocate_batches
+BATCH_ALLOCATION_CHUNK = 20
+
+
+class VersionConflict(Exception):
+    """The row was changed (or deleted) by someone else since this instance was read."""
+
+
+class VersionedModel(models.Model):
+    """Optimistic concurrency through a `version` counter instead of row locks.
+
+    Saving an existing row is a compare-and-swap, `UPDATE ... SET version = v + 1 WHERE id = ?
+    AND version = v` with `v` the version the instance was read at; if another writer got there
+    first no row matches and VersionConflict is raised. Queryset `.update()` calls on these
+    models bump the counter themselves with `version=F('version') + 1`.
+    """
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        self._read_version = self.version
+        self.version += 1
+        try:
+            super().save(*args, **kwargs)
+        except VersionConflict:
+            self.version = self._read_version
+            raise
+        finally:
+            del self._read_version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        read_version = getattr(self, '_read_version', None)
+        if read_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        # a miss must not fall through to Django's INSERT
+        if not super()._do_update(base_qs.filter(version=read_version), using, pk_val, values, update_fields, forced_update):
+            raise VersionConflict(f"{self._meta.label} {pk_val} is no longer at version {read_version}.")
+        return True
 
 
 class CustomUserManager(BaseUserManager):
@@ -18,6 +67,37 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def allocate_usernames(self, bases):
+        """Free usernames for `bases` (one per entry, in order) from a single prefix query.
+
+        A taken base gets the next numeric suffix after the highest one in use (`john`,
+        `john3` taken -> `john4`); repeated bases within the list get consecutive suffixes.
+        Two concurrent allocations can still pick the same name; the unique constraint on
+        username catches that and the caller retries.
+        """
+        bases = [base[:140] for base in bases]
+        distinct = set(bases)
+        prefixes = Q()
+        for base in distinct:
+            prefixes |= Q(username__startswith=base)
+        taken, highest = set(), {}
+        for username in (self.filter(prefixes).values_list('username', flat=True) if distinct else ()):
+            taken.add(username)
+            for base in distinct:
+                suffix = username[len(base):]
+                if username.startswith(base) and suffix.isdigit():
+                    highest[base] = max(highest.get(base, 0), int(suffix))
+        allocated = []
+        for base in bases:
+            if base not in taken:
+                username = base
+            else:
+                highest[base] = highest.get(base, 0) + 1
+                username = f"{base}{highest[base]}"
+            taken.add(username)
+            allocated.append(username)
+        return allocated
+
     def create_superuser(self, email, username, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
@@ -38,6 +118,7 @@ class User(AbstractUser):
     specialization = models.CharField(max_length=100, blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.CharField(max_length=255, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     groups = models.ManyToManyField(
         'auth.Group',
         related_name='customuser_set',
@@ -66,7 +147,7 @@ class User(AbstractUser):
 
 
 
-class Patient(models.Model):
+class Patient(VersionedModel):
     GENDER_CHOICES = [
         ('male', 'Male'),
         ('female', 'Female'),
@@ -84,7 +165,7 @@ class Patient(models.Model):
     emergency_contact_name = models.CharField(max_length=100)
     emergency_contact_phone = models.CharField(max_length=20)
     emergency_contact_relationship = models.CharField(max_length=50)
-    medical_history = models.TextField(blank=True, null=True)
+    medical_history = CompressedTextField(blank=True, null=True)
     # Payment status for patient-level billing (e.g., upfront registration fees)
     PAYMENT_STATUS_CHOICES = [
         ('paid', 'Paid'),
@@ -92,6 +173,89 @@ class Patient(models.Model):
     ]
     payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='not_paid')
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # conditional GET validators (ETag/Last-Modified) are built from MAX(updated_at)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # duplicate-detection blocking keys (hms.matching), derived on save
+    phone_key = models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
+    name_key = models.CharField(max_length=16, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['name_key', 'date_of_birth'])]
+
+    def save(self, *args, **kwargs):
+        self.phone_key = matching.normalize_phone(self.phone)
+        self.name_key = matching.name_key(self.first_name, self.last_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'phone_key', 'name_key'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def possible_duplicates(cls, first_name, last_name, phone, date_of_birth, exclude=None, limit=5):
+        """Existing patients sharing a blocking key with these details (one indexed lookup)."""
+        match = Q(name_key=matching.name_key(first_name, last_name), date_of_birth=date_of_birth)
+        phone_key = matching.normalize_phone(phone)
+        if phone_key:
+            match |= Q(phone_key=phone_key)
+        qs = cls.objects.filter(match)
+        if exclude is not None:
+            qs = qs.exclude(pk=exclude)
+        return list(qs.order_by('pk')[:limit])
+
+    @classmethod
+    def duplicate_clusters(cls, min_score=matching.DUPLICATE_MIN_SCORE):
+        """Likely duplicate registrations, compared only within shared phone or name+DOB blocks."""
+        phones = (
+            cls.objects.exclude(phone_key='').values('phone_key')
+            .annotate(n=Count('id')).filter(n__gt=1).values('phone_key')
+        )
+        names = (
+            cls.objects.exclude(name_key='').values('name_key', 'date_of_birth')
+            .annotate(n=Count('id')).filter(n__gt=1)
+        )
+        name_blocks = {(row['name_key'], row['date_of_birth']) for row in names}
+        candidates = cls.objects.filter(
+            Q(phone_key__in=phones) | Q(name_key__in={key for key, _ in name_blocks})
+        ).order_by('pk')
+        blocks = {}
+        for patient in candidates:
+            if patient.phone_key:
+                blocks.setdefault(('phone', patient.phone_key), []).append(patient)
+            if (patient.name_key, patient.date_of_birth) in name_blocks:
+                blocks.setdefault(('name', patient.name_key, patient.date_of_birth), []).append(patient)
+        return matching.find_duplicates(
+            (block for block in blocks.values() if len(block) > 1), min_score=min_score,
+        )
+
+    def merge(self, duplicate):
+        """Fold `duplicate` into this patient: re-point its records, fill blank fields, delete it."""
+        if duplicate.pk == self.pk:
+            raise ValidationError({'duplicate': 'A patient cannot be merged into itself.'})
+        now = timezone.now()
+        with transaction.atomic():
+            for model in (Diagnosis, Appointments, LabOders):
+                moved = list(model.objects.filter(patient=duplicate).values_list('pk', flat=True))
+                changes = {'patient': self, 'updated_at': now}
+                if issubclass(model, VersionedModel):
+                    changes['version'] = F('version') + 1
+                model.objects.filter(pk__in=moved).update(**changes)
+                for pk in moved:
+                    ChangeLog.record(model, pk, 'updated')
+            Invoice.objects.filter(patient=duplicate).update(patient=self, updated_at=now)
+            DiagnosisArchive.objects.filter(patient=duplicate).update(patient=self)
+
+            for field in ('email', 'address', 'emergency_contact_name', 'emergency_contact_phone',
+                          'emergency_contact_relationship'):
+                if not getattr(self, field) and getattr(duplicate, field):
+                    setattr(self, field, getattr(duplicate, field))
+            if duplicate.medical_history and duplicate.medical_history != self.medical_history:
+                self.medical_history = '\n\n'.join(filter(None, [self.medical_history, duplicate.medical_history]))
+            if duplicate.payment_status == 'paid':
+                self.payment_status = 'paid'
+            # the duplicate goes first so its (unique) email can move over
+            duplicate.delete()
+            self.save()
+        return self
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -103,6 +267,7 @@ class Medicine(models.Model):
     stock = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         # index category to speed category filters and name to help searches
@@ -114,21 +279,77 @@ class Medicine(models.Model):
     def __str__(self):
         return self.name
 
+class MedicineBatch(models.Model):
+    """A received lot of a medicine. `Medicine.stock` stays the aggregate counter;
+    batches record which lot (and expiry) that stock belongs to."""
+    medicine = models.ForeignKey('Medicine', on_delete=models.CASCADE, related_name='batches')
+    lot_number = models.CharField(max_length=50)
+    expiry_date = models.DateField()
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ['expiry_date', 'id']
+        # (medicine, expiry) serves FEFO allocation; expiry alone serves the expiring-soon report
+        indexes = [
+            models.Index(fields=['medicine', 'expiry_date']),
+            models.Index(fields=['expiry_date']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Receiving a batch adds to the medicine's stock counter; edits adjust it by the difference
+        with transaction.atomic():
+            if self.pk:
+                old = MedicineBatch.objects.select_for_update().get(pk=self.pk)
+                if old.medicine_id != self.medicine_id:
+                    _adjust_stock(old.medicine_id, -old.quantity)
+                    _adjust_stock(self.medicine_id, self.quantity)
+                else:
+                    _adjust_stock(self.medicine_id, self.quantity - old.quantity)
+            else:
+                _adjust_stock(self.medicine_id, self.quantity)
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        if self.allocations.exists():
+            raise ValidationError({'detail': 'Sales were drawn from this batch; set its quantity to 0 instead of deleting it.'})
+        # Whatever is left in the batch leaves the stock counter with it
+        with transaction.atomic():
+            _adjust_stock(self.medicine_id, -self.quantity)
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.medicine_id} lot {self.lot_number} (exp {self.expiry_date})"
+
+
+def _adjust_stock(medicine_id, delta):
+    """Add `delta` to a medicine's stock counter, refusing to take it below zero."""
+    if delta > 0:
+        Medicine.objects.filter(pk=medicine_id).update(stock=F('stock') + delta, updated_at=timezone.now())
+    elif delta < 0:
+        updated = Medicine.objects.filter(pk=medicine_id, stock__gte=-delta).update(stock=F('stock') + delta, updated_at=timezone.now())
+        if not updated:
+            raise ValidationError({'quantity': 'Batch quantity exceeds the medicine stock on hand.'})
+    if delta:
+        ChangeLog.record(Medicine, medicine_id, 'updated')
+
 class Diagnosis(models.Model):
     patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='diagnoses')
     doctor = models.ForeignKey('User', on_delete=models.CASCADE,null=True,blank=True, related_name='diagnoses')
-    symptoms = models.TextField()
-    treatment_plan = models.TextField()
-    diagnosis = models.TextField()
+    symptoms = CompressedTextField()
+    treatment_plan = CompressedTextField()
+    diagnosis = CompressedTextField()
     prescribed_medicines = models.JSONField(default=list)
-    additional_notes = models.TextField(null=True, blank=True)
+    additional_notes = CompressedTextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Diagnosis for {self.patient_name} by {self.doctor_name} on {self.date}"
 
 ##Added
-class LabOders(models.Model):
+class LabOders(VersionedModel):
     CHOICES = [
         ('sample_collected', 'Sample Collected'),
         ('pending', 'Pending'),
@@ -143,18 +364,18 @@ class LabOders(models.Model):
     status = models.CharField(max_length=20, choices=CHOICES, default='sample_collected')
     # Track when the lab order was created/updated
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 class LabResults(models.Model):
     lab_order = models.ForeignKey('LabOders', on_delete=models.CASCADE, related_name='LabOrder')
     # result = models.TextField()
-    result = models.JSONField(default=list, blank=True)
+    result = CompressedJSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     # also track updates
     updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
-class Appointments(models.Model):
+class Appointments(VersionedModel):
     patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='appointments')
     doctor = models.ForeignKey('User', on_delete=models.CASCADE, related_name='appointments')
     date = models.DateTimeField()
@@ -170,10 +391,96 @@ class Appointments(models.Model):
         ('not_paid', 'Not Paid'),
     ]
     payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='not_paid')
-    # index appointments by date for faster calendar queries
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # index appointments by date for faster calendar queries;
+    # (doctor, date) serves the per-doctor range read behind slot availability
     class Meta:
         ordering = ['-date', '-time']
-        indexes = [models.Index(fields=['date'])]
+        indexes = [models.Index(fields=['date']), models.Index(fields=['doctor', 'date'])]
+
+
+class DoctorSchedule(models.Model):
+    """A doctor's working hours on one weekday, cut into bookable slots of `slot_minutes`.
+
+    A doctor may have several rows per weekday (e.g. a morning and an afternoon session);
+    they may not overlap.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    doctor = models.ForeignKey('User', on_delete=models.CASCADE, related_name='schedules')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ['doctor', 'weekday', 'start_time']
+        indexes = [models.Index(fields=['doctor', 'weekday'])]
+
+    def clean(self):
+        if self.start_time is None or self.end_time is None:
+            return
+        if self.end_time <= self.start_time:
+            raise ValidationError({'end_time': 'End time must be after start time.'})
+        if not self.slot_minutes:
+            raise ValidationError({'slot_minutes': 'Slot length must be at least one minute.'})
+        length = (datetime.combine(datetime.min, self.end_time) - datetime.combine(datetime.min, self.start_time))
+        if timedelta(minutes=self.slot_minutes) > length:
+            raise ValidationError({'slot_minutes': 'Slot length is longer than the working hours.'})
+        if self.doctor_id is not None and getattr(self.doctor, 'role', None) != 'doctor':
+            raise ValidationError({'doctor': 'Schedules can only be set for doctors.'})
+        overlapping = DoctorSchedule.objects.filter(
+            doctor_id=self.doctor_id, weekday=self.weekday,
+            start_time__lt=self.end_time, end_time__gt=self.start_time,
+        ).exclude(pk=self.pk)
+        if overlapping.exists():
+            raise ValidationError({'start_time': 'Overlaps another schedule for this doctor on the same day.'})
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def free_slots(cls, doctor_ids, first_day, last_day):
+        """Free slots for each doctor between two dates (inclusive).
+
+        Two queries whatever the number of doctors: their schedules, and one range read of
+        their live appointments over the (doctor, date) index. Slots that have already
+        started are left out.
+
+        Returns:
+            dict: doctor id -> [(day, [(start, end), ...]), ...]
+        """
+        schedules = {doctor_id: {} for doctor_id in doctor_ids}
+        rows = cls.objects.filter(doctor_id__in=doctor_ids).values_list(
+            'doctor_id', 'weekday', 'start_time', 'end_time', 'slot_minutes'
+        )
+        for doctor_id, weekday, start_time, end_time, slot_minutes in rows:
+            schedules[doctor_id].setdefault(weekday, []).append((start_time, end_time, slot_minutes))
+
+        bookings = {doctor_id: [] for doctor_id in doctor_ids}
+        start = timezone.make_aware(datetime.combine(first_day, time.min))
+        end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+        booked = Appointments.objects.filter(
+            doctor_id__in=doctor_ids, date__gte=start, date__lt=end,
+        ).exclude(status='canceled').values_list('doctor_id', 'date', 'time')
+        for doctor_id, day, start_time in booked:
+            # `date` carries the day and `time` the start; compare in local wall-clock time
+            bookings[doctor_id].append(datetime.combine(timezone.localtime(day).date(), start_time))
+
+        now = timezone.localtime().replace(tzinfo=None)
+        return {
+            doctor_id: availability.availability(schedules[doctor_id], bookings[doctor_id], first_day, last_day, not_before=now)
+            for doctor_id in doctor_ids
+        }
 
 
 class Sale(models.Model):
@@ -182,6 +489,21 @@ class Sale(models.Model):
     total_amount = models.DecimalField(max_digits=12, decimal_places=2)
     # index by date for faster range and calendar queries
     date = models.DateField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Groupings accepted by Sale.revenue_breakdown
+    PERIOD_TRUNCS = {
+        'day': TruncDay,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+    BREAKDOWN_GROUPINGS = ('day', 'week', 'month', 'medicine', 'category')
+    # cache_utils generation of the cached revenue breakdowns; bumped when a closed day's sales change
+    REVENUE_GENERATION = 'sales-revenue'
+
+    class Meta:
+        # (date, medicine) lets range-filtered GROUP BY medicine queries read from the index
+        indexes = [models.Index(fields=['date', 'medicine'])]
 
     @classmethod
     def total_revenue(cls, start_date=None, end_date=None):
@@ -194,29 +516,139 @@ class Sale(models.Model):
         Returns:
             Decimal: total revenue (two decimal places)
         """
-        qs = cls.objects.all()
-        if start_date:
-            qs = qs.filter(date__gte=start_date)
-        if end_date:
-            qs = qs.filter(date__lte=end_date)
-        total = qs.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+        total = Decimal('0.00')
+        # archived (closed-period) sales count toward revenue just like hot ones
+        for qs in (cls.objects.all(), SaleArchive.objects.all()):
+            if start_date:
+                qs = qs.filter(date__gte=start_date)
+            if end_date:
+                qs = qs.filter(date__lte=end_date)
+            total += qs.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
         # Ensure a Decimal with two decimal places
         try:
             return Decimal(total).quantize(Decimal('0.01'))
         except Exception:
             return Decimal('0.00')
 
+    @classmethod
+    def revenue_breakdown(cls, group_by='day', start_date=None, end_date=None, limit=None):
+        """Aggregate revenue, units and sale count per bucket in a single GROUP BY query.
+
+        Args:
+            group_by (str): one of BREAKDOWN_GROUPINGS. Time buckets come back oldest first,
+                medicine/category buckets highest revenue first.
+            start_date, end_date (date or str): inclusive date range, as in total_revenue
+            limit (int): keep only the first `limit` buckets (top-N sellers)
+
+        Returns:
+            list[dict]: one dict per bucket
+        """
+        if group_by not in cls.BREAKDOWN_GROUPINGS:
+            raise ValueError(f"Unsupported grouping: {group_by}")
+        if group_by in cls.PERIOD_TRUNCS:
+            columns = ('period',)
+        elif group_by == 'medicine':
+            columns = ('medicine_id', 'medicine__name', 'medicine__category')
+        else:
+            columns = ('medicine__category',)
+
+        def grouped(qs):
+            if start_date:
+                qs = qs.filter(date__gte=start_date)
+            if end_date:
+                qs = qs.filter(date__lte=end_date)
+            if group_by in cls.PERIOD_TRUNCS:
+                qs = qs.annotate(period=cls.PERIOD_TRUNCS[group_by]('date'))
+            return qs.values(*columns).annotate(
+                revenue=Sum('total_amount'),
+                units=Sum('quantity'),
+                sales_count=Count('id'),
+            )
+
+        if group_by in cls.PERIOD_TRUNCS:
+            ordering, sort_key = ['period'], lambda r: r['period']
+        else:
+            ordering = ['-revenue', columns[0]]
+            sort_key = lambda r: (-r['revenue'], r[columns[0]] or '')
+
+        archived = list(grouped(SaleArchive.objects.all()))
+        if not archived:
+            # the common case: everything in range is hot, so order and limit in SQL
+            qs = grouped(cls.objects.all()).order_by(*ordering)
+            return list(qs[:limit] if limit else qs)
+
+        # merge hot and archived buckets that share a key
+        merged = {}
+        for row in list(grouped(cls.objects.all())) + archived:
+            key = tuple(row[c] for c in columns)
+            if key in merged:
+                for field in ('revenue', 'units', 'sales_count'):
+                    merged[key][field] += row[field]
+            else:
+                merged[key] = dict(row)
+        rows = sorted(merged.values(), key=sort_key)
+        return rows[:limit] if limit else rows
+
     def clean(self):
         # Ensure quantity is positive (PositiveIntegerField already enforces >=0) and stock sufficiency
         if self.quantity <= 0:
             raise ValidationError({'quantity': 'Quantity must be greater than zero.'})
 
+    def _allocate_batches(self):
+        """Draw this sale's quantity from the medicine's batches, first-expiry-first-out.
+
+        A single locked query walks unexpired batches in (medicine, expiry) index order and is
+        read lazily, so only the batches actually drawn from are fetched. Any remainder is
+        taken from unbatched stock (stock recorded before batches existed); when there isn't
+        enough of that either, the rest of the stock is expired and the sale is refused.
+        """
+        remaining = self.quantity
+        now = timezone.now()
+        touched = []
+        allocations = []
+        batches = (
+            MedicineBatch.objects.select_for_update()
+            .filter(medicine_id=self.medicine_id, quantity__gt=0, expiry_date__gte=self.date)
+            .order_by('expiry_date', 'id')
+        )
+        for batch in batches.iterator(chunk_size=BATCH_ALLOCATION_CHUNK):
+            if remaining <= 0:
+                break
+            take = min(batch.quantity, remaining)
+            batch.quantity -= take
+            # bulk_update skips auto_now, so stamp the change ourselves
+            batch.updated_at = now
+            remaining -= take
+            touched.append(batch)
+            allocations.append(SaleAllocation(sale=self, batch=batch, quantity=take))
+        if touched:
+            MedicineBatch.objects.bulk_update(touched, ['quantity', 'updated_at'])
+            SaleAllocation.objects.bulk_create(allocations)
+        if remaining > 0:
+            # the stock counter was already reduced by the whole sale, so once the remainder is
+            # taken it must still cover every batch; if not, the remainder ate into expired lots
+            stock = Medicine.objects.filter(pk=self.medicine_id).values_list('stock', flat=True).get()
+            batched = MedicineBatch.objects.filter(medicine_id=self.medicine_id).aggregate(total=Sum('quantity'))['total'] or 0
+            if stock < batched:
+                raise ValidationError({'quantity': f'Only {self.quantity - remaining + max(stock - batched + remaining, 0)} units are in date for this sale; the rest of the stock has expired.'})
+
+    def _release_batches(self):
+        """Return previously allocated quantities to their batches."""
+        allocations = list(SaleAllocation.objects.filter(sale_id=self.pk))
+        for allocation in allocations:
+            MedicineBatch.objects.filter(pk=allocation.batch_id).update(quantity=F('quantity') + allocation.quantity, updated_at=timezone.now())
+        SaleAllocation.objects.filter(sale_id=self.pk).delete()
+
     def save(self, *args, **kwargs):
         # Adjust medicine stock atomically when creating or updating a Sale
         with transaction.atomic():
+            reallocate = True
             # If updating an existing sale, compute differences
             if self.pk:
                 old = Sale.objects.select_for_update().get(pk=self.pk)
+                reallocate = old.medicine_id != self.medicine_id or old.quantity != self.quantity or old.date != self.date
+                if reallocate:
+                    old._release_batches()
                 # If medicine changed, restore old medicine stock and deduct from new medicine
                 if old.medicine_id != self.medicine_id:
                     # Restore stock to old medicine
@@ -225,7 +657,7 @@ class Sale(models.Model):
                     old.medicine.save()
 
                     # Attempt to deduct from new medicine
-                    updated = Medicine.objects.filter(pk=self.medicine_id, stock__gte=self.quantity).update(stock=F('stock') - self.quantity)
+                    updated = Medicine.objects.filter(pk=self.medicine_id, stock__gte=self.quantity).update(stock=F('stock') - self.quantity, updated_at=timezone.now())
                     if not updated:
                         raise ValidationError({'medicine': 'Insufficient stock for the selected medicine.'})
                 else:
@@ -233,52 +665,485 @@ class Sale(models.Model):
                     diff = self.quantity - old.quantity
                     if diff > 0:
                         # need to reduce additional stock
-                        updated = Medicine.objects.filter(pk=self.medicine_id, stock__gte=diff).update(stock=F('stock') - diff)
+                        updated = Medicine.objects.filter(pk=self.medicine_id, stock__gte=diff).update(stock=F('stock') - diff, updated_at=timezone.now())
                         if not updated:
                             raise ValidationError({'quantity': 'Insufficient stock to increase sale quantity.'})
                     elif diff < 0:
                         # increase stock by -diff
-                        Medicine.objects.filter(pk=self.medicine_id).update(stock=F('stock') + (-diff))
+                        Medicine.objects.filter(pk=self.medicine_id).update(stock=F('stock') + (-diff), updated_at=timezone.now())
             else:
                 # New sale: deduct stock if available
-                updated = Medicine.objects.filter(pk=self.medicine_id, stock__gte=self.quantity).update(stock=F('stock') - self.quantity)
+                updated = Medicine.objects.filter(pk=self.medicine_id, stock__gte=self.quantity).update(stock=F('stock') - self.quantity, updated_at=timezone.now())
                 if not updated:
                     raise ValidationError({'medicine': 'Insufficient stock for the selected medicine.'})
 
             # Call full_clean to ensure model validation (will raise ValidationError if invalid)
             self.full_clean()
             super().save(*args, **kwargs)
+            if reallocate:
+                self._allocate_batches()
+            # stock moved through a queryset update, which doesn't send signals
+            ChangeLog.record(Medicine, self.medicine_id, 'updated')
 
     def delete(self, *args, **kwargs):
         # When a sale is deleted, restore stock
         with transaction.atomic():
-            # Restore stock for the associated medicine
-            Medicine.objects.filter(pk=self.medicine_id).update(stock=F('stock') + self.quantity)
+            # Restore stock for the associated medicine and its batches
+            Medicine.objects.filter(pk=self.medicine_id).update(stock=F('stock') + self.quantity, updated_at=timezone.now())
+            ChangeLog.record(Medicine, self.medicine_id, 'updated')
+            self._release_batches()
             return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"Sale for {self.medicine.name} on {self.date}"
 
 
+class SaleAllocation(models.Model):
+    """How much of a sale was drawn from each batch, so edits and deletes can give it back."""
+    sale = models.ForeignKey('Sale', on_delete=models.CASCADE, related_name='allocations')
+    # a batch that sales were drawn from can't be deleted out from under them (RESTRICT rather
+    # than PROTECT: deleting the medicine still removes its sales, allocations and batches together)
+    batch = models.ForeignKey('MedicineBatch', on_delete=models.RESTRICT, related_name='allocations')
+    quantity = models.PositiveIntegerField()
+
+
+class Invoice(models.Model):
+    """A billable amount owed by a patient: a registration fee, an appointment or a sale.
+
+    Payments against it are recorded as `Payment` rows; `amount_paid` and `status` are kept
+    in step by `Payment.save`/`Payment.delete`.
+    """
+    KIND_CHOICES = [
+        ('registration', 'Registration'),
+        ('appointment', 'Appointment'),
+        ('sale', 'Sale'),
+        ('other', 'Other'),
+    ]
+    STATUS_CHOICES = [
+        ('not_paid', 'Not Paid'),
+        ('partially_paid', 'Partially Paid'),
+        ('paid', 'Paid'),
+        ('void', 'Void'),
+    ]
+    OPEN_STATUSES = ('not_paid', 'partially_paid')
+    # columns each outstanding-balance grouping reports
+    OUTSTANDING_GROUPINGS = {
+        'patient': ('patient_id', 'patient__first_name', 'patient__last_name'),
+        'doctor': ('doctor_id', 'doctor__name'),
+    }
+    # cache_utils generation of the cached as-of balances; bumped when a closed day's rows change
+    LEDGER_GENERATION = 'invoice-ledger'
+
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, null=True, blank=True, related_name='invoices')
+    doctor = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
+    appointment = models.ForeignKey('Appointments', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
+    sale = models.ForeignKey('Sale', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='other')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='not_paid')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        # billing screens filter open invoices by age; outstanding aggregates scan by status
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def _derived_status(self):
+        if self.amount_paid >= self.amount:
+            return 'paid'
+        if self.amount_paid > 0:
+            return 'partially_paid'
+        return 'not_paid'
+
+    def save(self, *args, **kwargs):
+        if self.status != 'void':
+            self.status = self._derived_status()
+        # an appointment invoice bills that appointment's doctor unless told otherwise
+        if self.appointment_id and not self.doctor_id:
+            self.doctor_id = Appointments.objects.filter(pk=self.appointment_id).values_list('doctor_id', flat=True).first()
+        super().save(*args, **kwargs)
+        self._sync_payment_flags()
+
+    def _sync_payment_flags(self):
+        # Keep the legacy paid/not_paid flags on Appointments and Patient in line with the ledger
+        flag = 'paid' if self.status == 'paid' else 'not_paid'
+        if self.appointment_id:
+            Appointments.objects.filter(pk=self.appointment_id).update(payment_status=flag, version=F('version') + 1, updated_at=timezone.now())
+            ChangeLog.record(Appointments, self.appointment_id, 'updated')
+        if self.kind == 'registration' and self.patient_id:
+            Patient.objects.filter(pk=self.patient_id).update(payment_status=flag, version=F('version') + 1, updated_at=timezone.now())
+            ChangeLog.record(Patient, self.patient_id, 'updated')
+
+    @classmethod
+    def outstanding_by(cls, group_by='patient', as_of=None):
+        """Outstanding balance per patient or per doctor, aggregated in SQL.
+
+        Args:
+            group_by (str): 'patient' or 'doctor'
+            as_of (date): report balances at the end of that day instead of now. These only
+                change when an invoice or payment from that day or earlier is edited, voided or
+                deleted, which bumps LEDGER_GENERATION (hms.signals), so they are cached by it.
+
+        Returns:
+            list[dict]: grouping columns plus `outstanding` (Decimal) and `invoice_count`,
+            largest balance first
+        """
+        columns = cls.OUTSTANDING_GROUPINGS[group_by]
+        invoices = cls.objects.exclude(status='void')
+        if as_of is None:
+            rows = (
+                invoices.filter(status__in=cls.OPEN_STATUSES)
+                .values(*columns)
+                .annotate(outstanding=Sum(F('amount') - F('amount_paid')), invoice_count=Count('id'))
+                .order_by('-outstanding')
+            )
+            return list(rows)
+
+        cutoff = timezone.make_aware(datetime.combine(as_of + timedelta(days=1), time.min))
+        billed = (
+            invoices.filter(created_at__lt=cutoff)
+            .values(*columns)
+            .annotate(billed=Sum('amount'), invoice_count=Count('id'))
+        )
+        paid = {
+            row[f'invoice__{columns[0]}']: row['paid']
+            for row in Payment.objects.filter(created_at__lt=cutoff, invoice__created_at__lt=cutoff)
+            .exclude(invoice__status='void')
+            .values(f'invoice__{columns[0]}')
+            .annotate(paid=Sum('amount'))
+        }
+        rows = []
+        for row in billed:
+            row['outstanding'] = row.pop('billed') - paid.get(row[columns[0]], Decimal('0.00'))
+            if row['outstanding'] > 0:
+                rows.append(row)
+        rows.sort(key=lambda r: r['outstanding'], reverse=True)
+        return rows
+
+    def __str__(self):
+        return f"Invoice {self.pk} ({self.kind}) {self.amount}"
+
+
+class Payment(models.Model):
+    """Money received against an invoice."""
+    METHOD_CHOICES = [
+        ('cash', 'Cash'),
+        ('card', 'Card'),
+        ('mobile', 'Mobile Money'),
+        ('insurance', 'Insurance'),
+    ]
+
+    invoice = models.ForeignKey('Invoice', on_delete=models.CASCADE, related_name='payments')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    method = models.CharField(max_length=20, choices=METHOD_CHOICES, default='cash')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def clean(self):
+        if self.amount is None or self.amount <= 0:
+            raise ValidationError({'amount': 'Amount must be greater than zero.'})
+
+    def save(self, *args, **kwargs):
+        # Apply the payment to its invoice atomically, as Sale.save does for stock
+        with transaction.atomic():
+            delta = self.amount
+            if self.pk:
+                old = Payment.objects.select_for_update().get(pk=self.pk)
+                if old.invoice_id != self.invoice_id:
+                    _apply_payment(old.invoice_id, -old.amount)
+                else:
+                    delta = self.amount - old.amount
+            self.full_clean()
+            super().save(*args, **kwargs)
+            _apply_payment(self.invoice_id, delta)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            _apply_payment(self.invoice_id, -self.amount)
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"Payment of {self.amount} on invoice {self.invoice_id}"
+
+
+def _apply_payment(invoice_id, delta):
+    """Move an invoice's amount_paid by `delta` and re-derive its status."""
+    if not delta:
+        return
+    Invoice.objects.filter(pk=invoice_id).update(amount_paid=F('amount_paid') + delta, updated_at=timezone.now())
+    invoice = Invoice.objects.select_for_update().get(pk=invoice_id)
+    invoice.save(update_fields=['status', 'doctor', 'updated_at'])
+
+
+
+
+
+class ChangeLog(models.Model):
+    """Monotonic change sequence behind /api/sync/. `seq` is the client's cursor.
+
+    Ids are taken when a row is inserted, so a slow transaction can commit an entry below ids
+    a client has already been handed. Entries are therefore written without a `seq` and get one
+    from assign_sequence() after they have committed, always above every number handed out.
+
+    Only the newest entry per object is kept (older ones are dropped on write), so the table
+    stays proportional to the number of objects rather than the number of edits, and deletes
+    remain as tombstones.
+    """
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    ]
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # position in commit order; null until assign_sequence() has seen the entry committed
+    seq = models.BigIntegerField(null=True, blank=True, unique=True)
+    # sequence number of the object's 'created' entry once that entry has been compacted away,
+    # so a client whose cursor predates it still sees the object as created
+    created_seq = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # compaction looks up the previous entry for an object
+        indexes = [models.Index(fields=['model', 'object_id'])]
+
+    @classmethod
+    def record(cls, model, object_id, action):
+        label = model._meta.label_lower
+        previous = cls.objects.filter(model=label, object_id=object_id).order_by('-pk').first()
+        created_seq = None
+        if previous is not None and action != 'created':
+            if previous.action == 'created' and previous.seq is None:
+                # the creation was never handed out, so to every client this is still one
+                if action == 'updated':
+                    action = 'created'
+            else:
+                created_seq = previous.seq if previous.action == 'created' else previous.created_seq
+            cls.objects.filter(model=label, object_id=object_id).delete()
+        return cls.objects.create(model=label, object_id=object_id, action=action, created_seq=created_seq)
+
+    @classmethod
+    def assign_sequence(cls):
+        """Number the committed entries that have no `seq` yet, in id order, above all others.
+
+        Runs under a lock on ChangeLogSequence, so numbering transactions commit one after the
+        other and a number is never visible before every smaller one is.
+
+        Returns:
+            int: the highest sequence number assigned so far
+        """
+        with transaction.atomic():
+            counter, _ = ChangeLogSequence.objects.select_for_update().get_or_create(pk=1)
+            pending = cls.objects.filter(seq__isnull=True).aggregate(low=Min('pk'), high=Max('pk'))
+            if pending['low'] is None:
+                return counter.last
+            offset = counter.last + 1 - pending['low']
+            cls.objects.filter(seq__isnull=True, pk__range=(pending['low'], pending['high'])).update(seq=F('pk') + offset)
+            counter.last = pending['high'] + offset
+            counter.save(update_fields=['last'])
+            return counter.last
+
+    def action_since(self, cursor):
+        """The action as seen by a client holding `cursor`."""
+        if self.action == 'updated' and self.created_seq is not None and self.created_seq > cursor:
+            return 'created'
+        return self.action
+
+    def __str__(self):
+        return f"{self.pk}: {self.action} {self.model}#{self.object_id}"
+
+
+class AuditEvent(models.Model):
+    """Who viewed or changed a clinical record, written in batches by hms.audit.
+
+    `patient_id` is the patient the record belongs to, kept as a plain column (not a foreign
+    key) so the trail survives the patient being merged or deleted.
+    """
+    ACTION_CHOICES = [
+        ('view', 'Viewed'),
+        ('create', 'Created'),
+        ('update', 'Updated'),
+        ('delete', 'Deleted'),
+    ]
+
+    user = models.ForeignKey('User', null=True, on_delete=models.SET_NULL, related_name='audit_events')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    patient_id = models.BigIntegerField(null=True, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    # when it happened, not when the batch was written
+    occurred_at = models.DateTimeField()
+
+    class Meta:
+        # the two questions compliance asks: who saw this patient, and what did this user see
+        indexes = [
+            models.Index(fields=['patient_id', 'occurred_at']),
+            models.Index(fields=['user', 'occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.action} {self.model}#{self.object_id}"
+
+
+class Task(models.Model):
+    """A unit of background work for the DB-backed queue in hms.tasks (no broker needed)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # while queued, a second enqueue of the same task with the same key is a no-op
+    dedupe_key = models.CharField(max_length=150, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # workers claim the oldest due task
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+        ]
+        # one queued task per dedupe key, enforced by the database rather than check-then-insert
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'dedupe_key'], condition=Q(status='queued'), name='task_queued_dedupe_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
+
+
+class IdempotencyKey(models.Model):
+    """A POST/PATCH Idempotency-Key and the response it got (hms.idempotency).
+
+    The unique `key` is what makes claiming a key atomic across workers; the row is inserted
+    before the view runs and filled in with the response afterwards.
+    """
+    # digest of the credentials, method, path and client key
+    key = models.CharField(max_length=32, unique=True)
+    # digest of the request body, to refuse a key reused for a different request
+    fingerprint = models.BinaryField(max_length=16)
+    # null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    headers = models.JSONField(default=list, blank=True)
+    body = models.BinaryField(default=b'', blank=True)
+    # an in-flight claim past this point was abandoned (worker died) and may be taken over
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.key} [{self.status_code or 'in flight'}]"
+
+
+class ChangeLogSequence(models.Model):
+    """The last ChangeLog.seq handed out, one row; locking it serializes the numbering."""
+    last = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Change sequence at {self.last}"
+
+
+class DashboardSnapshot(models.Model):
+    """The rendered /api/dashboard/ body (hms.dashboard), one row.
+
+    Kept in the database so the task worker that builds it and the web processes that serve it
+    see the same snapshot, wherever each runs.
+    """
+    body = models.BinaryField()
+    etag = models.CharField(max_length=40)
+    generated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Dashboard snapshot of {self.generated_at}"
+
+
+# Archive tables: closed periods moved out of the hot Sale/Diagnosis/LabResults tables by
+# `manage.py archive_records`. Rows keep their original ids; the ViewSets and Sale's aggregates
+# read hot and archived rows together.
+
+class SaleArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    medicine = models.ForeignKey('Medicine', on_delete=models.CASCADE, related_name='archived_sales')
+    quantity = models.PositiveIntegerField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateField(db_index=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['date', 'medicine'])]
+
+    def __str__(self):
+        return f"Archived sale {self.pk} on {self.date}"
+
+
+class DiagnosisArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='archived_diagnoses')
+    doctor = models.ForeignKey('User', on_delete=models.CASCADE, null=True, blank=True, related_name='archived_diagnoses')
+    symptoms = CompressedTextField()
+    treatment_plan = CompressedTextField()
+    diagnosis = CompressedTextField()
+    prescribed_medicines = models.JSONField(default=list)
+    additional_notes = CompressedTextField(null=True, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived diagnosis {self.pk}"
+
+
+class LabResultsArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    lab_order = models.ForeignKey('LabOders', on_delete=models.CASCADE, related_name='archived_results')
+    result = CompressedJSONField(default=list, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived lab result {self.pk}"
 
 
+def _count_response(key, count):
+    # imported here so loading the models doesn't pull in DRF's response/renderer stack
+    from rest_framework.response import Response
+    return Response({key: count})
 
 def get_user_count():
     count = User.objects.count()
-    return Response({"user_count": count})
+    return _count_response("user_count", count)
 
 def get_patient_count():
     count = Patient.objects.count()
-    return Response({"patient_count": count})
+    return _count_response("patient_count", count)
 
 def get_medicine_count():
     count = Medicine.objects.count()
-    return Response({"medicine_count": count})
+    return _count_response("medicine_count", count)
 
 def get_diagnosis_count():
-    count = Diagnosis.objects.count()
-    return Response({"diagnosis_count": count})
+    count = Diagnosis.objects.count() + DiagnosisArchive.objects.count()
+    return _count_response("diagnosis_count", count)
 
 def get_sale_count():
-    count = Sale.objects.count()
-    return Response({"sale_count": count})
\ No newline at end of file
+    count = Sale.objects.count() + SaleArchive.objects.count()
+    return _count_response("sale_count", count)
\ No newline at end of file
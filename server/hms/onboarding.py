@@ -0,0 +1,70 @@
+"""Bulk staff onboarding: many accounts, and their API tokens, in a handful of queries.
+
+Usernames come from one prefix query (CustomUserManager.allocate_usernames) instead of a probe
+per collision. Passwords are hashed on a thread pool: PBKDF2 runs inside OpenSSL with the GIL
+released, so the hashes really do run in parallel. Users and tokens are inserted with
+bulk_create in batches, all in one transaction. bulk_create sends no post_save, so the dashboard
+refresh the signal would have queued is requested here.
+"""
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework.authtoken.models import Token
+
+from . import tasks
+from .models import User
+
+ONBOARDING_BATCH_SIZE = 100
+# tries at a free set of usernames before giving up on a unique-index race
+USERNAME_ATTEMPTS = 3
+PROFILE_FIELDS = ('name', 'specialization', 'phone', 'address')
+
+
+def hash_passwords(passwords):
+    workers = min(settings.HMS_PASSWORD_HASH_WORKERS or os.cpu_count() or 1, len(passwords))
+    if workers <= 1:
+        return [make_password(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords))
+
+
+def onboard_staff(rows):
+    """Create an account and token for each validated row.
+
+    Args:
+        rows (list): dicts with email, role, the optional profile fields and an optional
+            password; rows without one get a random temporary password
+
+    Returns:
+        list: (user, token key, generated password or None) per row, in order
+    """
+    generated = [None if row.get('password') else secrets.token_urlsafe(12) for row in rows]
+    hashes = hash_passwords([row.get('password') or temporary for row, temporary in zip(rows, generated)])
+    bases = [row['email'].split('@')[0] for row in rows]
+
+    for attempt in range(USERNAME_ATTEMPTS):
+        users = [
+            User(
+                email=User.objects.normalize_email(row['email']),
+                username=username,
+                password=password_hash,
+                role=row['role'],
+                **{field: row.get(field, '') for field in PROFILE_FIELDS},
+            )
+            for row, username, password_hash in zip(rows, User.objects.allocate_usernames(bases), hashes)
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=ONBOARDING_BATCH_SIZE)
+                tokens = [Token(key=Token.generate_key(), user=user) for user in users]
+                Token.objects.bulk_create(tokens, batch_size=ONBOARDING_BATCH_SIZE)
+                transaction.on_commit(tasks.request_dashboard_refresh)
+            break
+        except IntegrityError:
+            if attempt == USERNAME_ATTEMPTS - 1:
+                raise
+    return [(user, token.key, temporary) for user, token, temporary in zip(users, tokens, generated)]
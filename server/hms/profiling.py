@@ -0,0 +1,246 @@
+"""On-demand request profiling: where the time of one slow request goes, in production.
+
+Off unless HMS_PROFILING_ENABLED is set; then ProfilingMiddleware is installed. With the setting
+off the middleware removes itself at startup (MiddlewareNotUsed), so requests pay nothing. With
+it on, a request is profiled when:
+
+- an admin sends `X-Profile: 1` (stack sampler) or `X-Profile: cprofile`;
+- it is picked by the sampling rule an admin set at /api/profiles/settings/ (a rate, an
+  optional path prefix and an expiry).
+
+A profile holds the request's timing, a SQL breakdown (count and time per statement, so
+repeated statements stand out), and either folded stacks from the stack sampler, ready for
+flamegraph.pl or speedscope (/api/profiles/<id>/folded/), or cProfile's top functions. Profiles
+are kept in the cache, the newest HMS_PROFILING_KEEP of them, and the response carries
+X-Profile-Id. Streaming responses are profiled up to the point their body starts.
+"""
+import cProfile
+import collections
+import contextlib
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+HEADER = 'HTTP_X_PROFILE'
+SETTINGS_KEY = 'profiling:settings'
+RECENT_KEY = 'profiling:recent'
+# how often a worker re-reads the sampling rule from the cache
+SETTINGS_REFRESH_SECONDS = 5
+SQL_TOP = 25
+CPROFILE_TOP = 40
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_name(code):
+    path = code.co_filename
+    for prefix in sorted((*sys.path, ROOT), key=len, reverse=True):
+        if prefix and path.startswith(prefix + os.sep):
+            path = path[len(prefix) + 1:]
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds into folded-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hms-profile', daemon=True)
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code not in names:
+                    names[code] = _frame_name(code)
+                stack.append(names[code])
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+
+class SQLRecorder:
+    """Times every query on every database connection used by the request."""
+
+    def __init__(self):
+        self.statements = collections.defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            entry = self.statements[(context['connection'].alias, sql)]
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+
+    @contextlib.contextmanager
+    def installed(self):
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    def summary(self):
+        rows = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'count': sum(count for count, _ in self.statements.values()),
+            'ms': round(sum(total for _, total in self.statements.values()) * 1000, 2),
+            'statements': [
+                {'database': alias, 'sql': sql, 'count': count, 'ms': round(total * 1000, 2)}
+                for (alias, sql), (count, total) in rows[:SQL_TOP]
+            ],
+        }
+
+
+def cprofile_top(profile):
+    stats = pstats.Stats(profile)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:CPROFILE_TOP]
+    return [
+        {
+            'function': f"{name} ({filename}:{line})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 2),
+            'cumulative_ms': round(cumulative * 1000, 2),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def get_rule():
+    """The sampling rule set by an admin, or None when sampling is off or has expired."""
+    rule = cache.get(SETTINGS_KEY)
+    if not rule or not rule.get('sample_rate'):
+        return None
+    until = parse_datetime(rule['until']) if rule.get('until') else None
+    if until is not None and until <= timezone.now():
+        return None
+    return rule
+
+
+def set_rule(sample_rate, path_prefix='', until=None):
+    rule = {'sample_rate': sample_rate, 'path_prefix': path_prefix, 'until': until.isoformat() if until else None}
+    cache.set(SETTINGS_KEY, rule, None)
+    return rule
+
+
+def save(profile):
+    ttl = settings.HMS_PROFILING_TTL
+    cache.set(f"profiling:{profile['id']}", profile, ttl)
+    recent = [entry for entry in cache.get(RECENT_KEY, []) if entry['id'] != profile['id']]
+    summary = {key: profile[key] for key in ('id', 'method', 'path', 'status', 'engine', 'ms', 'created_at')}
+    summary['sql_count'], summary['sql_ms'] = profile['sql']['count'], profile['sql']['ms']
+    cache.set(RECENT_KEY, [summary] + recent[:settings.HMS_PROFILING_KEEP - 1], ttl)
+
+
+def recent():
+    return cache.get(RECENT_KEY, [])
+
+
+def load(profile_id):
+    return cache.get(f"profiling:{profile_id}")
+
+
+def _is_admin(request):
+    # the view hasn't authenticated yet; only a request asking to be profiled pays for this
+    from rest_framework.authentication import TokenAuthentication
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework.request import Request
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = TokenAuthentication().authenticate(Request(request))
+        except AuthenticationFailed:
+            return False
+        user = result[0] if result else None
+    return bool(user and (user.role == 'admin' or user.is_superuser))
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.HMS_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._rule = None
+        self._rule_checked = 0.0
+
+    def _sampled(self, request):
+        now = time.monotonic()
+        if now - self._rule_checked > SETTINGS_REFRESH_SECONDS:
+            self._rule, self._rule_checked = get_rule(), now
+        rule = self._rule
+        return (rule is not None and request.path.startswith(rule.get('path_prefix') or '/')
+                and random.random() < rule['sample_rate'])
+
+    def __call__(self, request):
+        requested = request.META.get(HEADER, '').strip().lower()
+        if requested and requested not in ('0', 'false') and _is_admin(request):
+            engine = 'cprofile' if requested == 'cprofile' else 'sampler'
+        elif self._sampled(request):
+            engine = 'sampler'
+        else:
+            return self.get_response(request)
+        return self.profile(request, engine)
+
+    def profile(self, request, engine):
+        recorder = SQLRecorder()
+        started = time.perf_counter()
+        with recorder.installed():
+            if engine == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+                detail = {'functions': cprofile_top(profiler)}
+            else:
+                sampler = StackSampler(threading.get_ident(), settings.HMS_PROFILING_INTERVAL_MS / 1000)
+                with sampler:
+                    response = self.get_response(request)
+                detail = {'folded': sampler.folded(), 'samples': sum(sampler.counts.values())}
+        elapsed = time.perf_counter() - started
+
+        profile = {
+            'id': uuid.uuid4().hex[:12],
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'engine': engine,
+            'ms': round(elapsed * 1000, 2),
+            'created_at': timezone.now().isoformat(),
+            'sql': recorder.summary(),
+            **detail,
+        }
+        save(profile)
+        response['X-Profile-Id'] = profile['id']
+        return response
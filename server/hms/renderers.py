@@ -0,0 +1,155 @@
+"""Binary renderers and parsers for high-volume API consumers.
+
+- MessagePack (`Accept: application/msgpack` or `?format=msgpack`): Decimals, dates, times and
+  UUIDs travel as msgpack extension types and datetimes as msgpack timestamps, so values come
+  back with their Python types instead of as strings. Needs the optional `msgpack` package.
+- Arrow IPC stream (`Accept: application/vnd.apache.arrow.stream` or `?format=arrow`): list
+  pages as one columnar record batch, for loading straight into dataframes. Needs `pyarrow`.
+
+Both are only offered (see REST_FRAMEWORK in api/settings.py) when their library is installed.
+ViewSets with NativeTypesMixin hand these renderers native values rather than the strings
+JSON needs.
+"""
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+# msgpack extension type codes (0-127 are application-defined)
+EXT_DECIMAL = 1
+EXT_DATE = 2
+EXT_TIME = 3
+EXT_UUID = 4
+
+NATIVE_FORMATS = ('msgpack', 'arrow')
+
+
+def _pack_default(obj):
+    import msgpack
+
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, datetime.date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, datetime.time):
+        return msgpack.ExtType(EXT_TIME, obj.isoformat().encode())
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, obj.bytes)
+    # lazy strings, ReturnDict/ReturnList subclasses are handled natively; anything else is text
+    return str(obj)
+
+
+def _ext_hook(code, data):
+    import msgpack
+
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == EXT_DATE:
+        return datetime.date.fromisoformat(data.decode())
+    if code == EXT_TIME:
+        return datetime.time.fromisoformat(data.decode())
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def packb(data):
+    import msgpack
+    return msgpack.packb(data, default=_pack_default, use_bin_type=True, datetime=True)
+
+
+def unpackb(data):
+    import msgpack
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, timestamp=3)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return packb(data)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return unpackb(stream.read())
+        except Exception as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class ArrowStreamRenderer(BaseRenderer):
+    """One record batch per response. Page metadata (count/next/previous) goes in the schema."""
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import pyarrow as pa
+
+        if data is None:
+            return b''
+        metadata = {}
+        if isinstance(data, dict) and isinstance(data.get('results'), list):
+            metadata = {key: str(value) for key, value in data.items() if key != 'results' and value is not None}
+            rows = data['results']
+        elif isinstance(data, list):
+            rows = data
+        else:
+            rows = [data]
+        rows = [dict(row) for row in rows]
+        try:
+            table = pa.Table.from_pylist(rows)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # free-form JSON (e.g. lab result values) with no single column type goes out as text
+            rows = [
+                {key: json.dumps(value, cls=DjangoJSONEncoder) if isinstance(value, (dict, list)) else value
+                 for key, value in row.items()}
+                for row in rows
+            ]
+            table = pa.Table.from_pylist(rows)
+        table = table.replace_schema_metadata(metadata or None)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def use_native_types(serializer):
+    """Make a serializer's Decimal/date/time fields (nested ones included) return Python values."""
+    if isinstance(serializer, serializers.ListSerializer):
+        use_native_types(serializer.child)
+        return serializer
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.DecimalField):
+            field.coerce_to_string = False
+        elif isinstance(field, (serializers.DateTimeField, serializers.DateField, serializers.TimeField)):
+            field.format = None
+        elif isinstance(field, serializers.BaseSerializer):
+            use_native_types(field)
+    return serializer
+
+
+class NativeTypesMixin:
+    """Serialize native values when the response goes out as msgpack or Arrow."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        if getattr(renderer, 'format', None) in NATIVE_FORMATS:
+            use_native_types(serializer)
+        return serializer
@@ -1,8 +1,15 @@
 from rest_framework import serializers
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
 import json
-from .models import User, Patient, Medicine, Diagnosis, Appointments, Sale, LabOders, LabResults
+from .models import User, Patient, Medicine, MedicineBatch, Diagnosis, Appointments, DoctorSchedule, Sale, LabOders, LabResults, Invoice, Payment
+from .models import AuditEvent
 from decimal import Decimal
 
+# tries at a free username before a registration gives up on a unique-index race
+USERNAME_ATTEMPTS = 3
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,8 +23,19 @@ class UserSerializer(serializers.ModelSerializer):
 class PatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
-        # include payment_status so clients can read/update payment state
-        fields = '__all__'
+        # include payment_status so clients can read/update payment state;
+        # every field except the internal duplicate-detection keys
+        exclude = ['phone_key', 'name_key']
+        # echoed back in If-Match to make an edit conditional
+        read_only_fields = ['version']
+
+
+class PatientSummarySerializer(serializers.ModelSerializer):
+    """The identifying fields shown when patients are offered as possible duplicates."""
+
+    class Meta:
+        model = Patient
+        fields = ['id', 'first_name', 'last_name', 'email', 'phone', 'date_of_birth', 'created_at']
 
 
 
@@ -27,6 +45,25 @@ class MedicineSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class MedicineBatchSerializer(serializers.ModelSerializer):
+    medicine = serializers.PrimaryKeyRelatedField(queryset=Medicine.objects.all())
+    medicine_name = serializers.CharField(source='medicine.name', read_only=True)
+
+    class Meta:
+        model = MedicineBatch
+        fields = ['id', 'medicine', 'medicine_name', 'lot_number', 'expiry_date', 'quantity', 'created_at']
+        read_only_fields = ['created_at']
+
+
+class DoctorScheduleSerializer(serializers.ModelSerializer):
+    doctor = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='doctor'))
+    doctor_name = serializers.CharField(source='doctor.name', read_only=True)
+
+    class Meta:
+        model = DoctorSchedule
+        fields = ['id', 'doctor', 'doctor_name', 'weekday', 'start_time', 'end_time', 'slot_minutes']
+
+
 class DiagnosisSerializer(serializers.ModelSerializer):
     # expose FK ids for client matching plus readable name fields
     # allow clients to POST a patient id when creating a diagnosis
@@ -86,8 +123,9 @@ class LabOrderSerializer(serializers.ModelSerializer):
             'status',
             'created_at',
             'updated_at',
+            'version',
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at', 'version']
 
     def get_patient_name(self, obj):
         if obj.patient:
@@ -236,7 +274,9 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'reason',
             'status',
             'payment_status',
+            'version',
         ]
+        read_only_fields = ['version']
 
     def get_patient_name(self, obj):
         if getattr(obj, 'patient', None):
@@ -257,6 +297,34 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
 
 
+class InvoiceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Invoice
+        fields = [
+            'id', 'patient', 'doctor', 'appointment', 'sale', 'kind',
+            'amount', 'amount_paid', 'status', 'created_at',
+        ]
+        # amount_paid follows the recorded payments; status is derived except for voiding
+        read_only_fields = ['amount_paid', 'created_at']
+
+    def validate_status(self, value):
+        if value not in ('void', getattr(self.instance, 'status', 'not_paid')):
+            raise serializers.ValidationError('Status follows payments; it can only be set to void.')
+        return value
+
+
+class PaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ['id', 'invoice', 'amount', 'method', 'created_at']
+        read_only_fields = ['created_at']
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Amount must be greater than zero.')
+        return value
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
 
@@ -268,24 +336,55 @@ class RegisterSerializer(serializers.ModelSerializer):
         # Ensure a username is provided to the user manager; derive from email if absent
         raw_email = validated_data['email']
         base_username = validated_data.get('username') or raw_email.split('@')[0]
-        username = base_username
-        # Ensure uniqueness by appending a numeric suffix if needed
-        counter = 0
-        while User.objects.filter(username=username).exists():
-            counter += 1
-            username = f"{base_username}{counter}"
-
-        user = User.objects.create_user(
-            email=raw_email,
-            username=username,
-            password=validated_data['password'],
-            name=validated_data.get('name', ''),
-            role=validated_data.get('role', 'staff'),
-            specialization=validated_data.get('specialization', ''),
-            phone=validated_data.get('phone', ''),
-            address=validated_data.get('address', ''),
-        )
-        return user
+        # Ensure uniqueness with a numeric suffix, found by one prefix query; a concurrent
+        # registration that took the same name trips the unique index and we allocate again
+        for attempt in range(USERNAME_ATTEMPTS):
+            [username] = User.objects.allocate_usernames([base_username])
+            try:
+                with transaction.atomic():
+                    return User.objects.create_user(
+                        email=raw_email,
+                        username=username,
+                        password=validated_data['password'],
+                        name=validated_data.get('name', ''),
+                        role=validated_data.get('role', 'staff'),
+                        specialization=validated_data.get('specialization', ''),
+                        phone=validated_data.get('phone', ''),
+                        address=validated_data.get('address', ''),
+                    )
+            except IntegrityError:
+                if attempt == USERNAME_ATTEMPTS - 1 or User.objects.filter(email=User.objects.normalize_email(raw_email)).exists():
+                    raise
+
+
+class StaffOnboardingSerializer(serializers.ModelSerializer):
+    """One row of a bulk onboarding request; email uniqueness is checked for the whole batch at once."""
+    password = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
+    class Meta:
+        model = User
+        fields = ['email', 'name', 'password', 'role', 'specialization', 'phone', 'address']
+        # checked with one query over all rows instead of one per row
+        extra_kwargs = {'email': {'validators': []}, 'role': {'required': True}}
+
+    def validate(self, attrs):
+        # rows without a password get a generated one, which needs no checking
+        password = attrs.get('password')
+        if password:
+            profile = {field: value for field, value in attrs.items() if field != 'password'}
+            try:
+                validate_password(password, user=User(**profile))
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({'password': list(e.messages)})
+        return attrs
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    user_name = serializers.CharField(source='user.name', read_only=True, default=None)
+
+    class Meta:
+        model = AuditEvent
+        fields = ['id', 'user', 'user_name', 'action', 'model', 'object_id', 'patient_id', 'ip_address', 'occurred_at']
 
 
 class LoginSerializer(serializers.Serializer):
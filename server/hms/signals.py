@@ -0,0 +1,131 @@
+"""Model signal receivers.
+
+- Feed ChangeLog (the /api/sync/ sequence) from saves and deletes. Queryset `.update()` calls
+  bypass these signals; the model code that uses them records its own ChangeLog entries.
+- Publish lab result, lab order status and appointment changes to the SSE stream once the
+  surrounding transaction commits.
+- Queue a dashboard snapshot rebuild after writes to the tables it summarizes, and a sales
+  rollup refresh after sales change.
+- Retire the cached as-of outstanding balances when an invoice or payment from a closed day
+  changes, and the cached revenue breakdowns when a sale dated on a closed day does.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache_utils, events, tasks
+from .models import Appointments, ChangeLog, Diagnosis, Invoice, LabOders, LabResults, Medicine, Patient, Payment, Sale, User
+
+SYNCED_MODELS = (Patient, Appointments, Diagnosis, LabOders, LabResults, Medicine, Sale)
+DASHBOARD_MODELS = (Patient, Medicine, Diagnosis, Sale, User)
+
+
+@receiver(post_save)
+def record_save(sender, instance, created, raw=False, **kwargs):
+    if sender in SYNCED_MODELS and not raw:
+        ChangeLog.record(sender, instance.pk, 'created' if created else 'updated')
+
+
+@receiver(post_delete)
+def record_delete(sender, instance, **kwargs):
+    if sender in SYNCED_MODELS:
+        ChangeLog.record(sender, instance.pk, 'deleted')
+
+
+def _publish_on_commit(channel, payload):
+    transaction.on_commit(lambda: events.publish(channel, payload))
+
+
+@receiver(post_init, sender=Sale)
+def remember_sale_date(sender, instance, **kwargs):
+    # a sale moved out of a closed day changes that day's revenue as much as one moved into it
+    instance._loaded_date = instance.date
+
+
+@receiver(post_init, sender=LabOders)
+def remember_lab_order_status(sender, instance, **kwargs):
+    # lets post_save tell a status change from any other edit without re-reading the row
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=LabOders)
+def publish_lab_order_status(sender, instance, created, raw=False, **kwargs):
+    if raw or (not created and instance._loaded_status == instance.status):
+        return
+    previous = None if created else instance._loaded_status
+    instance._loaded_status = instance.status
+    _publish_on_commit('lab_orders', {
+        'event': 'created' if created else 'status_changed',
+        'id': instance.pk,
+        'patient': instance.patient_id,
+        'doctor': instance.doctor_id,
+        'status': instance.status,
+        'previous_status': previous,
+    })
+
+
+@receiver(post_save, sender=LabResults)
+def publish_lab_result(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    _publish_on_commit('lab_results', {
+        'event': 'created' if created else 'updated',
+        'id': instance.pk,
+        'lab_order': instance.lab_order_id,
+    })
+
+
+@receiver(post_save, sender=Appointments)
+def publish_appointment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    _publish_on_commit('appointments', {
+        'event': 'created' if created else 'updated',
+        'id': instance.pk,
+        'patient': instance.patient_id,
+        'doctor': instance.doctor_id,
+        'date': instance.date,
+        'status': instance.status,
+    })
+
+
+@receiver(post_delete, sender=Appointments)
+def publish_appointment_deleted(sender, instance, **kwargs):
+    _publish_on_commit('appointments', {'event': 'deleted', 'id': instance.pk})
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def refresh_dashboard_after_write(sender, raw=False, **kwargs):
+    if sender in DASHBOARD_MODELS and not raw:
+        transaction.on_commit(tasks.request_dashboard_refresh)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def refresh_sales_rollups_after_write(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(tasks.request_sales_rollup_refresh)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def retire_closed_day_balances(sender, instance, raw=False, **kwargs):
+    # rows created today only move today's balances, which are never cached
+    if raw or instance.created_at is None or timezone.localdate(instance.created_at) >= timezone.localdate():
+        return
+    transaction.on_commit(lambda: cache_utils.bump_generation(Invoice.LEDGER_GENERATION))
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def retire_closed_day_revenue(sender, instance, raw=False, **kwargs):
+    # sales dated today only move open ranges, which are cached for seconds
+    to_date = Sale._meta.get_field('date').to_python
+    dates = [to_date(day) for day in (instance.date, getattr(instance, '_loaded_date', None)) if day]
+    if raw or not any(day < timezone.localdate() for day in dates):
+        return
+    transaction.on_commit(lambda: cache_utils.bump_generation(Sale.REVENUE_GENERATION))
@@ -0,0 +1,244 @@
+"""A small DB-backed task queue for work that shouldn't block a request.
+
+Register a function with `@task`, enqueue it with `enqueue(...)`, and run workers with
+`python manage.py run_tasks`. Tasks are rows in hms.Task, so enqueueing inside a transaction
+is atomic with the write that caused it and no Redis/broker is required. Arguments must be
+JSON-serializable.
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Workers renew the lock on their running tasks this often, however long the tasks take
+TASK_HEARTBEAT_SECONDS = 30
+# A running task whose lock hasn't been renewed for this many seconds is assumed lost
+TASK_LOCK_TIMEOUT = 300
+# Retry n waits TASK_RETRY_BASE_SECONDS * 2**(n-1)
+TASK_RETRY_BASE_SECONDS = 10
+
+_registry = {}
+
+
+def task(func=None, *, name=None):
+    """Register `func` as a task under `name` (default: module.function)."""
+    def register(f):
+        _registry[name or f"{f.__module__}.{f.__name__}"] = f
+        f.task_name = name or f"{f.__module__}.{f.__name__}"
+        return f
+    return register(func) if func is not None else register
+
+
+def enqueue(func, *args, run_at=None, delay=None, max_attempts=3, dedupe_key=None, **kwargs):
+    """Queue a registered task. Returns the Task, or the already-queued one when `dedupe_key` matches.
+
+    At most one task per (name, dedupe_key) is queued at a time; a partial unique index
+    enforces it, so two concurrent enqueues can't both insert.
+    """
+    name = getattr(func, 'task_name', func)
+    if name not in _registry:
+        raise ValueError(f"Unknown task: {name}")
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    fields = {'name': name, 'args': list(args), 'kwargs': kwargs, 'run_at': run_at,
+              'max_attempts': max_attempts, 'dedupe_key': dedupe_key}
+    if not dedupe_key:
+        return Task.objects.create(**fields)
+    for _ in range(2):
+        try:
+            # a savepoint, so a duplicate doesn't break the caller's transaction
+            with transaction.atomic():
+                return Task.objects.create(**fields)
+        except IntegrityError:
+            existing = Task.objects.filter(name=name, dedupe_key=dedupe_key, status='queued').first()
+            if existing is not None:
+                return existing
+            # the queued one was claimed in between; queue ours after all
+    return Task.objects.create(**fields)
+
+
+def claim(worker_id, limit):
+    """Lock up to `limit` due tasks for this worker; concurrent workers skip each other's rows."""
+    now = timezone.now()
+    due = Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=now - timedelta(seconds=TASK_LOCK_TIMEOUT))
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        Task.objects.filter(pk__in=ids).update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(pk__in=ids))
+
+
+def execute(task_row):
+    """Run one claimed task and record the outcome (done, retry later, or failed)."""
+    # only while this worker still holds the claim
+    mine = Task.objects.filter(pk=task_row.pk, status='running', locked_by=task_row.locked_by)
+    try:
+        func = _registry[task_row.name]
+        func(*task_row.args, **task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s (%s) failed on attempt %s", task_row.pk, task_row.name, task_row.attempts)
+        if task_row.attempts < task_row.max_attempts:
+            backoff = TASK_RETRY_BASE_SECONDS * 2 ** (task_row.attempts - 1)
+            try:
+                with transaction.atomic():
+                    mine.update(
+                        status='queued', run_at=timezone.now() + timedelta(seconds=backoff),
+                        locked_by='', locked_at=None, last_error=error,
+                    )
+            except IntegrityError:
+                # an identical task was queued meanwhile (same dedupe key); it stands in for the retry
+                mine.update(status='failed', finished_at=timezone.now(), last_error=error)
+        else:
+            mine.update(status='failed', finished_at=timezone.now(), last_error=error)
+    else:
+        mine.update(status='done', finished_at=timezone.now(), last_error='')
+    finally:
+        # worker threads hold their own connections; don't let them go stale between tasks
+        close_old_connections()
+
+
+def heartbeat(worker_id, task_ids):
+    """Renew this worker's lock on its running tasks so no other worker reclaims them."""
+    if not task_ids:
+        return 0
+    return Task.objects.filter(pk__in=task_ids, status='running', locked_by=worker_id).update(locked_at=timezone.now())
+
+
+def run_worker(concurrency=2, poll_interval=1.0, once=False, stop_event=None):
+    """Claim and run tasks on up to `concurrency` threads until stopped (or the queue drains, with once)."""
+    # worker-only imports, kept off the web process's import path
+    import socket
+    from concurrent.futures import ThreadPoolExecutor
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    in_flight = set()
+
+    def run(task_row):
+        try:
+            execute(task_row)
+        finally:
+            in_flight.discard(task_row.pk)
+
+    last_beat = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='hms-task') as pool:
+        while not stop_event.is_set():
+            if time.monotonic() - last_beat >= TASK_HEARTBEAT_SECONDS:
+                heartbeat(worker_id, list(in_flight))
+                last_beat = time.monotonic()
+            free = concurrency - len(in_flight)
+            claimed = claim(worker_id, free) if free else []
+            for task_row in claimed:
+                in_flight.add(task_row.pk)
+                pool.submit(run, task_row)
+            if once and not claimed and not in_flight:
+                break
+            if not claimed:
+                stop_event.wait(poll_interval)
+
+
+def purge(older_than_days=7):
+    """Delete finished tasks older than the given age; returns how many were removed."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = Task.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+@task(name='refresh_dashboard')
+def refresh_dashboard(reschedule=False):
+    """Rebuild the dashboard snapshot; the scheduled chain queues its own next run."""
+    from . import dashboard
+
+    dashboard.build_snapshot()
+    if reschedule:
+        schedule_dashboard_refresh()
+
+
+def schedule_dashboard_refresh():
+    """Make sure the periodic refresh chain is queued."""
+    from . import dashboard
+
+    return enqueue(
+        refresh_dashboard, reschedule=True,
+        delay=timedelta(seconds=dashboard.REFRESH_INTERVAL_SECONDS),
+        dedupe_key='dashboard-scheduled',
+    )
+
+
+def enqueue_once(func, dedupe_key, delay):
+    """Queue `func` to run after `delay`, at most once per `delay` per process.
+
+    For follow-ups of writes: a cache flag lasting as long as the delay lets only the first
+    write of a burst reach the task table, and the task it queues runs after the whole burst.
+    """
+    from django.core.cache import cache
+
+    if not cache.add(f"task-requested:{dedupe_key}", 1, int(delay.total_seconds()) or 1):
+        return None
+    return enqueue(func, delay=delay, dedupe_key=dedupe_key)
+
+
+def request_dashboard_refresh():
+    """Queue a rebuild soon; a burst of writes collapses into one."""
+    from . import dashboard
+
+    return enqueue_once(refresh_dashboard, 'dashboard-after-write', timedelta(seconds=dashboard.WRITE_DEBOUNCE_SECONDS))
+
+
+@task(name='warm_cache')
+def warm_cache():
+    """Run the warm_cache management command off the request path (e.g. enqueued after a deploy)."""
+    from django.core.management import call_command
+
+    call_command('warm_cache')
+
+
+@task(name='refresh_sales_rollups')
+def refresh_sales_rollups():
+    """Recompute the sales analytics rollups (every grouping, all time) so no request pays for them."""
+    from .models import Sale
+    from .views import sales_analytics_payload
+
+    for group_by in Sale.BREAKDOWN_GROUPINGS:
+        sales_analytics_payload(group_by, refresh=True)
+
+
+def request_sales_rollup_refresh():
+    """Queue a rollup refresh soon after sales change; a burst of sales collapses into one."""
+    from . import dashboard
+
+    return enqueue_once(refresh_sales_rollups, 'sales-rollups-after-write', timedelta(seconds=dashboard.WRITE_DEBOUNCE_SECONDS))
+
+
+@task(name='export_columnar')
+def export_columnar(root, names=None, fmt='parquet'):
+    """Append new rows of each export (default: all) under `root`, like `manage.py export_columnar`."""
+    from . import exports
+
+    for name in names or list(exports.EXPORTS):
+        exports.export_to_directory(name, root, fmt=fmt)
+
+
+@task(name='archive_records')
+def archive_records(**options):
+    """Move closed periods into the archive tables off the request path (options as for the command)."""
+    from django.core.management import call_command
+
+    call_command('archive_records', **options)
@@ -1,3 +1,969 @@
-from django.test import TestCase
+import datetime
+import os
+import runpy
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from importlib.util import find_spec
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, RestrictedError
+from django.forms import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import audit, availability, cache_utils, dashboard, exports, fields, idempotency, matching, middleware, onboarding, profiling, renderers, tasks, views
+from .db_router import ReplicaRouter, is_pinned, pin_to_primary, replica_reads
+from .models import ChangeLog, DashboardSnapshot, IdempotencyKey, Invoice, Medicine, MedicineBatch, Patient, Payment, Sale, SaleArchive, Task, User
 
 # Create your tests here.
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SETTINGS_PATH = Path(__file__).resolve().parent.parent / 'api' / 'settings.py'
+
+
+def load_settings(**env):
+    """Evaluate api/settings.py under the given environment without touching django.conf."""
+    with mock.patch.dict(os.environ, env):
+        return runpy.run_path(str(SETTINGS_PATH))
+
+
+def make_user(username='admin', role='admin', **fields):
+    return User.objects.create_user(email=f'{username}@example.com', username=username, password='x', role=role, name=username, **fields)
+
+
+def make_patient(first_name='Ann', last_name='Lee', **fields):
+    values = {
+        'phone': '0700000000', 'date_of_birth': datetime.date(1990, 1, 1), 'address': 'Nairobi',
+        'emergency_contact_name': 'Bo', 'emergency_contact_phone': '0711111111',
+        'emergency_contact_relationship': 'sibling', **fields,
+    }
+    return Patient.objects.create(first_name=first_name, last_name=last_name, **values)
+
+
+def make_medicine(stock=0, name='Amoxicillin', price='2.50'):
+    return Medicine.objects.create(name=name, category='antibiotic', description='-', stock=stock, price=Decimal(price))
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def test_sqlite_fallback_without_database_url(self):
+        db = load_settings(DATABASE_URL='', SQLITE_PATH='/tmp/hms-test.sqlite3')['DATABASES']['default']
+        self.assertEqual(db['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(db['NAME'], '/tmp/hms-test.sqlite3')
+
+    def test_persistent_connections_with_health_checks(self):
+        db = load_settings(DATABASE_URL='postgres://u:p@db:5432/hms', DB_POOL_MODE='persistent', HMS_MANAGEMENT_COMMAND='')['DATABASES']['default']
+        self.assertEqual(db['CONN_MAX_AGE'], 600)
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertEqual(db['OPTIONS']['options'], '-c statement_timeout=15000')
+
+    def test_management_commands_get_their_own_statement_timeout(self):
+        for command, env, expected in (
+            ('migrate', {}, None),
+            ('run_tasks', {'DB_COMMAND_STATEMENT_TIMEOUT_MS': '600000'}, '-c statement_timeout=600000'),
+            ('runserver', {}, '-c statement_timeout=15000'),
+        ):
+            settings = load_settings(DATABASE_URL='postgres://u:p@db:5432/hms', HMS_MANAGEMENT_COMMAND=command, **env)
+            self.assertEqual(settings['DATABASES']['default']['OPTIONS'].get('options'), expected, command)
+
+    def test_psycopg_pool_disables_persistent_connections(self):
+        with mock.patch('importlib.util.find_spec', side_effect=lambda name, *args: name == 'psycopg_pool' or find_spec(name, *args)):
+            db = load_settings(DATABASE_URL='postgres://u:p@db:5432/hms', DB_POOL_MODE='psycopg', DB_POOL_MAX_SIZE='4')['DATABASES']['default']
+        self.assertEqual(db['CONN_MAX_AGE'], 0)
+        self.assertEqual(db['OPTIONS']['pool']['max_size'], 4)
+
+    def test_psycopg_pool_requires_the_pool_package(self):
+        with mock.patch('importlib.util.find_spec', side_effect=lambda name, *args: name != 'psycopg_pool' and find_spec(name, *args)):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'psycopg[binary,pool]'):
+                load_settings(DATABASE_URL='postgres://u:p@db:5432/hms', DB_POOL_MODE='psycopg')
+
+    def test_pgbouncer_mode(self):
+        db = load_settings(DATABASE_URL='postgres://u:p@db:5432/hms', DB_POOL_MODE='pgbouncer')['DATABASES']['default']
+        self.assertTrue(db['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('options', db['OPTIONS'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_PIN_SECONDS=10, CACHES=LOCMEM_CACHES)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_use_primary_unless_enabled(self):
+        self.assertEqual(self.router.db_for_read(Patient), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Patient), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Patient), 'default')
+
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(self.router.allow_migrate('default', 'hms'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'hms'))
+
+    def test_writer_is_pinned_to_primary(self):
+        user = User(pk=42)
+        self.assertFalse(is_pinned(user))
+        pin_to_primary(user)
+        self.assertTrue(is_pinned(user))
+        pin_to_primary(AnonymousUser())
+        self.assertFalse(is_pinned(AnonymousUser()))
+
+
+class CompressedFieldTests(SimpleTestCase):
+    @override_settings(HMS_TEXT_COMPRESSION='zlib', HMS_TEXT_COMPRESSION_MIN_BYTES=100)
+    def test_large_text_round_trips_compressed(self):
+        text = 'persistent dry cough, mild fever. ' * 50
+        stored = fields.compress(text)
+        self.assertTrue(stored.startswith(fields.MARKER))
+        self.assertLess(len(stored), len(text))
+        self.assertEqual(fields.decompress(stored), text)
+
+    @override_settings(HMS_TEXT_COMPRESSION='zlib', HMS_TEXT_COMPRESSION_MIN_BYTES=100)
+    def test_small_and_legacy_values_stored_as_is(self):
+        self.assertEqual(fields.compress('headache'), 'headache')
+        self.assertEqual(fields.decompress('written before compression'), 'written before compression')
+
+    @override_settings(HMS_TEXT_COMPRESSION='')
+    def test_disabled_stores_values_as_is(self):
+        text = 'x' * 10000
+        self.assertEqual(fields.compress(text), text)
+
+
+class PatientMatchingTests(SimpleTestCase):
+    def test_phone_formats_share_a_key(self):
+        keys = {matching.normalize_phone(p) for p in ('+254 712 345 678', '0712345678', '712-345-678')}
+        self.assertEqual(keys, {'712345678'})
+        self.assertEqual(matching.normalize_phone('123'), '')
+
+    def test_soundex(self):
+        self.assertEqual(matching.soundex('Robert'), 'R163')
+        self.assertEqual(matching.soundex('Rupert'), 'R163')
+        self.assertEqual(matching.soundex('Ashcraft'), 'A261')
+        self.assertEqual(matching.soundex('Tymczak'), 'T522')
+
+    def test_name_key_ignores_name_order(self):
+        self.assertEqual(matching.name_key('John', 'Kamau'), matching.name_key('Kamau', 'Jon'))
+
+
+class AvailabilityTests(SimpleTestCase):
+    DAY = datetime.date(2026, 10, 19)  # a Monday
+    SCHEDULES = {0: [(datetime.time(9), datetime.time(10), 20), (datetime.time(14), datetime.time(15), 30)]}
+
+    def at(self, hour, minute=0):
+        return datetime.datetime.combine(self.DAY, datetime.time(hour, minute))
+
+    def free_starts(self, bookings, **kwargs):
+        [(_, free)] = availability.availability(self.SCHEDULES, bookings, self.DAY, self.DAY, **kwargs)
+        return [start.time().isoformat('minutes') for start, _ in free]
+
+    def test_unbooked_day_is_every_slot(self):
+        self.assertEqual(self.free_starts([]), ['09:00', '09:20', '09:40', '14:00', '14:30'])
+
+    def test_off_grid_booking_blocks_every_slot_it_overlaps(self):
+        # 09:10-09:30 (one 20 minute slot) overlaps 09:00 and 09:20; 14:00 takes one 30 minute slot
+        self.assertEqual(self.free_starts([self.at(9, 10), self.at(14)]), ['09:40', '14:30'])
+
+    def test_past_slots_and_days_off(self):
+        self.assertEqual(self.free_starts([], not_before=self.at(9, 30)), ['09:40', '14:00', '14:30'])
+        [(_, free)] = availability.availability(self.SCHEDULES, [], self.DAY + datetime.timedelta(days=1), self.DAY + datetime.timedelta(days=1))
+        self.assertEqual(free, [])
+
+    def test_merge_intervals(self):
+        self.assertEqual(availability.merge_intervals([(3, 5), (1, 2), (2, 4), (7, 8)]), [(1, 5), (7, 8)])
+
+
+class CompressionNegotiationTests(SimpleTestCase):
+    ENCODINGS = ('zstd', 'br', 'gzip')
+
+    def test_server_preference_breaks_ties(self):
+        self.assertEqual(middleware.negotiate('gzip, br, zstd', self.ENCODINGS), 'zstd')
+
+    def test_client_q_values_win(self):
+        self.assertEqual(middleware.negotiate('gzip, br;q=0.9', self.ENCODINGS), 'gzip')
+
+    def test_refused_and_unknown_encodings(self):
+        self.assertIsNone(middleware.negotiate('gzip;q=0, identity', self.ENCODINGS))
+        self.assertEqual(middleware.negotiate('*;q=0.5', ('gzip',)), 'gzip')
+
+
+class AuditPatientTests(SimpleTestCase):
+    def patient_id(self, path, record):
+        view = views.AuditMixin()
+        view.audit_patient = path
+        return view._audit_patient_id(record)
+
+    def test_paths_through_response_data(self):
+        self.assertEqual(self.patient_id(None, {'id': 7}), 7)
+        self.assertEqual(self.patient_id('patient', {'id': 1, 'patient': 7}), 7)
+        self.assertEqual(self.patient_id('lab_order.patient', {'id': 1, 'lab_order': {'id': 2, 'patient': 7}}), 7)
+
+    def test_paths_through_instances_stop_at_the_id(self):
+        lab_order = mock.Mock(spec=['patient_id'], patient_id=7)
+        self.assertEqual(self.patient_id('lab_order.patient', mock.Mock(lab_order=lab_order)), 7)
+
+
+class IfMatchTests(SimpleTestCase):
+    def version(self, header):
+        request = RequestFactory().patch('/api/patients/1/', HTTP_IF_MATCH=header) if header else RequestFactory().patch('/api/patients/1/')
+        return views.if_match_version(request)
+
+    def test_retrieve_etag_and_bare_version(self):
+        self.assertEqual(self.version('"4-0cc175b9c0f1b6a831c399e269772661"'), 4)
+        self.assertEqual(self.version('W/"4"'), 4)
+
+    def test_absent_or_any(self):
+        self.assertIsNone(self.version(None))
+        self.assertIsNone(self.version('*'))
+
+    def test_unversioned_tag_never_matches(self):
+        self.assertEqual(self.version('"0cc175b9c0f1b6a831c399e269772661"'), -1)
+
+
+@override_settings(HMS_IDEMPOTENCY_TTL=60)
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.calls = 0
+
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'id': self.calls}, status=201)
+
+        self.middleware = idempotency.IdempotencyMiddleware(view)
+
+    def post(self, body, key='key-1', path='/api/sales/'):
+        request = RequestFactory().post(path, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+        return self.middleware(request)
+
+    def test_retry_replays_the_first_response(self):
+        first, retry = self.post('{"quantity": 1}'), self.post('{"quantity": 1}')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_for_another_body_is_refused(self):
+        self.post('{"quantity": 1}')
+        self.assertEqual(self.post('{"quantity": 2}').status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_requests_without_a_key_always_run(self):
+        self.post('{}', key='')
+        self.post('{}', key='')
+        self.assertEqual(self.calls, 2)
+
+    def test_retry_during_the_first_request_gets_409(self):
+        request = RequestFactory().post('/api/sales/', '{}', content_type='application/json')
+        row, claimed = idempotency.claim(idempotency.entry_key(request, 'key-1'), idempotency.fingerprint(request))
+        self.assertTrue(claimed)
+        response = self.post('{}')
+        self.assertEqual((response.status_code, response['Retry-After'], self.calls), (409, '1', 0))
+
+    def test_abandoned_and_expired_keys_are_taken_over(self):
+        self.post('{}')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(minutes=2))
+        self.assertNotIn('Idempotent-Replayed', self.post('{}'))
+        IdempotencyKey.objects.update(status_code=None, locked_until=timezone.now())
+        self.assertNotIn('Idempotent-Replayed', self.post('{}'))
+        self.assertEqual((self.calls, IdempotencyKey.objects.count()), (3, 1))
+
+    def test_credential_endpoints_are_never_stored(self):
+        self.post('{"email": "a@b.c"}', path='/api/auth/login/')
+        self.post('{"email": "a@b.c"}', path='/api/auth/login/')
+        self.assertEqual((self.calls, IdempotencyKey.objects.count()), (2, 0))
+
+
+@override_settings(HMS_PROFILING_ENABLED=True, CACHES=LOCMEM_CACHES)
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.middleware = profiling.ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def get(self, path='/api/lab-results/', **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = AnonymousUser()
+        return self.middleware(request)
+
+    def test_disabled_middleware_is_not_installed(self):
+        with override_settings(HMS_PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def test_header_from_a_non_admin_is_ignored(self):
+        self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE='1'))
+        self.assertEqual(profiling.recent(), [])
+
+    def test_sampling_rule_profiles_matching_paths(self):
+        profiling.set_rule(1, path_prefix='/api/lab-results/')
+        self.assertNotIn('X-Profile-Id', self.get('/api/patients/'))
+        response = self.get()
+        profile = profiling.load(response['X-Profile-Id'])
+        self.assertEqual((profile['path'], profile['engine'], profile['sql']['count']), ('/api/lab-results/', 'sampler', 0))
+        self.assertEqual([entry['id'] for entry in profiling.recent()], [profile['id']])
+
+    def test_sampler_folds_stacks(self):
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        with sampler:
+            deadline = time.monotonic() + 0.05
+            while time.monotonic() < deadline:
+                pass
+        self.assertTrue(sampler.counts)
+        self.assertIn('test_sampler_folds_stacks (hms/tests.py:', sampler.folded())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AuditCoverageTests(TestCase):
+    def setUp(self):
+        self.client = api_client(make_user())
+        self.patient = make_patient()
+
+    def test_sync_records_the_patients_it_returns(self):
+        with mock.patch.object(audit, 'record') as record:
+            response = self.client.get('/api/sync/', {'since': 0})
+        self.assertEqual(response.status_code, 200)
+        record.assert_called_once()
+        self.assertEqual(record.call_args.args[1:], ('view', Patient, [(self.patient.pk, self.patient.pk)]))
+
+    def test_duplicates_report_is_audited(self):
+        make_patient(email='other@example.com')
+        with mock.patch.object(audit, 'record') as record:
+            self.client.get('/api/patients/duplicates/')
+        self.assertEqual(len(record.call_args.args[3]), 2)
+
+    def test_malformed_id_filters_are_400(self):
+        for url in ('/api/invoices/?patient=abc', '/api/doctor-schedules/?doctor=x',
+                    '/api/audit-events/?patient=abc', '/api/audit-events/?user=1.5'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class DeferredFieldsTests(TestCase):
+    def setUp(self):
+        self.client = api_client(make_user())
+        self.patient = make_patient(medical_history='asthma since childhood. ' * 200)
+
+    def test_list_and_batch_leave_large_fields_out_until_expanded(self):
+        self.assertNotIn('medical_history', self.client.get('/api/patients/').data['results'][0])
+        batch = self.client.get('/api/patients/batch/', {'ids': self.patient.pk, 'expand': 'medical_history'})
+        self.assertEqual(batch.data['results'][self.patient.pk]['medical_history'], self.patient.medical_history)
+
+    def test_detail_carries_everything_and_text_is_compressed_at_rest(self):
+        response = self.client.get(f'/api/patients/{self.patient.pk}/')
+        self.assertEqual(response.data['medical_history'], self.patient.medical_history)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT medical_history FROM hms_patient WHERE id = %s', [self.patient.pk])
+            self.assertTrue(cursor.fetchone()[0].startswith(fields.MARKER))
+
+
+TASK_CALLS = []
+
+
+@tasks.task(name='hms.tests.record_call')
+def record_call(*args, **kwargs):
+    TASK_CALLS.append((args, kwargs))
+    if kwargs.get('fail'):
+        raise RuntimeError('failed on purpose')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    def test_dedupe_key_queues_one_task_until_it_is_claimed(self):
+        first = tasks.enqueue(record_call, dedupe_key='k')
+        self.assertEqual(tasks.enqueue(record_call, 2, dedupe_key='k').pk, first.pk)
+        tasks.claim('w1', 10)
+        self.assertNotEqual(tasks.enqueue(record_call, dedupe_key='k').pk, first.pk)
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_duplicate_queued_rows_are_refused_by_the_database(self):
+        Task.objects.create(name=record_call.task_name, dedupe_key='k')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Task.objects.create(name=record_call.task_name, dedupe_key='k')
+
+    def test_heartbeat_keeps_long_tasks_from_being_reclaimed(self):
+        tasks.enqueue(record_call)
+        [row] = tasks.claim('w1', 1)
+        stale = timezone.now() - datetime.timedelta(seconds=tasks.TASK_LOCK_TIMEOUT + 1)
+        Task.objects.update(locked_at=stale)
+        self.assertEqual(tasks.heartbeat('w1', [row.pk]), 1)
+        self.assertEqual(tasks.claim('w2', 1), [])
+        Task.objects.update(locked_at=stale)
+        self.assertEqual([reclaimed.locked_by for reclaimed in tasks.claim('w2', 1)], ['w2'])
+
+    def test_execute_records_done_and_retries_failures(self):
+        tasks.enqueue(record_call, 1, flag=True)
+        tasks.enqueue(record_call, fail=True)
+        with self.assertLogs('hms.tasks', 'WARNING'):
+            for row in tasks.claim('w1', 2):
+                tasks.execute(row)
+        self.assertEqual(TASK_CALLS, [((1,), {'flag': True}), ((), {'fail': True})])
+        self.assertEqual(sorted(Task.objects.values_list('status', 'attempts')), [('done', 1), ('queued', 1)])
+
+    def test_a_worker_that_lost_its_claim_does_not_overwrite_the_outcome(self):
+        tasks.enqueue(record_call)
+        [row] = tasks.claim('w1', 1)
+        Task.objects.update(locked_by='w2')
+        tasks.execute(row)
+        self.assertEqual(Task.objects.get().status, 'running')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = api_client(make_user())
+
+    def test_snapshot_is_shared_through_the_table(self):
+        built = dashboard.build_snapshot()
+        caches['default'].clear()
+        self.assertEqual(dashboard.get_snapshot()['etag'], built['etag'])
+        response = self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=built['etag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_snapshot_is_rebuilt_by_one_request(self):
+        dashboard.build_snapshot()
+        DashboardSnapshot.objects.update(generated_at=timezone.now() - datetime.timedelta(hours=1))
+        caches['default'].clear()
+        with mock.patch.object(tasks, 'schedule_dashboard_refresh'):
+            self.assertEqual(self.client.get('/api/dashboard/').status_code, 200)
+        self.assertGreater(DashboardSnapshot.objects.get().generated_at, timezone.now() - datetime.timedelta(minutes=1))
+
+    def test_writes_in_a_burst_queue_one_refresh(self):
+        for _ in range(3):
+            tasks.request_dashboard_refresh()
+        self.assertEqual(Task.objects.filter(name='refresh_dashboard').count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class SaleAllocationTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.medicine = make_medicine()
+        self.late = self.batch('LATE', 60, 5)
+        self.soon = self.batch('SOON', 10, 5)
+
+    def batch(self, lot, days, quantity):
+        return MedicineBatch.objects.create(
+            medicine=self.medicine, lot_number=lot, expiry_date=self.today + datetime.timedelta(days=days), quantity=quantity,
+        )
+
+    def sell(self, quantity):
+        return Sale.objects.create(medicine=self.medicine, quantity=quantity, total_amount=Decimal(quantity), date=self.today)
+
+    def quantities(self):
+        return list(MedicineBatch.objects.order_by('lot_number').values_list('lot_number', 'quantity'))
+
+    def test_earliest_expiry_is_drawn_first_and_split_across_batches(self):
+        sale = self.sell(7)
+        self.assertEqual(self.quantities(), [('LATE', 3), ('SOON', 0)])
+        self.assertEqual(sorted(sale.allocations.values_list('batch__lot_number', 'quantity')), [('LATE', 2), ('SOON', 5)])
+
+    def test_expired_stock_is_never_sold(self):
+        self.batch('GONE', -1, 4)
+        with self.assertRaises(ValidationError):
+            self.sell(12)
+        self.assertEqual((Medicine.objects.get().stock, Sale.objects.count()), (14, 0))
+
+    def test_unbatched_stock_covers_the_remainder(self):
+        Medicine.objects.update(stock=F('stock') + 3)
+        self.sell(13)
+        self.assertEqual((self.quantities(), Medicine.objects.get().stock), ([('LATE', 0), ('SOON', 0)], 0))
+
+    def test_update_and_delete_give_quantities_back(self):
+        sale = self.sell(7)
+        sale.quantity = 2
+        sale.save()
+        self.assertEqual(self.quantities(), [('LATE', 5), ('SOON', 3)])
+        sale.delete()
+        self.assertEqual((self.quantities(), Medicine.objects.get().stock), ([('LATE', 5), ('SOON', 5)], 10))
+
+    def test_batches_with_sales_cannot_be_deleted(self):
+        self.sell(1)
+        with self.assertRaises(ValidationError):
+            self.soon.delete()
+        with self.assertRaises(RestrictedError):
+            MedicineBatch.objects.filter(pk=self.soon.pk).delete()
+        # the medicine still goes, with its sales and batches
+        self.medicine.delete()
+        self.assertEqual((MedicineBatch.objects.count(), Sale.objects.count()), (0, 0))
+
+    def test_expiring_soon_window(self):
+        client = api_client(make_user())
+        url = '/api/medicines/expiring_soon/'
+        self.assertEqual([row['lot_number'] for row in client.get(url, {'days': 30}).data], ['SOON'])
+        self.assertEqual([row['lot_number'] for row in client.get(url).data], ['SOON'])
+        self.assertEqual([row['lot_number'] for row in client.get(url, {'days': 3650}).data], ['SOON', 'LATE'])
+        for days in ('soon', '-1', '3651', '10' * 20):
+            self.assertEqual(client.get(url, {'days': days}).status_code, 400, days)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class OnboardingTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = api_client(make_user())
+
+    def onboard(self, *rows):
+        return self.client.post('/api/users/onboard/', {'users': list(rows)}, format='json')
+
+    def test_accounts_get_tokens_and_the_dashboard_is_refreshed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.onboard(
+                {'email': 'a@example.com', 'name': 'A', 'role': 'receptionist', 'password': 'violet-harbour-42'},
+                {'email': 'b@example.com', 'name': 'B', 'role': 'doctor'},
+            )
+        self.assertEqual(response.status_code, 201)
+        first, second = response.data['created']
+        self.assertNotIn('temporary_password', first)
+        self.assertTrue(User.objects.get(email='b@example.com').check_password(second['temporary_password']))
+        self.assertEqual(User.objects.get(email='a@example.com').auth_token.key, first['token'])
+        self.assertTrue(Task.objects.filter(name='refresh_dashboard').exists())
+
+    def test_passwords_go_through_the_validators(self):
+        response = self.onboard({'email': 'a@example.com', 'name': 'A', 'role': 'receptionist', 'password': '12345678'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.data['users'][0])
+        self.assertFalse(User.objects.filter(email='a@example.com').exists())
+
+    def test_duplicate_and_oversized_batches_are_refused(self):
+        row = {'email': 'a@example.com', 'name': 'A', 'role': 'receptionist'}
+        self.assertEqual(self.onboard(row, row).data['users'][1], {'email': ['Listed more than once in this request.']})
+        rows = [{**row, 'email': f'u{i}@example.com'} for i in range(views.ONBOARDING_MAX_USERS + 1)]
+        self.assertEqual(self.onboard(*rows).status_code, 400)
+
+    def test_email_taken_while_onboarding_is_a_bad_request(self):
+        def register_first(rows):
+            make_user('a')
+            raise IntegrityError('UNIQUE constraint failed: hms_user.email')
+
+        with mock.patch.object(onboarding, 'onboard_staff', side_effect=register_first):
+            response = self.onboard({'email': 'a@example.com', 'name': 'A', 'role': 'receptionist'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['users'][0], {'email': ['A user with this email already exists.']})
+
+
+@skipUnless(find_spec('pyarrow'), 'pyarrow is not installed')
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = api_client(make_user())
+        make_medicine(name='Amoxicillin')
+        make_medicine(name='Ibuprofen')
+        Medicine.objects.update(created_at=timezone.now() - datetime.timedelta(days=1))
+
+    def test_limit_is_clamped_to_at_least_one_row(self):
+        for limit in ('0', '-5'):
+            response = self.client.get('/api/exports/medicines/', {'limit': limit})
+            self.assertEqual((response.status_code, response['X-Export-Rows']), (200, '1'))
+        self.assertEqual(self.client.get('/api/exports/medicines/')['X-Export-Rows'], '2')
+
+    def test_non_integer_limit_is_a_bad_request(self):
+        self.assertEqual(self.client.get('/api/exports/medicines/', {'limit': 'all'}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.client = api_client(make_user())
+
+    def sync(self, since):
+        return self.client.get('/api/sync/', {'since': since}).data
+
+    def test_a_late_commit_below_the_cursor_is_still_delivered(self):
+        # an id taken by a transaction that commits only after the next sync
+        reserved = ChangeLog.objects.create(model='hms.patient', object_id=0, action='created').pk
+        ChangeLog.objects.filter(pk=reserved).delete()
+        first = make_patient()
+        page = self.sync(0)
+        self.assertEqual([row['id'] for row in page['changes']['patients']['created']], [first.pk])
+
+        late = make_patient(first_name='Bea', email='bea@example.com')
+        ChangeLog.objects.filter(object_id=late.pk).update(id=reserved)
+        page = self.sync(page['cursor'])
+        self.assertEqual([row['id'] for row in page['changes']['patients']['created']], [late.pk])
+
+    def test_edits_before_the_first_sync_still_read_as_created(self):
+        patient = make_patient()
+        patient.address = 'Mombasa'
+        patient.save()
+        self.assertEqual(len(self.sync(0)['changes']['patients']['created']), 1)
+        cursor = self.sync(0)['cursor']
+        patient.save()
+        self.assertEqual(len(self.sync(cursor)['changes']['patients']['updated']), 1)
+
+    def test_archived_rows_leave_tombstones(self):
+        medicine = make_medicine(stock=5)
+        sale = Sale.objects.create(medicine=medicine, quantity=1, total_amount=Decimal('2.50'), date=datetime.date(2020, 1, 1))
+        cursor = self.sync(0)['cursor']
+        call_command('archive_records', before='2021-01-01', model=['sale'], stdout=StringIO())
+        self.assertEqual(self.sync(cursor)['changes']['sales']['deleted'], [sale.pk])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.medicine = make_medicine(stock=100)
+        today = timezone.now().date()
+        days = [datetime.date(2020, 1, day) for day in range(1, 11)] + [today, today]
+        self.sales = [
+            Sale.objects.create(medicine=self.medicine, quantity=1, total_amount=Decimal('2.50'), date=day) for day in days
+        ]
+        # invoiced sales stay hot, so they interleave with the archived ones
+        for sale in (self.sales[2], self.sales[6]):
+            Invoice.objects.create(kind='sale', sale=sale, amount=Decimal('2.50'))
+        call_command('archive_records', before='2021-01-01', model=['sale'], stdout=StringIO())
+
+    def test_rows_move_without_touching_stock(self):
+        self.assertEqual((Sale.objects.count(), SaleArchive.objects.count()), (4, 8))
+        self.assertEqual(Medicine.objects.get().stock, 88)
+
+    def test_list_pages_merge_hot_and_archived_rows(self):
+        expected = [sale.pk for sale in sorted(self.sales, key=lambda sale: (sale.date, sale.pk), reverse=True)]
+        chain = views.ArchiveChain(Sale.objects.order_by('-date'), SaleArchive.objects.order_by('-date'))
+        self.assertEqual(chain.count(), len(expected))
+        self.assertEqual([row.pk for row in chain], expected)
+        for start in range(len(expected) + 1):
+            self.assertEqual([row.pk for row in chain[start:]], expected[start:])
+            for stop in range(start, len(expected) + 1):
+                self.assertEqual([row.pk for row in chain[start:stop]], expected[start:stop], (start, stop))
+
+    @skipUnless(find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_exports_include_archived_rows(self):
+        import pyarrow
+
+        exported, watermark = [], None
+        while True:
+            body, rows, watermark = exports.export_to_bytes('sales', fmt='arrow', watermark=watermark, limit=3)
+            if not rows:
+                break
+            exported += pyarrow.ipc.open_file(body).read_all().column('id').to_pylist()
+        self.assertEqual(exported, [sale.pk for sale in self.sales[:10]])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class OptimisticConcurrencyTests(TestCase):
+    def setUp(self):
+        self.client = api_client(make_user())
+        self.patient = make_patient()
+        self.url = f'/api/patients/{self.patient.pk}/'
+
+    def test_update_returns_the_etag_a_get_would(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(self.url, {'address': 'Mombasa'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_delete_checks_the_version(self):
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH='"7"').status_code, 412)
+        read = Patient.objects.get()
+        Patient.objects.update(version=F('version') + 1)
+        # an edit landing between the If-Match check and the delete
+        with mock.patch.object(views.PatientViewSet, 'get_object', return_value=read):
+            self.assertEqual(self.client.delete(self.url).status_code, 412)
+        self.assertTrue(Patient.objects.exists())
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=f'"{read.version + 1}"').status_code, 204)
+        self.assertFalse(Patient.objects.exists())
+
+
+class PaymentLedgerTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.invoice = Invoice.objects.create(patient=self.patient, kind='registration', amount=Decimal('100.00'))
+
+    def state(self, invoice=None):
+        invoice = Invoice.objects.get(pk=(invoice or self.invoice).pk)
+        return invoice.amount_paid, invoice.status
+
+    def test_payments_move_the_balance_and_status(self):
+        payment = Payment.objects.create(invoice=self.invoice, amount=Decimal('40.00'))
+        self.assertEqual(self.state(), (Decimal('40.00'), 'partially_paid'))
+        payment.amount = Decimal('100.00')
+        payment.save()
+        self.assertEqual(self.state(), (Decimal('100.00'), 'paid'))
+        self.assertEqual(Patient.objects.get().payment_status, 'paid')
+        payment.delete()
+        self.assertEqual(self.state(), (Decimal('0.00'), 'not_paid'))
+        self.assertEqual(Patient.objects.get().payment_status, 'not_paid')
+
+    def test_moving_a_payment_credits_the_new_invoice(self):
+        other = Invoice.objects.create(patient=self.patient, amount=Decimal('10.00'))
+        payment = Payment.objects.create(invoice=self.invoice, amount=Decimal('10.00'))
+        payment.invoice = other
+        payment.save()
+        self.assertEqual((self.state(), self.state(other)), ((Decimal('0.00'), 'not_paid'), (Decimal('10.00'), 'paid')))
+
+    def test_void_invoices_stay_void(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(status='void')
+        Payment.objects.create(invoice=self.invoice, amount=Decimal('100.00'))
+        self.assertEqual(self.state(), (Decimal('100.00'), 'void'))
+
+    def test_non_positive_payments_are_refused(self):
+        with self.assertRaises(ValidationError):
+            Payment.objects.create(invoice=self.invoice, amount=Decimal('0.00'))
+        self.assertEqual(self.state(), (Decimal('0.00'), 'not_paid'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class OutstandingBalanceTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = api_client(make_user())
+        self.patient = make_patient()
+        self.invoice = Invoice.objects.create(patient=self.patient, kind='other', amount=Decimal('100.00'))
+        self.payment = Payment.objects.create(invoice=self.invoice, amount=Decimal('40.00'))
+        three_days_ago = timezone.now() - datetime.timedelta(days=3)
+        Invoice.objects.update(created_at=three_days_ago)
+        Payment.objects.update(created_at=three_days_ago)
+        self.as_of = (timezone.now() - datetime.timedelta(days=2)).date().isoformat()
+
+    def outstanding(self, **params):
+        return self.client.get('/api/invoices/outstanding/', params).data['total_outstanding']
+
+    def test_live_and_closed_day_balances(self):
+        self.assertEqual(self.outstanding(), 60.0)
+        self.assertEqual(self.outstanding(as_of=self.as_of), 60.0)
+        self.assertEqual(self.outstanding(by='doctor', as_of=self.as_of), 60.0)
+
+    def test_changes_to_closed_days_retire_the_cached_balances(self):
+        self.assertEqual(self.outstanding(as_of=self.as_of), 60.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.get().delete()
+        self.assertEqual(self.outstanding(as_of=self.as_of), 100.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/invoices/{self.invoice.pk}/', {'status': 'void'}, format='json')
+        self.assertEqual(self.outstanding(as_of=self.as_of), 0)
+
+    def test_impossible_as_of_is_a_bad_request(self):
+        self.assertEqual(self.client.get('/api/invoices/outstanding/', {'as_of': '2026-02-30'}).status_code, 400)
+
+    def test_todays_payments_leave_closed_days_cached(self):
+        generation = cache_utils.generation(Invoice.LEDGER_GENERATION)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(invoice=Invoice.objects.create(patient=self.patient, amount=Decimal('5.00')), amount=Decimal('5.00'))
+        self.assertEqual(cache_utils.generation(Invoice.LEDGER_GENERATION), generation)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class RevenueAnalyticsTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = api_client(make_user())
+        self.amoxicillin = make_medicine(stock=50)
+        self.ibuprofen = make_medicine(stock=50, name='Ibuprofen')
+        for medicine, quantity, amount, day in (
+            (self.amoxicillin, 2, '5.00', datetime.date(2020, 1, 1)),
+            (self.ibuprofen, 1, '3.00', datetime.date(2020, 1, 1)),
+            (self.amoxicillin, 4, '10.00', datetime.date(2020, 1, 2)),
+            (self.ibuprofen, 3, '9.00', datetime.date(2021, 6, 1)),
+        ):
+            Sale.objects.create(medicine=medicine, quantity=quantity, total_amount=Decimal(amount), date=day)
+
+    def buckets(self, group_by, **kwargs):
+        return [(row[key], row['revenue'], row['units'], row['sales_count'])
+                for row in Sale.revenue_breakdown(group_by=group_by, **kwargs)
+                for key in [('period' if group_by in Sale.PERIOD_TRUNCS else 'medicine__name')]]
+
+    def test_buckets_are_the_same_before_and_after_archiving(self):
+        expected_days = self.buckets('day')
+        expected_medicines = self.buckets('medicine', limit=1)
+        self.assertEqual([(day, revenue) for day, revenue, _, _ in expected_days],
+                         [(datetime.date(2020, 1, 1), Decimal('8.00')), (datetime.date(2020, 1, 2), Decimal('10.00')),
+                          (datetime.date(2021, 6, 1), Decimal('9.00'))])
+        self.assertEqual(expected_medicines, [('Amoxicillin', Decimal('15.00'), 6, 2)])
+        # New Year's Day moves to the archive, splitting January and Amoxicillin across the tables
+        call_command('archive_records', before='2020-01-02', model=['sale'], stdout=StringIO())
+        self.assertEqual(self.buckets('day'), expected_days)
+        self.assertEqual(self.buckets('medicine', limit=1), expected_medicines)
+        self.assertEqual(self.buckets('month', start_date='2020-01-01', end_date='2020-12-31')[0][1:], (Decimal('18.00'), 7, 3))
+
+    def test_endpoint_validates_and_limits(self):
+        url = '/api/sales/analytics/'
+        self.assertEqual(self.client.get(url, {'group_by': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'top': '-1'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start_date': '2020-13-01'}).status_code, 400)
+        response = self.client.get(url, {'group_by': 'category', 'top': 1})
+        self.assertEqual([(row['medicine__category'], row['revenue']) for row in response.data['results']], [('antibiotic', 27.0)])
+
+    def test_backdated_sale_retires_closed_range_analytics(self):
+        url = '/api/sales/analytics/'
+        params = {'group_by': 'month', 'start_date': '2020-01-01', 'end_date': '2020-12-31'}
+        revenue = lambda: [row['revenue'] for row in self.client.get(url, params).data['results']]
+        self.assertEqual(revenue(), [18.0])
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = Sale.objects.create(medicine=self.ibuprofen, quantity=1, total_amount=Decimal('4.00'),
+                                       date=datetime.date(2020, 3, 1))
+        self.assertEqual(revenue(), [18.0, 4.0])
+        # moving it out of the range is as visible as moving it in
+        sale = Sale.objects.get(pk=sale.pk)
+        sale.date = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.save()
+        self.assertEqual(revenue(), [18.0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.client = api_client(make_user())
+        self.patient = make_patient()
+
+    def test_unchanged_list_is_a_304_until_a_row_changes(self):
+        first = self.client.get('/api/patients/')
+        self.assertEqual(self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=f"W/{first['ETag']}").status_code, 304)
+        self.assertEqual(self.client.get('/api/patients/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+        make_patient(first_name='Bea', email='bea@example.com')
+        second = self.client.get('/api/patients/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_cached_list_pages_keep_the_validators_of_their_body(self):
+        first = self.client.get('/api/sales/')
+        cached = self.client.get('/api/sales/')
+        self.assertEqual((cached['ETag'], cached.data), (first['ETag'], first.data))
+        self.assertEqual(self.client.get('/api/sales/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_archiving_and_purging_change_the_list_validators(self):
+        medicine = make_medicine(stock=10)
+        for day in (1, 2):
+            Sale.objects.create(medicine=medicine, quantity=1, total_amount=Decimal('2.50'), date=datetime.date(2020, 1, day))
+        etag = self.client.get('/api/sales/')['ETag']
+        call_command('archive_records', before='2021-01-01', model=['sale'], stdout=StringIO())
+        etag = self.assertChanged('/api/sales/', etag)['ETag']
+        # the hot table is untouched by a purge of the archive
+        SaleArchive.objects.filter(date=datetime.date(2020, 1, 1)).delete()
+        self.assertEqual(len(self.assertChanged('/api/sales/', etag).data['results']), 1)
+
+    def assertChanged(self, url, etag):
+        # skip the 30s list cache, whose entries keep the validators of the body they were built with
+        caches['default'].clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_stale_if_match_is_a_412(self):
+        url = f'/api/patients/{self.patient.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.client.patch(url, {'address': 'Mombasa'}, format='json')
+        response = self.client.patch(url, {'address': 'Kisumu'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Patient.objects.get().address, 'Mombasa')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheUtilsTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        threads = [threading.Thread(target=lambda: results.append(cache_utils.get_or_compute('k', compute, ttl=60))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['value'] * 4))
+
+    def test_stale_value_is_served_while_another_caller_refreshes(self):
+        cache_utils.get_or_compute('k', lambda: 'old', ttl=60)
+        entry = caches['default'].get('k')
+        caches['default'].set('k', {**entry, 'expires': time.time() - 1}, 60)
+        caches['default'].add('k:lock', 1)
+        self.assertEqual(cache_utils.get_or_compute('k', lambda: 'new', ttl=60), 'old')
+        self.assertIsNone(cache_utils.recompute('k', lambda: 'new', ttl=60))
+        caches['default'].delete('k:lock')
+        self.assertEqual(cache_utils.get_or_compute('k', lambda: 'new', ttl=60), 'new')
+
+    def test_bumped_or_evicted_generations_never_repeat(self):
+        first = cache_utils.generation('family')
+        self.assertEqual(cache_utils.generation('family'), first)
+        cache_utils.bump_generation('family')
+        second = cache_utils.generation('family')
+        caches['default'].clear()
+        self.assertEqual(len({first, second, cache_utils.generation('family')}), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class WarmCacheTests(TestCase):
+    def test_warming_fills_the_list_cache_the_next_request_reads(self):
+        caches['default'].clear()
+        client = api_client(make_user())
+        call_command('warm_cache', host='testserver', stdout=StringIO())
+        self.assertIsNotNone(caches['default'].get('list:SaleViewSet:application/json:http://testserver/api/sales/'))
+        self.assertIsNotNone(dashboard.get_snapshot())
+        with mock.patch.object(Sale, 'revenue_breakdown') as breakdown:
+            self.assertEqual(client.get('/api/sales/analytics/').status_code, 200)
+        breakdown.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HMS_AUDIT_ENABLED=False)
+class MultiGetTests(TestCase):
+    def setUp(self):
+        self.client = api_client(make_user())
+        medicine = make_medicine(stock=10)
+        self.old, self.new = (
+            Sale.objects.create(medicine=medicine, quantity=1, total_amount=Decimal('2.50'), date=day)
+            for day in (datetime.date(2020, 1, 1), timezone.now().date())
+        )
+        call_command('archive_records', before='2021-01-01', model=['sale'], stdout=StringIO())
+
+    def test_hot_and_archived_rows_in_one_query_each(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/sales/batch/', {'ids': f'{self.new.pk},{self.old.pk},{self.new.pk},999'})
+        self.assertEqual(list(response.data['results']), [self.new.pk, self.old.pk])
+        self.assertEqual(response.data['results'][self.old.pk]['date'], '2020-01-01')
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_ids_can_be_posted(self):
+        response = self.client.post('/api/sales/batch/', {'ids': [self.new.pk]}, format='json')
+        self.assertEqual((list(response.data['results']), response.data['missing']), ([self.new.pk], []))
+
+    def test_malformed_or_oversized_id_lists_are_refused(self):
+        self.assertEqual(self.client.get('/api/sales/batch/', {'ids': '1,two'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/sales/batch/', {'ids': 5}, format='json').status_code, 400)
+        too_many = ','.join(str(pk) for pk in range(1, views.MULTI_GET_MAX_IDS + 2))
+        self.assertEqual(self.client.get('/api/sales/batch/', {'ids': too_many}).status_code, 400)
+
+
+class EventStreamTests(SimpleTestCase):
+    def test_wsgi_requests_are_refused(self):
+        response = async_to_sync(views.event_stream)(RequestFactory().get('/api/events/'))
+        self.assertEqual(response.status_code, 503)
+
+    def test_query_string_token_is_not_accepted(self):
+        request = AsyncRequestFactory().get('/api/events/', {'token': 'abc'})
+        self.assertEqual(async_to_sync(views.event_stream)(request).status_code, 401)
+
+
+@skipUnless(find_spec('msgpack'), 'msgpack is not installed')
+class MessagePackTests(SimpleTestCase):
+    def test_types_survive_a_round_trip(self):
+        data = {
+            'total_amount': Decimal('12.50'),
+            'date': datetime.date(2026, 1, 31),
+            'created_at': datetime.datetime(2026, 1, 31, 8, 30, tzinfo=datetime.timezone.utc),
+            'time': datetime.time(9, 15),
+            'items': [1, 'two', None],
+        }
+        self.assertEqual(renderers.unpackb(renderers.MessagePackRenderer().render(data)), data)
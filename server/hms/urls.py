@@ -1,24 +1,40 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MedicineViewSet, RegisterView, LoginView, UserViewSet, PatientViewSet, DiagnosisViewSet, AppointmentViewSet, SaleViewSet, LabOrderViewSet, LabResultViewSet
+from .views import MedicineViewSet, MedicineBatchViewSet, RegisterView, LoginView, UserViewSet, PatientViewSet, DiagnosisViewSet, AppointmentViewSet, DoctorScheduleViewSet, SaleViewSet, LabOrderViewSet, LabResultViewSet, InvoiceViewSet, PaymentViewSet, AuditEventViewSet, SyncView, DashboardView, ExportView, DoctorAvailabilityView, ProfileListView, ProfileDetailView, ProfilingSettingsView, event_stream
 
 router = DefaultRouter()
 router.register(r'medicines', MedicineViewSet, basename='medicine')
+router.register(r'medicine-batches', MedicineBatchViewSet, basename='medicine-batch')
 router.register(r'sales', SaleViewSet, basename='sale')
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'patients', PatientViewSet, basename='patient')
 router.register(r'diagnoses', DiagnosisViewSet, basename='diagnosis')
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
+router.register(r'doctor-schedules', DoctorScheduleViewSet, basename='doctor-schedule')
 router.register(r'lab-orders', LabOrderViewSet, basename='lab-order')
 router.register(r'lab-results', LabResultViewSet, basename='lab-result')
+router.register(r'invoices', InvoiceViewSet, basename='invoice')
+router.register(r'payments', PaymentViewSet, basename='payment')
+router.register(r'audit-events', AuditEventViewSet, basename='audit-event')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', LoginView.as_view(), name='login'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('events/', event_stream, name='event-stream'),
+    path('exports/<str:name>/', ExportView.as_view(), name='export'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/settings/', ProfilingSettingsView.as_view(), name='profiling-settings'),
+    path('profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('profiles/<str:profile_id>/folded/', ProfileDetailView.as_view(), {'folded': True}, name='profile-folded'),
+    path('doctors/availability/', DoctorAvailabilityView.as_view(), name='doctor-availability'),
+    path('doctors/<int:pk>/availability/', DoctorAvailabilityView.as_view(), name='doctor-availability-detail'),
     path('patients/count/', PatientViewSet.as_view({'get': 'count'}), name='patient-count'),
     path('medicines/count/', MedicineViewSet.as_view({'get': 'count'}), name='medicine-count'),
     path('medicines/low_stock/', MedicineViewSet.as_view({'get': 'low_stock'}), name='low-stock-medicines'),
+    path('medicines/expiring_soon/', MedicineViewSet.as_view({'get': 'expiring_soon'}), name='expiring-soon-medicines'),
     path('diagnoses/count/', DiagnosisViewSet.as_view({'get': 'count'}), name='diagnosis-count'),
     path('total_revenue/', SaleViewSet.as_view({'get': 'total_revenue'}), name='total-revenue'),
     path('today_sales/', SaleViewSet.as_view({'get': 'today_sales'}), name='today-sales'),
@@ -1,42 +1,670 @@
+from datetime import timedelta
 from django.utils import timezone
 from django.shortcuts import render
 from rest_framework import viewsets
-from .models import LabOders, LabResults, User, Patient, Medicine, Diagnosis,   Appointments, Sale
+from .models import LabOders, LabResults, User, Patient, Medicine, MedicineBatch, Diagnosis,   Appointments, Sale, Invoice, Payment, ChangeLog
+from .models import AuditEvent, DoctorSchedule, VersionConflict, VersionedModel
+from .models import SaleArchive, DiagnosisArchive, LabResultsArchive
 from .serializers import LabResultSerializer, UserSerializer, PatientSerializer, MedicineSerializer, DiagnosisSerializer,LabResultSerializer , LabOrderSerializer, AppointmentSerializer, SaleSerializer
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from django.contrib.auth import authenticate
-from .serializers import RegisterSerializer, LoginSerializer
+from .serializers import RegisterSerializer, LoginSerializer, MedicineBatchSerializer, InvoiceSerializer, PaymentSerializer, PatientSummarySerializer
+from .serializers import AuditEventSerializer, DoctorScheduleSerializer, StaffOnboardingSerializer
 from rest_framework.decorators import api_view, action
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from django.core.exceptions import ValidationError as DjangoValidationError
-from django.db.models import Sum
+from django.db.models import Count, Max, Q, Sum
+from django.db import IntegrityError, transaction
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.exceptions import APIException
+import hashlib
+from django.utils.dateparse import parse_date, parse_datetime
+from django.conf import settings
+from .db_router import set_replica_reads, reset_replica_reads, is_pinned, pin_to_primary
+from . import audit, cache_utils, dashboard, events, exports, matching, onboarding, profiling, tasks
+from .renderers import NativeTypesMixin
+from django.http import Http404, HttpResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+import asyncio
+import heapq
+import itertools
+import json
+
+# Analytics over periods that have fully ended are cached for a day; open ranges for 30s like list pages
+ANALYTICS_CLOSED_TIMEOUT = 60 * 60 * 24
+ANALYTICS_OPEN_TIMEOUT = 30
+# Outstanding balances as of a closed day only change with edits to old rows, which retire the
+# whole cache generation (Invoice.LEDGER_GENERATION); keep them for a week
+OUTSTANDING_CLOSED_TIMEOUT = 60 * 60 * 24 * 7
+
+# /api/sync/ paging
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PAGE_SIZE = 2000
+
+# accounts accepted by one /api/users/onboard/ request. Every account costs a PBKDF2 hash (about
+# half a second of CPU), so a full request has to finish well inside the worker timeout.
+ONBOARDING_MAX_USERS = 50
+
+# ids accepted by one multi-get (<list>/batch/)
+MULTI_GET_MAX_IDS = 200
+
+# availability is reported for a week unless ?to= says otherwise, and never for more than this
+AVAILABILITY_DEFAULT_DAYS = 7
+AVAILABILITY_MAX_DAYS = 31
+
+# furthest ahead /api/medicines/expiring_soon/ looks; timedelta overflows long before int() does
+EXPIRING_MAX_DAYS = 3650
+
+# /api/exports/<name>/ rows per file; the ETL keeps calling with the returned watermark
+EXPORT_PAGE_ROWS = 50000
+EXPORT_MAX_PAGE_ROWS = 200000
+
+# idle SSE connections get a comment line this often so proxies don't close them
+SSE_KEEPALIVE_SECONDS = 15
 
 # Create your views here.
 User = get_user_model()
 
-@method_decorator(cache_page(30), name='list')
-class UserViewSet(viewsets.ModelViewSet):
+
+def sales_analytics_payload(group_by, start_date=None, end_date=None, limit=None, refresh=False):
+    """Revenue breakdown for /api/sales/analytics/, cached (stampede-safe) per parameter set.
+
+    `refresh` recomputes the cached entry now (the refresh_sales_rollups task does).
+    """
+    def compute():
+        rows = Sale.revenue_breakdown(group_by=group_by, start_date=start_date, end_date=end_date, limit=limit)
+        for row in rows:
+            row['revenue'] = float(row['revenue'] or 0)
+        return {
+            'group_by': group_by,
+            'start_date': start_date,
+            'end_date': end_date,
+            'results': rows,
+            'currency': '$',
+        }
+
+    # a range that ended before today only changes with backdated sales, which retire the
+    # whole cache generation (Sale.REVENUE_GENERATION)
+    closed = end_date is not None and end_date < timezone.now().date()
+    revenue = cache_utils.generation(Sale.REVENUE_GENERATION)
+    key = f"sales-analytics:{revenue}:{group_by}:{start_date}:{end_date}:{limit}"
+    ttl = ANALYTICS_CLOSED_TIMEOUT if closed else ANALYTICS_OPEN_TIMEOUT
+    if refresh:
+        return cache_utils.recompute(key, compute, ttl=ttl)
+    return cache_utils.get_or_compute(key, compute, ttl=ttl)
+
+
+class IsAdminRole(permissions.BasePermission):
+    """Hospital administrators (role `admin`) and superusers."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.role == 'admin' or user.is_superuser))
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from a read replica unless the user wrote recently (read-your-writes).
+
+    Has no effect (and costs no cache lookups) when no replicas are configured.
+    """
+
+    def _reads_only(self, request):
+        # the multi-get also takes its ids as a POST body, but only ever reads
+        return request.method in permissions.SAFE_METHODS or getattr(self, 'action', None) == 'batch'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if settings.DATABASE_REPLICAS:
+            use_replica = self._reads_only(request) and not is_pinned(request.user)
+            self._replica_token = set_replica_reads(use_replica)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            reset_replica_reads(token)
+            self._replica_token = None
+        if settings.DATABASE_REPLICAS and not self._reads_only(request) and response.status_code < 400:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified for list and retrieve, checked before anything is serialized.
+
+    Validators come from COUNT(*) and MAX(updated_at) over the filtered queryset, plus
+    MAX(updated_at) of `etag_related_models` whose fields are nested in the payload and, for
+    lists that merge in an `archive_queryset`, its COUNT(*) and MAX(archived_at). The check
+    runs in `initial()`, ahead of the list cache, so an unchanged collection costs one indexed
+    aggregate per table and an empty 304.
+    """
+    etag_related_models = ()
+    _validators = None
+
+    def _compute_validators(self, request, detail=None):
+        """(ETag, Last-Modified) of the list, or of one row when `detail` (default: on retrieve)."""
+        if detail is None:
+            detail = self.action == 'retrieve'
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        if detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        versioned = detail and issubclass(queryset.model, VersionedModel)
+        aggregates = {'count': Count('pk'), 'last': Max('updated_at')}
+        if versioned:
+            aggregates['version'] = Max('version')
+        stats = queryset.aggregate(**aggregates)
+        stamps = [stats['last']]
+        counts = [str(stats['count'])]
+        if not detail and getattr(self, 'archive_queryset', None) is not None:
+            # lists merge in the archive (ArchiveReadMixin), which archiving and purging change
+            # without necessarily moving the hot table's count or MAX(updated_at)
+            archived = self.get_archive_queryset().order_by().aggregate(count=Count('pk'), last=Max('archived_at'))
+            counts.append(str(archived['count']))
+            stamps.append(archived['last'])
+        for model in self.etag_related_models:
+            stamps.append(model.objects.aggregate(last=Max('updated_at'))['last'])
+        parts = [
+            queryset.model._meta.label,
+            *counts,
+            request.get_full_path(),
+            request.accepted_media_type or '',
+        ] + [stamp.isoformat() if stamp else '' for stamp in stamps]
+        digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+        # a versioned row's ETag leads with its version, which is what If-Match is checked against
+        etag = quote_etag(f"{stats['version']}-{digest}" if versioned else digest)
+        known = [stamp for stamp in stamps if stamp]
+        last_modified = int(max(known).timestamp()) if known else None
+        return etag, last_modified
+
+    def _is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tags = parse_etags(if_none_match)
+            return '*' in tags or etag in tags or etag in [tag.removeprefix('W/') for tag in tags]
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+        return since is not None and last_modified is not None and last_modified <= since
+
+    def _set_validators(self, response):
+        etag, last_modified = self._validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._validators = None
+        if request.method in ('GET', 'HEAD') and self.action in ('list', 'retrieve'):
+            self._validators = self._compute_validators(request)
+            if self._is_not_modified(request, *self._validators):
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return self._set_validators(Response(status=status.HTTP_304_NOT_MODIFIED))
+        return super().handle_exception(exc)
+
+    # headers are attached inside list/retrieve so a cached page keeps the validators of its body
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        return self._set_validators(response) if self._validators else response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        return self._set_validators(response) if self._validators else response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'This record was changed by someone else. Reload it and try again.'
+    default_code = 'precondition_failed'
+
+
+def id_query_param(request, name):
+    """The integer id given in query param `name`, or None when it's absent; anything else is a 400."""
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    if not raw.isdigit():
+        raise DRFValidationError({name: 'Must be an integer id.'})
+    return int(raw)
+
+
+def if_match_version(request):
+    """The version named by If-Match (`"<version>"` or a retrieve ETag), None when absent or `*`.
+
+    A tag that names no version can't match the current row, so it parses as -1.
+    """
+    header = request.headers.get('If-Match')
+    if not header:
+        return None
+    tags = parse_etags(header)
+    if not tags or '*' in tags:
+        return None
+    version = tags[0].removeprefix('W/').strip('"').partition('-')[0]
+    return int(version) if version.isdigit() else -1
+
+
+class OptimisticConcurrencyMixin:
+    """Conditional writes for VersionedModel rows, without row locks.
+
+    PUT/PATCH/DELETE sent with If-Match get a 412 when the row is no longer at that version.
+    The write itself is a compare-and-swap on `version`, so an edit that lands between the
+    check and the UPDATE (or DELETE) also ends in a 412 rather than being overwritten or
+    removed. Successful updates return the same ETag a GET of the row would (ConditionalGetMixin).
+    """
+
+    def get_object(self):
+        instance = super().get_object()
+        if self.request.method in ('PUT', 'PATCH', 'DELETE'):
+            expected = if_match_version(self.request)
+            if expected is not None and expected != instance.version:
+                raise PreconditionFailed()
+        return instance
+
+    def perform_update(self, serializer):
+        try:
+            super().perform_update(serializer)
+        except VersionConflict:
+            raise PreconditionFailed()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # the delete collects rows before removing them, so hold the row at the version read
+            current = type(instance).objects.select_for_update().filter(pk=instance.pk, version=instance.version)
+            deleted, _ = current.delete() if current.exists() else (0, {})
+        if not deleted:
+            raise PreconditionFailed()
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and 'version' in response.data:
+            response['ETag'], _ = self._compute_validators(request, detail=True)
+        return response
+
+
+class CachedListMixin:
+    """Cache list responses for `list_cache_timeout` seconds through the stampede-safe helper.
+
+    Sits outside ConditionalGetMixin so the cached entry carries the ETag/Last-Modified that
+    describe its body.
+    """
+    list_cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        if not self.list_cache_timeout:
+            return super().list(request, *args, **kwargs)
+
+        def compute():
+            response = super(CachedListMixin, self).list(request, *args, **kwargs)
+            headers = {name: response[name] for name in ('ETag', 'Last-Modified') if response.has_header(name)}
+            return {'data': response.data, 'headers': headers}
+
+        key = f"list:{type(self).__name__}:{request.accepted_media_type}:{request.build_absolute_uri()}"
+        entry = cache_utils.get_or_compute(key, compute, ttl=self.list_cache_timeout)
+        response = Response(entry['data'], headers=entry['headers'])
+        # lets CompressionMiddleware cache the compressed body next to the page
+        response.compression_cache_key = key
+        response.compression_cache_timeout = self.list_cache_timeout
+        return response
+
+
+class ArchiveChain:
+    """Hot and archived rows in one list order, sliceable like a queryset for the paginator.
+
+    Archiving moves closed periods, but invoiced sales stay behind, so the two tables can
+    interleave. Hot rows that sort ahead of the newest archived row are paged straight from the
+    hot table; the rest (the stragglers) are merged with the archive. Both tables get the pk as
+    a tie-breaker so the merged order is total.
+    """
+    ordered = True
+
+    def __init__(self, hot, archived):
+        field = archived.query.order_by[0]
+        self.name = field.lstrip('-')
+        self.descending = field.startswith('-')
+        tie_breaker = '-pk' if self.descending else 'pk'
+        self.hot = hot.order_by(field, tie_breaker)
+        self.archived = archived.order_by(field, tie_breaker)
+        self._layout = None
+
+    def _key(self, row):
+        return getattr(row, self.name), row.pk
+
+    def _ahead_of(self, row):
+        """Condition matching the rows listed before `row`."""
+        lookup = 'gt' if self.descending else 'lt'
+        value = getattr(row, self.name)
+        return Q(**{f'{self.name}__{lookup}': value}) | Q(**{self.name: value, f'pk__{lookup}': row.pk})
+
+    def _hot_layout(self):
+        """(hot rows listed before every archived row, hot rows left to merge with the archive)."""
+        if self._layout is None:
+            total = self.hot.count()
+            newest = self.archived.first()
+            leading = total if newest is None else self.hot.filter(self._ahead_of(newest)).count()
+            self._layout = (leading, total - leading)
+        return self._layout
+
+    def _merge(self, hot, archived):
+        return heapq.merge(hot, archived, key=self._key, reverse=self.descending)
+
+    def _merged_slice(self, start, stop):
+        """Rows [start, stop) of the stragglers merged with the archive."""
+        leading, stragglers = self._hot_layout()
+        # at most `stragglers` hot rows come before position `start`, so at least this many
+        # archived rows do: skip them, with the hot rows listed before the last one skipped
+        archived_skipped = max(start - stragglers, 0)
+        hot_skipped = leading
+        if archived_skipped:
+            last_skipped = self.archived[archived_skipped - 1]
+            hot_skipped = self.hot.filter(self._ahead_of(last_skipped)).count()
+        offset = start - archived_skipped - (hot_skipped - leading)
+        if stop is None:
+            rows = self._merge(self.hot[hot_skipped:], self.archived[archived_skipped:])
+            return list(itertools.islice(rows, offset, None))
+        fetch = offset + stop - start
+        rows = self._merge(self.hot[hot_skipped:hot_skipped + fetch], self.archived[archived_skipped:archived_skipped + fetch])
+        return list(itertools.islice(rows, offset, fetch))
+
+    def count(self):
+        return sum(self._hot_layout()) + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return self._merge(self.hot, self.archived)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            rows = self[index:index + 1]
+            if not rows:
+                raise IndexError(index)
+            return rows[0]
+        start, stop = index.start or 0, index.stop
+        leading, _ = self._hot_layout()
+        rows = list(self.hot[start:leading if stop is None else min(stop, leading)]) if start < leading else []
+        if stop is None or stop > leading:
+            rows += self._merged_slice(max(start - leading, 0), None if stop is None else stop - leading)
+        return rows
+
+
+class ArchiveReadMixin:
+    """Read rows moved out by `manage.py archive_records` through the same endpoints.
+
+    `list` pages through hot rows and `archive_queryset` merged in list order (ArchiveChain);
+    `retrieve` falls back to the archive. Archived periods are closed, so writes only ever see the hot table.
+    """
+    archive_queryset = None
+
+    def get_archive_queryset(self):
+        return self.archive_queryset.all()
+
+    def list(self, request, *args, **kwargs):
+        queryset = ArchiveChain(self.filter_queryset(self.get_queryset()), self.get_archive_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.request.method not in permissions.SAFE_METHODS:
+                raise
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = self.get_archive_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).first()
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class DeferredFieldsMixin:
+    """Leave large text columns out of list pages unless the client asks for them.
+
+    `?expand=symptoms,diagnosis` (or `?expand=all`) brings named `deferred_fields` back; the
+    multi-get behaves like a list page, retrieve and writes always carry every field. Omitted
+    fields are deferred in SQL too, so they are never read from the table.
+    """
+    deferred_fields = ()
+
+    def get_omitted_fields(self):
+        if self.action not in ('list', 'batch') or not self.deferred_fields:
+            return []
+        expand = {name.strip() for name in self.request.query_params.get('expand', '').split(',')}
+        if 'all' in expand:
+            return []
+        return [name for name in self.deferred_fields if name not in expand]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        omitted = self.get_omitted_fields()
+        return queryset.defer(*omitted) if omitted else queryset
+
+    def get_archive_queryset(self):
+        queryset = super().get_archive_queryset()
+        omitted = self.get_omitted_fields()
+        return queryset.defer(*omitted) if omitted else queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        omitted = self.get_omitted_fields()
+        if omitted:
+            fields = serializer.child.fields if kwargs.get('many') else serializer.fields
+            for name in omitted:
+                fields.pop(name, None)
+        return serializer
+
+
+class AuditMixin:
+    """Record who viewed or changed these records in the audit trail (hms.audit).
+
+    `audit_patient` is the path from a record to its patient (None: the record is the patient),
+    followed through the response data, or through the instance for deletes. Only 2xx responses
+    are recorded; a 304 hands out nothing the client didn't already have.
+    """
+    audit_patient = None
+    audit_actions = {
+        'list': 'view', 'retrieve': 'view', 'batch': 'view',
+        'create': 'create', 'update': 'update', 'partial_update': 'update', 'merge': 'update',
+        'destroy': 'delete', 'duplicates': 'view',
+    }
+
+    def get_object(self):
+        instance = super().get_object()
+        # taken now: a deleted instance no longer has its pk
+        self._audited_record = (instance.pk, self._audit_patient_id(instance))
+        return instance
+
+    def _audit_patient_id(self, record):
+        return audit.patient_id(record, self.audit_patient)
+
+    def _audit_records(self, response):
+        if self.action == 'destroy':
+            record = getattr(self, '_audited_record', None)
+            return [record] if record is not None else []
+        data = response.data
+        if self.action == 'batch':
+            rows = data['results'].values()
+        elif self.action == 'duplicates':
+            rows = [patient for cluster in data['results'] for patient in cluster['patients']]
+        elif self.action == 'list':
+            rows = data['results'] if isinstance(data, dict) and 'results' in data else data
+        else:
+            rows = [data]
+        return [(row['id'], self._audit_patient_id(row)) for row in rows if isinstance(row, dict) and 'id' in row]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        action = self.audit_actions.get(getattr(self, 'action', None))
+        if action and status.is_success(response.status_code):
+            records = self._audit_records(response)
+            if records:
+                audit.record(request.user, action, self.queryset.model, records, ip_address=request.META.get('REMOTE_ADDR'))
+        return response
+
+
+class MultiGetMixin:
+    """Fetch many records by id in one request and one query.
+
+    `GET <list>/batch/?ids=1,2,3` or `POST <list>/batch/` with `{"ids": [1, 2, 3]}` runs a single
+    `WHERE id IN (...)` over the view's own queryset (select_related, filters and deferred
+    fields included; ids missing from the hot table are looked up in the archive once) and
+    returns `{"results": {id: record}, "missing": [ids]}`. Repeated ids are fetched once.
+    """
+
+    @action(detail=False, methods=['get', 'post'])
+    def batch(self, request):
+        raw = request.data.get('ids', []) if request.method == 'POST' else request.query_params.get('ids', '')
+        values = raw.split(',') if isinstance(raw, str) else raw
+        try:
+            ids = list(dict.fromkeys(int(value) for value in values if str(value).strip()))
+        except (TypeError, ValueError):
+            return Response({'ids': 'Must be a list of integer ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MULTI_GET_MAX_IDS:
+            return Response({'ids': f'At most {MULTI_GET_MAX_IDS} ids per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = {obj.pk: obj for obj in self.get_queryset().order_by().filter(pk__in=ids)} if ids else {}
+        missing = [pk for pk in ids if pk not in found]
+        if missing and getattr(self, 'archive_queryset', None) is not None:
+            found.update((obj.pk, obj) for obj in self.get_archive_queryset().order_by().filter(pk__in=missing))
+            missing = [pk for pk in ids if pk not in found]
+        rows = [found[pk] for pk in ids if pk in found]
+        data = self.get_serializer(rows, many=True).data
+        return Response({'results': {obj.pk: item for obj, item in zip(rows, data)}, 'missing': missing})
+
+
+class UserViewSet(ReplicaReadMixin, CachedListMixin, ConditionalGetMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    list_cache_timeout = 30
     # select only necessary fields and order by most recent
     queryset = User.objects.all().order_by('-id')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class PatientViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminRole])
+    def onboard(self, request):
+        """Create many staff accounts at once.
+
+        Body: {"users": [{"email", "name", "role", "password"?, "specialization"?, "phone"?,
+        "address"?}, ...]}. All or nothing: any invalid row fails the whole request with the
+        errors listed per row. Rows without a password get a temporary one, returned only here.
+        """
+        rows = request.data.get('users')
+        if not isinstance(rows, list) or not rows:
+            return Response({'users': 'Must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > ONBOARDING_MAX_USERS:
+            return Response({'users': f'At most {ONBOARDING_MAX_USERS} accounts per request.'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = StaffOnboardingSerializer(data=rows, many=True)
+        if not serializer.is_valid():
+            return Response({'users': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        emails = [User.objects.normalize_email(row['email']) for row in serializer.validated_data]
+        errors = self._email_errors(emails)
+        if any(errors):
+            return Response({'users': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            created = onboarding.onboard_staff(serializer.validated_data)
+        except IntegrityError:
+            # an email was registered while this request ran, or the usernames kept colliding
+            errors = self._email_errors(emails)
+            if any(errors):
+                return Response({'users': errors}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'users': 'Could not allocate usernames for these accounts; try again.'}, status=status.HTTP_400_BAD_REQUEST)
+        results = []
+        for user, token, temporary_password in created:
+            row = {'id': user.pk, 'email': user.email, 'username': user.username, 'role': user.role, 'token': token}
+            if temporary_password:
+                row['temporary_password'] = temporary_password
+            results.append(row)
+        return Response({'created': results}, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def _email_errors(emails):
+        """Per-row email errors for an onboarding batch, checked with one query."""
+        existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        seen, errors = set(), []
+        for email in emails:
+            if email in existing:
+                errors.append({'email': ['A user with this email already exists.']})
+            elif email in seen:
+                errors.append({'email': ['Listed more than once in this request.']})
+            else:
+                errors.append({})
+            seen.add(email)
+        return errors
+
+class PatientViewSet(ReplicaReadMixin, ConditionalGetMixin, OptimisticConcurrencyMixin, DeferredFieldsMixin, AuditMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all().order_by('-created_at')
+    deferred_fields = ('medical_history',)
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        # same person registered again under another phone format or email: warn, don't block
+        data = response.data
+        matches = Patient.possible_duplicates(
+            data['first_name'], data['last_name'], data['phone'], data['date_of_birth'], exclude=data['id'],
+        )
+        response.data['possible_duplicates'] = PatientSummarySerializer(matches, many=True).data
+        return response
+
     @action(detail=False, methods=['get'])
     def count(self, request):
         count=Patient.objects.count()
         return Response({"patient_count": count})
 
-class MedicineViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request):
+        """Clusters of likely duplicate patients. Query params: min_score (0-1, default 0.6)."""
+        try:
+            min_score = float(request.query_params.get('min_score', matching.DUPLICATE_MIN_SCORE))
+        except ValueError:
+            return Response({'min_score': 'Must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+        clusters = Patient.duplicate_clusters(min_score=min_score)
+        results = [
+            {
+                'score': cluster['score'],
+                'matched_on': cluster['matched_on'],
+                'patients': PatientSummarySerializer(cluster['patients'], many=True).data,
+            }
+            for cluster in clusters
+        ]
+        return Response({'count': len(results), 'results': results})
+
+    @action(detail=True, methods=['post'])
+    def merge(self, request, pk=None):
+        """Merge the patient given as `duplicate` into this one."""
+        patient = self.get_object()
+        duplicate_id = str(request.data.get('duplicate', ''))
+        duplicate = Patient.objects.filter(pk=duplicate_id).first() if duplicate_id.isdigit() else None
+        if duplicate is None:
+            return Response({'duplicate': 'Unknown patient.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            patient.merge(duplicate)
+        except DjangoValidationError as e:
+            return Response(e.message_dict if hasattr(e, 'message_dict') else {'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except VersionConflict:
+            raise PreconditionFailed()
+        return Response(self.get_serializer(patient).data)
+
+class MedicineViewSet(ReplicaReadMixin, ConditionalGetMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
     # index/ordering and select_related not required for simple model, keep ordering and add short cache
     queryset = Medicine.objects.all().order_by('-created_at')
     serializer_class = MedicineSerializer
@@ -53,40 +681,96 @@ class MedicineViewSet(viewsets.ModelViewSet):
         count = Medicine.objects.count()
         return Response({"medicine_count": count})
 
-@method_decorator(cache_page(30), name='list')
-class DiagnosisViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def expiring_soon(self, request):
+        """Batches with stock left that expire within `days` (default 30), soonest first."""
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'days': 'Must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= days <= EXPIRING_MAX_DAYS:
+            return Response({'days': f'Must be between 0 and {EXPIRING_MAX_DAYS}.'}, status=status.HTTP_400_BAD_REQUEST)
+        today = timezone.now().date()
+        batches = MedicineBatch.objects.filter(
+            expiry_date__gte=today,
+            expiry_date__lte=today + timedelta(days=days),
+            quantity__gt=0,
+        ).select_related('medicine').order_by('expiry_date', 'id')
+        serializer = MedicineBatchSerializer(batches, many=True)
+        return Response(serializer.data)
+
+
+
+class MedicineBatchViewSet(ReplicaReadMixin, ConditionalGetMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    queryset = MedicineBatch.objects.all().select_related('medicine').order_by('expiry_date', 'id')
+    etag_related_models = (Medicine,)
+    serializer_class = MedicineBatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict if hasattr(e, 'message_dict') else {'detail': str(e)})
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict if hasattr(e, 'message_dict') else {'detail': str(e)})
+
+class DiagnosisViewSet(ReplicaReadMixin, CachedListMixin, ConditionalGetMixin, DeferredFieldsMixin, ArchiveReadMixin, AuditMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    list_cache_timeout = 30
     # optimize by selecting related patient and doctor to avoid per-row queries
     queryset = Diagnosis.objects.all().select_related('patient', 'doctor').order_by('-created_at')
+    archive_queryset = DiagnosisArchive.objects.select_related('patient', 'doctor').order_by('-created_at')
+    deferred_fields = ('symptoms', 'treatment_plan', 'diagnosis', 'additional_notes')
+    etag_related_models = (Patient, User)
+    audit_patient = 'patient'
     serializer_class = DiagnosisSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     @action(detail=False, methods=['get'])
     def count(self, request):
-        count = Diagnosis.objects.count()
+        count = Diagnosis.objects.count() + DiagnosisArchive.objects.count()
         return Response({"diagnosis_count": count})
 
-@method_decorator(cache_page(30), name='list')
-class LabOrderViewSet(viewsets.ModelViewSet):
+class LabOrderViewSet(ReplicaReadMixin, CachedListMixin, ConditionalGetMixin, OptimisticConcurrencyMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    list_cache_timeout = 30
     queryset = LabOders.objects.all().select_related('patient', 'doctor').order_by('-created_at')
+    etag_related_models = (Patient, User)
     serializer_class = LabOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-@method_decorator(cache_page(30), name='list')
-class LabResultViewSet(viewsets.ModelViewSet):
+class LabResultViewSet(ReplicaReadMixin, CachedListMixin, ConditionalGetMixin, DeferredFieldsMixin, ArchiveReadMixin, AuditMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    list_cache_timeout = 30
     """ViewSet for lab results. Returns nested lab_order data (including its patient/doctor) to reduce queries."""
     queryset = LabResults.objects.all().select_related(
         'lab_order',
         'lab_order__patient',
         'lab_order__doctor',
     ).order_by('-created_at')
+    archive_queryset = LabResultsArchive.objects.select_related(
+        'lab_order',
+        'lab_order__patient',
+        'lab_order__doctor',
+    ).order_by('-created_at')
+    deferred_fields = ('result',)
+    etag_related_models = (LabOders, Patient, User)
+    audit_patient = 'lab_order.patient'
     serializer_class = LabResultSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-@method_decorator(cache_page(30), name='list')
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(ReplicaReadMixin, CachedListMixin, ConditionalGetMixin, ArchiveReadMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    list_cache_timeout = 30
     # optimize queries by selecting related medicine
     # order by date desc and select related medicine for table views
     queryset = Sale.objects.all().select_related('medicine').order_by('-date')
+    archive_queryset = SaleArchive.objects.select_related('medicine').order_by('-date')
+    etag_related_models = (Medicine,)
     serializer_class = SaleSerializer
     # permission_classes = [permissions.IsAuthenticated]
 
@@ -130,6 +814,36 @@ class SaleViewSet(viewsets.ModelViewSet):
         total = Sale.total_revenue(start_date=start, end_date=end)
         return Response({"total_revenue": float(total), "currency": "$"})
 
+    @action(detail=False, methods=['get'], url_path='analytics')
+    def analytics(self, request):
+        """Revenue grouped by day/week/month/medicine/category, computed in SQL.
+
+        Query params: group_by (default day), start_date, end_date (YYYY-MM-DD), top (limit buckets)
+        """
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in Sale.BREAKDOWN_GROUPINGS:
+            return Response({'group_by': f"Must be one of: {', '.join(Sale.BREAKDOWN_GROUPINGS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        start = request.query_params.get('start_date')
+        end = request.query_params.get('end_date')
+        try:
+            # parse_date returns None for a malformed string and raises for an impossible date
+            start_date = parse_date(start) if start else None
+            end_date = parse_date(end) if end else None
+        except ValueError:
+            start_date = end_date = None
+        if (start and start_date is None) or (end and end_date is None):
+            return Response({'detail': 'Dates must be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        top = request.query_params.get('top')
+        try:
+            limit = int(top) if top else None
+        except ValueError:
+            return Response({'top': 'Must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and limit < 1:
+            return Response({'top': 'Must be at least 1.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = sales_analytics_payload(group_by, start_date, end_date, limit)
+        return Response(payload)
+
     @action(detail=False, methods=['get'], url_path='today_sales')
     def today_sales(self, request):
         today = timezone.now().date()
@@ -144,17 +858,401 @@ class SaleViewSet(viewsets.ModelViewSet):
         })
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ReplicaReadMixin, ConditionalGetMixin, OptimisticConcurrencyMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
     """Basic Appointment viewset to manage appointments.
 
     Keeps behavior minimal and consistent with other viewsets.
     """
     # order by date/time 
     queryset = Appointments.objects.all().select_related('patient', 'doctor').order_by('-date', '-time')
+    etag_related_models = (Patient, User)
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
+class DoctorScheduleViewSet(ReplicaReadMixin, ConditionalGetMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    queryset = DoctorSchedule.objects.all().select_related('doctor').order_by('doctor', 'weekday', 'start_time')
+    etag_related_models = (User,)
+    serializer_class = DoctorScheduleSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        doctor = id_query_param(self.request, 'doctor')
+        if doctor is not None:
+            qs = qs.filter(doctor_id=doctor)
+        return qs
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict if hasattr(e, 'message_dict') else {'detail': str(e)})
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
+
+class DoctorAvailabilityView(ReplicaReadMixin, APIView):
+    """Free appointment slots from doctors' schedules minus their booked appointments.
+
+    GET /api/doctors/<id>/availability/?from=YYYY-MM-DD&to=YYYY-MM-DD for one doctor, or
+    GET /api/doctors/availability/?doctor=1,2,3 for several (all doctors with a schedule when
+    omitted). The range defaults to a week from today and is inclusive.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk=None):
+        first_param, last_param = request.query_params.get('from'), request.query_params.get('to')
+        first_day = parse_date(first_param) if first_param else timezone.localdate()
+        if first_day is None:
+            return Response({'from': 'Must be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        last_day = parse_date(last_param) if last_param else first_day + timedelta(days=AVAILABILITY_DEFAULT_DAYS - 1)
+        if last_day is None:
+            return Response({'to': 'Must be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        if last_day < first_day:
+            return Response({'to': 'Must not be before from.'}, status=status.HTTP_400_BAD_REQUEST)
+        if (last_day - first_day).days >= AVAILABILITY_MAX_DAYS:
+            return Response({'to': f'At most {AVAILABILITY_MAX_DAYS} days at a time.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        doctors = User.objects.filter(role='doctor')
+        if pk is not None:
+            doctors = doctors.filter(pk=pk)
+        elif request.query_params.get('doctor'):
+            try:
+                ids = [int(value) for value in request.query_params['doctor'].split(',') if value]
+            except ValueError:
+                return Response({'doctor': 'Must be a comma-separated list of ids.'}, status=status.HTTP_400_BAD_REQUEST)
+            doctors = doctors.filter(pk__in=ids)
+        else:
+            doctors = doctors.filter(schedules__isnull=False).distinct()
+        doctors = dict(doctors.order_by('name', 'id').values_list('id', 'name'))
+        if pk is not None and not doctors:
+            raise Http404
+
+        slots = DoctorSchedule.free_slots(list(doctors), first_day, last_day)
+        results = [
+            {
+                'doctor': doctor_id,
+                'doctor_name': name,
+                'days': [
+                    {
+                        'date': day,
+                        'slots': [
+                            {'start': start.time().isoformat('minutes'), 'end': end.time().isoformat('minutes')}
+                            for start, end in free
+                        ],
+                    }
+                    for day, free in slots[doctor_id]
+                ],
+            }
+            for doctor_id, name in doctors.items()
+        ]
+        if pk is not None:
+            return Response({'from': first_day, 'to': last_day, **results[0]})
+        return Response({'from': first_day, 'to': last_day, 'results': results})
+
+
+class AuditEventViewSet(viewsets.ReadOnlyModelViewSet):
+    """The audit trail, newest first. Filters: patient, user, model (e.g. hms.diagnosis), action,
+    since and until (ISO datetimes). patient and user are served by their (…, occurred_at) indexes.
+    """
+    queryset = AuditEvent.objects.all().select_related('user').order_by('-occurred_at', '-id')
+    serializer_class = AuditEventSerializer
+    permission_classes = [IsAdminRole]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        params = self.request.query_params
+        for param, lookup in (('patient', 'patient_id'), ('user', 'user_id')):
+            value = id_query_param(self.request, param)
+            if value is not None:
+                qs = qs.filter(**{lookup: value})
+        for param, lookup in (('model', 'model'), ('action', 'action')):
+            if params.get(param):
+                qs = qs.filter(**{lookup: params[param]})
+        for param, lookup in (('since', 'occurred_at__gte'), ('until', 'occurred_at__lt')):
+            if params.get(param):
+                moment = parse_datetime(params[param])
+                if moment is None:
+                    raise DRFValidationError({param: 'Must be an ISO 8601 datetime.'})
+                qs = qs.filter(**{lookup: moment})
+        return qs
+
+
+class ProfileListView(APIView):
+    """Recent request profiles (hms.profiling), newest first, with their timing and SQL totals."""
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        return Response({'enabled': settings.HMS_PROFILING_ENABLED, 'results': profiling.recent()})
+
+
+class ProfileDetailView(APIView):
+    """One profile: the SQL breakdown and folded stacks (or cProfile's top functions).
+
+    GET /api/profiles/<id>/folded/ returns just the folded stacks as text, for flamegraph.pl or
+    speedscope.
+    """
+    permission_classes = [IsAdminRole]
+
+    def get(self, request, profile_id, folded=False):
+        profile = profiling.load(profile_id)
+        if profile is None:
+            return Response({'detail': 'Unknown or expired profile.'}, status=status.HTTP_404_NOT_FOUND)
+        if folded:
+            if 'folded' not in profile:
+                return Response({'detail': 'This profile was taken with cProfile and has no stacks.'}, status=status.HTTP_404_NOT_FOUND)
+            return HttpResponse(profile['folded'], content_type='text/plain; charset=utf-8')
+        return Response(profile)
+
+
+class ProfilingSettingsView(APIView):
+    """The sampling rule: profile `sample_rate` (0 to 1) of the requests under `path_prefix`
+    until `until` (ISO datetime, optional). PUT with sample_rate 0 turns sampling off.
+    """
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        return Response({'enabled': settings.HMS_PROFILING_ENABLED, 'rule': profiling.get_rule()})
+
+    def put(self, request):
+        try:
+            sample_rate = float(request.data.get('sample_rate', 0))
+        except (TypeError, ValueError):
+            sample_rate = -1
+        if not 0 <= sample_rate <= 1:
+            return Response({'sample_rate': 'Must be a number from 0 to 1.'}, status=status.HTTP_400_BAD_REQUEST)
+        until = request.data.get('until')
+        if until:
+            until = parse_datetime(until)
+            if until is None:
+                return Response({'until': 'Must be an ISO 8601 datetime.'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(until):
+                until = timezone.make_aware(until)
+        rule = profiling.set_rule(sample_rate, request.data.get('path_prefix') or '', until or None)
+        return Response({'enabled': settings.HMS_PROFILING_ENABLED, 'rule': rule})
+
+
+class InvoiceViewSet(ReplicaReadMixin, ConditionalGetMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    queryset = Invoice.objects.all().select_related('patient', 'doctor').order_by('-created_at')
+    serializer_class = InvoiceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # ?status=not_paid etc. is served by the (status, created_at) index
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            qs = qs.filter(status=status_filter)
+        patient = id_query_param(self.request, 'patient')
+        if patient is not None:
+            qs = qs.filter(patient_id=patient)
+        return qs
+
+    @action(detail=False, methods=['get'])
+    def outstanding(self, request):
+        """Outstanding totals per patient or doctor.
+
+        Query params: by (patient|doctor, default patient), as_of (YYYY-MM-DD, a past day)
+        """
+        group_by = request.query_params.get('by', 'patient')
+        if group_by not in Invoice.OUTSTANDING_GROUPINGS:
+            return Response({'by': 'Must be patient or doctor.'}, status=status.HTTP_400_BAD_REQUEST)
+        as_of_param = request.query_params.get('as_of')
+        try:
+            as_of = parse_date(as_of_param) if as_of_param else None
+        except ValueError:
+            as_of = None
+        if as_of_param and as_of is None:
+            return Response({'as_of': 'Must be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        # only days that have ended are cacheable; today's figures are computed live
+        if as_of is not None and as_of >= timezone.now().date():
+            as_of = None
+
+        def compute():
+            rows = Invoice.outstanding_by(group_by=group_by, as_of=as_of)
+            for row in rows:
+                row['outstanding'] = float(row['outstanding'] or 0)
+            return {
+                'by': group_by,
+                'as_of': as_of or timezone.now().date(),
+                'results': rows,
+                'total_outstanding': round(sum(row['outstanding'] for row in rows), 2),
+                'currency': '$',
+            }
+
+        if as_of:
+            ledger = cache_utils.generation(Invoice.LEDGER_GENERATION)
+            key = f"invoices-outstanding:{ledger}:{group_by}:{as_of}"
+            payload = cache_utils.get_or_compute(key, compute, ttl=OUTSTANDING_CLOSED_TIMEOUT)
+        else:
+            payload = compute()
+        return Response(payload)
+
+
+class PaymentViewSet(ReplicaReadMixin, ConditionalGetMixin, MultiGetMixin, NativeTypesMixin, viewsets.ModelViewSet):
+    queryset = Payment.objects.all().select_related('invoice').order_by('-created_at')
+    serializer_class = PaymentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except DjangoValidationError as e:
+            raise DRFValidationError(e.message_dict if hasattr(e, 'message_dict') else {'detail': str(e)})
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
+
+class ExportView(APIView):
+    """Columnar export of one table for warehouse loads (hms.exports).
+
+    GET /api/exports/<name>/?since=<watermark>&limit=<rows>&file_format=parquet|arrow returns one
+    Parquet (default) or Arrow IPC file of the rows after `since` in closed periods, with the
+    watermark to pass next time in X-Export-Watermark. 204 means nothing new yet.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    content_types = {'parquet': 'application/vnd.apache.parquet', 'arrow': 'application/vnd.apache.arrow.file'}
+    # exports of clinical records go to the audit trail, one event per row: the column leading to
+    # the patient, and the model it points at when that isn't the patient itself
+    audited = {'diagnoses': ('patient_id', None), 'lab-results': ('lab_order_id', LabOders)}
+
+    def audit(self, request, name, batches):
+        model, _ = exports.EXPORTS[name]
+        column, via = self.audited[name]
+        records = []
+        for batch in batches:
+            records.extend(zip(batch.column('id').to_pylist(), batch.column(column).to_pylist()))
+        if via is not None:
+            patients = dict(via.objects.filter(pk__in={ref for _, ref in records}).values_list('pk', 'patient_id'))
+            records = [(pk, patients.get(ref)) for pk, ref in records]
+        audit.record(request.user, 'view', model, records, ip_address=request.META.get('REMOTE_ADDR'))
+
+    def get(self, request, name):
+        if name not in exports.EXPORTS:
+            return Response({'detail': f"Unknown export. Choose from: {', '.join(exports.EXPORTS)}."}, status=status.HTTP_404_NOT_FOUND)
+        fmt = request.query_params.get('file_format', 'parquet')
+        if fmt not in exports.FORMATS:
+            return Response({'file_format': 'Must be parquet or arrow.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = exports.parse_watermark(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', EXPORT_PAGE_ROWS))
+        except ValueError:
+            return Response({'limit': 'Must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        # 0 would mean "no limit" further down; every file is at least one row and at most the cap
+        limit = min(max(limit, 1), EXPORT_MAX_PAGE_ROWS)
+        batches = []
+        try:
+            body, rows, watermark = exports.export_to_bytes(
+                name, fmt=fmt, watermark=since, limit=limit,
+                on_batch=batches.append if name in self.audited else None,
+            )
+        except ImportError:
+            return Response({'detail': 'Columnar exports are not available (pyarrow is not installed).'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        if batches:
+            self.audit(request, name, batches)
+
+        response = HttpResponse(body, content_type=self.content_types[fmt]) if rows else HttpResponse(status=status.HTTP_204_NO_CONTENT)
+        response['X-Export-Watermark'] = exports.format_watermark(watermark)
+        response['X-Export-Rows'] = str(rows)
+        if rows:
+            response['Content-Disposition'] = f'attachment; filename="{name}{exports.FORMATS[fmt]}"'
+        return response
+
+
+class SyncView(APIView):
+    """Changes since a cursor across the clinical tables, for offline-capable clients.
+
+    GET /api/sync/?since=<cursor>&limit=<n> returns, per resource, the records created or
+    updated and the ids deleted since `cursor`, plus the next cursor and whether more remain.
+    Start from since=0 for a full download.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    resources = {
+        'hms.patient': ('patients', Patient.objects.all(), PatientSerializer),
+        'hms.appointments': ('appointments', Appointments.objects.select_related('patient', 'doctor'), AppointmentSerializer),
+        'hms.diagnosis': ('diagnoses', Diagnosis.objects.select_related('patient', 'doctor'), DiagnosisSerializer),
+        'hms.laboders': ('lab_orders', LabOders.objects.select_related('patient', 'doctor'), LabOrderSerializer),
+        'hms.labresults': ('lab_results', LabResults.objects.select_related('lab_order', 'lab_order__patient', 'lab_order__doctor'), LabResultSerializer),
+        'hms.medicine': ('medicines', Medicine.objects.all(), MedicineSerializer),
+        'hms.sale': ('sales', Sale.objects.select_related('medicine'), SaleSerializer),
+    }
+    # resources written to the audit trail, with the path from a record to its patient
+    audited = {'hms.patient': None, 'hms.diagnosis': 'patient', 'hms.labresults': 'lab_order.patient'}
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', SYNC_PAGE_SIZE)), SYNC_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # number what has committed since the last call; cursors follow commit order, not ids
+        ChangeLog.assign_sequence()
+        entries = list(ChangeLog.objects.filter(seq__gt=since).order_by('seq')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        by_model = {}
+        for entry in entries:
+            by_model.setdefault(entry.model, []).append(entry)
+
+        changes = {}
+        for label, model_entries in by_model.items():
+            if label not in self.resources:
+                continue
+            key, queryset, serializer_class = self.resources[label]
+            live_ids = [e.object_id for e in model_entries if e.action != 'deleted']
+            objects = queryset.in_bulk(live_ids) if live_ids else {}
+            bucket = {'created': [], 'updated': [], 'deleted': []}
+            for entry in model_entries:
+                if entry.action == 'deleted':
+                    bucket['deleted'].append(entry.object_id)
+                elif entry.object_id in objects:
+                    bucket[entry.action_since(since)].append(objects[entry.object_id])
+            if label in self.audited:
+                records = [(obj.pk, audit.patient_id(obj, self.audited[label])) for obj in bucket['created'] + bucket['updated']]
+                if records:
+                    audit.record(request.user, 'view', queryset.model, records, ip_address=request.META.get('REMOTE_ADDR'))
+            bucket['created'] = serializer_class(bucket['created'], many=True).data
+            bucket['updated'] = serializer_class(bucket['updated'], many=True).data
+            changes[key] = bucket
+
+        return Response({
+            'cursor': entries[-1].seq if entries else since,
+            'has_more': has_more,
+            'changes': changes,
+        })
+
+
+class DashboardView(APIView):
+    """All dashboard figures in one response, served straight from the stored snapshot.
+
+    The snapshot is rebuilt in the background (see hms.dashboard). A request computes it only
+    when there is none yet, or when it's past SNAPSHOT_MAX_AGE_SECONDS; then one request
+    rebuilds it while the others keep serving the old one.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        snapshot = dashboard.get_snapshot()
+        if snapshot is None or (dashboard.is_stale(snapshot) and dashboard.claim_rebuild()):
+            snapshot = dashboard.build_snapshot()
+            tasks.schedule_dashboard_refresh()
+        if snapshot['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(snapshot['body'], content_type='application/json')
+        response['ETag'] = snapshot['etag']
+        return response
+
+
 class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
@@ -198,4 +1296,60 @@ def get_user_count(request):
     return Response({"user_count": count})
 
 
-# Note: revenue endpoints implemented as actions on SaleViewSet (routes registered in urls.py)
\ No newline at end of file
+# Note: revenue endpoints implemented as actions on SaleViewSet (routes registered in urls.py)
+
+
+async def _stream_user(request):
+    """Resolve the token from `Authorization: Token <key>`.
+
+    Deliberately not from the query string: URLs end up in access logs and in stored profiles.
+    Clients read the stream with fetch() rather than EventSource so they can send the header.
+    """
+    header = request.headers.get('Authorization', '')
+    key = header.split(' ', 1)[1] if header.startswith('Token ') else None
+    if not key:
+        return None
+    token = await Token.objects.select_related('user').filter(key=key).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+async def event_stream(request):
+    """Server-sent events for lab results, lab order status changes and appointments.
+
+    Query params: channels (comma-separated subset of lab_results, lab_orders, appointments).
+    Needs an ASGI server (see api/asgi.py); each connection is a coroutine, not a worker. Under
+    WSGI an endless stream would pin a worker for good, so the view refuses with 503 instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Event streams need the ASGI server (api.asgi); poll /api/sync/ instead.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+    requested = {c for c in request.GET.get('channels', '').split(',') if c}
+    channels = (requested & events.CHANNELS) or events.CHANNELS
+    broker = events.get_broker()
+    subscription = broker.subscribe(channels)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['channel']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # tell nginx-style proxies not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -7,6 +7,8 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
+    # lets settings tell a management command from a web server (DB_COMMAND_STATEMENT_TIMEOUT_MS)
+    os.environ['HMS_MANAGEMENT_COMMAND'] = sys.argv[1] if len(sys.argv) > 1 else ''
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: